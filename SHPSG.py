@@ -1,6 +1,9 @@
 import numpy as np
 
-def SHPSG(Ei, Fi, D2_8, D9_15):
+def SHPSG(Ei, Fi, D2_8, D9_15, rng=None):
+    # rng: random state with the np.random interface (default: the global np.random)
+    if rng is None:
+        rng = np.random
     Fvec = np.zeros((4,3),dtype=complex)
     # Determine C0 and C1 with Ei, Fi and a unit maximum principal dimension 
     # A sphere with unit diameter  
@@ -36,17 +39,17 @@ def SHPSG(Ei, Fi, D2_8, D9_15):
 
     # Randomly generate P including C1'-C15' with c_n^(-m)=(-1)^m*c_n^m*
     for n in range(1,16):
-        J = np.ones((n+1,3))-2*np.random.rand(n+1,3) # [-1,1]
+        J = np.ones((n+1,3))-2*rng.rand(n+1,3) # [-1,1]
         K = np.flipud(J[0:n,:])
         A = [[(-1)**n,(-1)**n,(-1)**n]]
         B = K*A
         L[n**2:(n+1)**2,:] = np.append(J,B,axis=0)
-        M = np.ones((n,3))-2*np.random.rand(n,3)
+        M = np.ones((n,3))-2*rng.rand(n,3)
         M1 = np.append(M,[[0,0,0]],axis = 0)
         N[n**2:(n+1)**2,:] = np.append(M1,np.flipud((-1)**(n+1)*M),axis = 0)
 
     P = L+N*1j
-    P[0,:] = np.ones((1,3))-2*np.random.rand(1,3)
+    P[0,:] = np.ones((1,3))-2*rng.rand(1,3)
 
     # Calculate d1'-d16' with the SH coeffiecients of P
     Q = np.conj(P)
@@ -63,3 +66,49 @@ def SHPSG(Ei, Fi, D2_8, D9_15):
         fvec[d**2:(d+1)**2,1] = P[d**2:(d+1)**2,1]/R[d,1]*I[d,1]
         fvec[d**2:(d+1)**2,2] = P[d**2:(d+1)**2,2]/R[d,2]*I[d,2]
     return fvec
+
+
+def SHPSG_batch(Ei, Fi, D2_8, D9_15, rng=None):
+    # Vectorized SHPSG for N particles: Ei, Fi, D2_8, D9_15 are arrays of shape (N,)
+    # Returns the (N, 256, 3) coefficient tensor; same construction as SHPSG
+    if rng is None:
+        rng = np.random
+    Ei, Fi, D2_8, D9_15 = [np.atleast_1d(np.asarray(x, dtype=float)) for x in (Ei, Fi, D2_8, D9_15)]
+    num = len(Ei)
+    fvec_sphere = -np.sqrt(np.pi/6)*np.array([[0,0,0],[-1,1j,0],[0,0,np.sqrt(2)],[1,1j,0]])
+    Fvec = np.zeros((num,4,3),dtype=complex)
+    Fvec[:,:,0] = fvec_sphere[:,0]
+    Fvec[:,:,1] = Ei[:,None]*fvec_sphere[:,1]
+    Fvec[:,:,2] = (Fi*Ei)[:,None]*fvec_sphere[:,2]
+    d1 = np.sqrt(np.sum((Fvec*np.conj(Fvec)).real, axis=(1,2)))
+
+    # d2 and d9 (alpha = 1.387, beta = 1.426) and the decay of d3-d8, d10-d15
+    D_2 = D2_8/sum((2/n)**1.387 for n in range(2,9))*d1
+    D_9 = D9_15/sum((9/n)**1.426 for n in range(9,16))*d1
+    I = np.zeros((num,16))
+    I[:,1] = 1
+    I[:,2] = D_2
+    for c in range(3,9):
+        I[:,c] = D_2*((c-1)/2)**(-1.387)/np.sqrt(3)
+    for c in range(9,15):
+        I[:,c] = D_9*((c-1)/9)**(-1.426)/np.sqrt(3)
+
+    # Random P with c_n^(-m)=(-1)^m*c_n^m*
+    L = np.zeros((num,16**2,3))
+    N = np.zeros((num,16**2,3))
+    for n in range(1,16):
+        J = 1-2*rng.rand(num,n+1,3)
+        L[:,n**2:(n+1)**2,:] = np.concatenate((J, J[:,n-1::-1,:]*(-1)**n), axis=1)
+        M = 1-2*rng.rand(num,n,3)
+        N[:,n**2:(n+1)**2,:] = np.concatenate((M, np.zeros((num,1,3)), M[:,::-1,:]*(-1)**(n+1)), axis=1)
+    P = L+N*1j
+    P[:,0,:] = 1-2*rng.rand(num,3)
+
+    # Scale each degree of P to the target descriptors
+    fvec = np.zeros((num,16**2,3),dtype=complex)
+    fvec[:,0:4,:] = Fvec
+    for d in range(2,16):
+        block = P[:,d**2:(d+1)**2,:]
+        R = np.sqrt(np.sum((block*np.conj(block)).real, axis=1))
+        fvec[:,d**2:(d+1)**2,:] = block/R[:,None,:]*I[:,d,None,None]
+    return fvec
@@ -1,31 +1,54 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""Analyze the gradual transition in generated particles"""
+"""Analyze the gradual transition in generated particles
 
-import re
+The trend is read from the realized descriptors, measured on the generated SH
+coefficients (see descriptors.py); the requested parameters are shown next to
+them. Metadata files written before the realized section existed fall back to
+the requested values.
+"""
 
 metadata_file = "./data/competition_particles/metadata.txt"
+NAMES = ('Ei', 'Fi', 'D2_8', 'D9_15')
 
-# Parse the metadata file
+# Parse the metadata file: requested parameters per particle, then the realized section
 particles = []
+realized = {}
 with open(metadata_file, 'r') as f:
     lines = f.readlines()
-    in_data_section = False
+    section = None
     for line in lines:
         if "Individual Particle Data" in line:
-            in_data_section = True
+            section = 'requested'
             continue
-        if in_data_section and line.strip().startswith("UNK"):
-            parts = line.split()
-            if len(parts) >= 7:
-                particles.append({
-                    'filename': parts[1],
-                    'D_eq': float(parts[2]),
-                    'Ei': float(parts[3]),
-                    'Fi': float(parts[4]),
-                    'D2_8': float(parts[5]),
-                    'D9_15': float(parts[6])
-                })
+        if "Realized Descriptors" in line:
+            section = 'realized'
+            continue
+        if line.strip().endswith(':') and not line.startswith(' '):
+            section = None
+        parts = line.split()
+        if section == 'requested' and line.strip().startswith("UNK") and len(parts) >= 7:
+            particles.append({
+                'filename': parts[1],
+                'D_eq': float(parts[2]),
+                'requested': dict(zip(NAMES, map(float, parts[3:7])))
+            })
+        elif section == 'realized' and len(parts) == 5 and parts[0] != 'Filename':
+            try:
+                realized[parts[0]] = dict(zip(NAMES, map(float, parts[1:5])))
+            except ValueError:
+                pass
+
+source = 'realized' if realized else 'requested'
+for p in particles:
+    p['realized'] = realized.get(p['filename'], p['requested'])
+if not realized:
+    print("No realized descriptors in {}: showing the requested parameters".format(metadata_file))
+
+
+def average(group, kind, name):
+    return sum(p[kind][name] for p in group) / len(group)
+
 
 print("Gradual Morphology Transition Analysis")
 print("=" * 80)
@@ -39,51 +62,36 @@ groups = {
     "Group 4 (40-49)": particles[40:50]
 }
 
-print("\nParameter Averages by Group:")
+print("\nDescriptor Averages by Group ({} / requested):".format(source))
 print("-" * 80)
-print(f"{'Group':<15} {'Ei (avg)':<12} {'Fi (avg)':<12} {'D2_8 (avg)':<12} {'D9_15 (avg)':<12}")
+print(f"{'Group':<15} {'Ei':<16} {'Fi':<16} {'D2_8':<16} {'D9_15':<16}")
 print("-" * 80)
 
 for group_name, group_particles in groups.items():
     if group_particles:
-        ei_avg = sum(p['Ei'] for p in group_particles) / len(group_particles)
-        fi_avg = sum(p['Fi'] for p in group_particles) / len(group_particles)
-        d2_8_avg = sum(p['D2_8'] for p in group_particles) / len(group_particles)
-        d9_15_avg = sum(p['D9_15'] for p in group_particles) / len(group_particles)
-        print(f"{group_name:<15} {ei_avg:<12.4f} {fi_avg:<12.4f} {d2_8_avg:<12.4f} {d9_15_avg:<12.4f}")
+        print(f"{group_name:<15}" + "".join(
+            " {:<15}".format("{:.4f} / {:.4f}".format(average(group_particles, 'realized', name),
+                                                    average(group_particles, 'requested', name)))
+            for name in NAMES))
 
 print("\n" + "=" * 80)
-print("Visual Representation (normalized 0-1):")
+print("Visual Representation ({}, normalized to the largest group average):".format(source))
 print("-" * 80)
 
 # Create visual bars
-for group_name, group_particles in groups.items():
-    if group_particles:
-        ei_avg = sum(p['Ei'] for p in group_particles) / len(group_particles)
-        fi_avg = sum(p['Fi'] for p in group_particles) / len(group_particles)
-        d2_8_avg = sum(p['D2_8'] for p in group_particles) / len(group_particles)
-        d9_15_avg = sum(p['D9_15'] for p in group_particles) / len(group_particles)
-        
-        # Normalize to 0-1 range
-        ei_norm = max(0, min(1, ei_avg / 1.0))
-        fi_norm = max(0, min(1, fi_avg / 1.0))
-        d2_8_norm = max(0, min(1, d2_8_avg / 0.35))
-        d9_15_norm = max(0, min(1, d9_15_avg / 0.27))
-        
-        bar_width = 30
-        ei_bar = "=" * int(ei_norm * bar_width)
-        fi_bar = "=" * int(fi_norm * bar_width)
-        d2_8_bar = "=" * int(d2_8_norm * bar_width)
-        d9_15_bar = "=" * int(d9_15_norm * bar_width)
-        
-        print(f"\n{group_name}:")
-        print(f"  Ei      [{ei_bar:<30}] {ei_avg:.3f} (should decrease)")
-        print(f"  Fi      [{fi_bar:<30}] {fi_avg:.3f} (should decrease)")
-        print(f"  D2_8    [{d2_8_bar:<30}] {d2_8_avg:.3f} (should increase)")
-        print(f"  D9_15   [{d9_15_bar:<30}] {d9_15_avg:.3f} (should increase)")
+averages = {group_name: {name: average(group_particles, 'realized', name) for name in NAMES}
+            for group_name, group_particles in groups.items() if group_particles}
+largest = {name: max(max(a[name] for a in averages.values()), 1e-12) for name in NAMES}
+trend = {'Ei': 'decrease', 'Fi': 'decrease', 'D2_8': 'increase', 'D9_15': 'increase'}
+for group_name, avg in averages.items():
+    print(f"\n{group_name}:")
+    bar_width = 30
+    for name in NAMES:
+        bar = "=" * int(max(0, min(1, avg[name] / largest[name])) * bar_width)
+        print(f"  {name:<7} [{bar:<30}] {avg[name]:.3f} (should {trend[name]})")
 
 print("\n" + "=" * 80)
-print("Expected Progression:")
+print("Expected Progression (requested parameters):")
 print("  Group 0: Near-spherical (Ei~0.9, Fi~0.9) with smooth surface")
 print("  Group 1: Transition (Ei~0.75, Fi~0.75) with angular features")
 print("  Group 2: Mixed (Ei~0.65, Fi~0.65) with rough surface")
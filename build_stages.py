@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Stage fingerprints for incremental batch regeneration
+
+Generating a particle runs through the stages
+
+    coeff     SH coefficients   <- sampled parameters except D_eq, random stream
+    mesh      unit-shape mesh   <- coeff, base mesh, refine_tol
+    stl       scaled STL        <- mesh, D_eq, scale_mode
+    png       preview image     <- stl, preview settings (plotstl keywords)
+    metadata  particle details  <- stl
+
+Every stage fingerprint hashes its own inputs together with the fingerprint
+of the stage it depends on, so a change invalidates exactly the downstream
+stages. The fingerprints, the particle details and rejected attempts are kept
+in <output_dir>/.build/<particle>.json, the coefficients and unit mesh in
+<particle>.npz next to it. Re-running a batch with incremental=True (see
+particle_generator.generate_particle) redoes only the stages whose
+fingerprint changed.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from json_utils import json_default
+
+STAGES = ('coeff', 'mesh', 'stl', 'png', 'metadata')
+
+BUILD_DIR = '.build'
+
+# bump when the computed particle details change, so stored details are recomputed
+DETAILS_VERSION = 3
+
+
+def fingerprint(*parts):
+    """Stable hash of JSON-serializable parts"""
+    text = json.dumps(parts, sort_keys=True, default=json_default)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def stage_fingerprints(params, stream, mesh_settings, scale_mode, preview, checks=None):
+    """
+    Fingerprints of all stages of one particle attempt.
+
+    Parameters:
+    - params: sampled parameter dict
+    - stream: random stream of the attempt, e.g. (seed, key, attempt)
+    - mesh_settings: dict of the meshing inputs (base mesh size, refine_tol)
+    - scale_mode: STL scaling mode
+    - preview: plotstl keyword settings (None for the defaults)
+    - checks: validity check settings recorded in the details (e.g. max_folded)
+
+    Returns:
+    - dict stage -> fingerprint
+    """
+    fp = {}
+    # D_eq only scales the mesh: it enters at the stl stage
+    shape_params = {name: value for name, value in params.items() if name != 'D_eq'}
+    fp['coeff'] = fingerprint('coeff', shape_params, stream)
+    fp['mesh'] = fingerprint('mesh', fp['coeff'], mesh_settings)
+    fp['stl'] = fingerprint('stl', fp['mesh'], params['D_eq'], scale_mode)
+    fp['png'] = fingerprint('png', fp['stl'], preview or {})
+    fp['metadata'] = fingerprint('metadata', fp['stl'], DETAILS_VERSION, checks or {})
+    return fp
+
+
+def _paths(output_path):
+    """Manifest and array paths of the particle written to output_path"""
+    directory, name = os.path.split(output_path)
+    stem = os.path.join(directory, BUILD_DIR, os.path.splitext(name)[0])
+    return stem + '.json', stem + '.npz'
+
+
+def load_manifest(output_path):
+    """
+    Stage manifest of a particle (empty if none was written).
+
+    Parameters:
+    - output_path: main output file of the particle (its STL path)
+
+    Returns:
+    - dict with 'stages' (stage -> fingerprint), 'details' and 'rejected'
+      (metadata fingerprint -> reason)
+    """
+    path = _paths(output_path)[0]
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'stages': {}, 'details': None, 'rejected': {}}
+
+
+def save_manifest(output_path, manifest):
+    """Write the stage manifest of a particle"""
+    path = _paths(output_path)[0]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, default=json_default)
+
+
+def load_stage_arrays(output_path):
+    """Stored coefficients and unit mesh of a particle ('coeff', 'xyz', 'faces'), or {}"""
+    path = _paths(output_path)[1]
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def save_stage_arrays(output_path, **arrays):
+    """Store the coefficients and unit mesh of a particle"""
+    path = _paths(output_path)[1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **arrays)
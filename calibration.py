@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Calibration of requested versus realized shape descriptors
+
+SHPSG reproduces some inputs exactly and others only on average. Measured on
+the coefficients, Ei and Fi equal the request and D2_8, D9_15 are fixed
+multiples of it (the degree-2 normalisation inflates D2_8). The form of the
+reconstructed surface, however, drifts with the added angularity and
+roughness (an Ei = 1 request comes out near 0.9 at D2_8 = 0.5), and
+coeff_multiplier changes the particle size. A calibration table records, on a
+regular grid of requested (Ei, Fi, D2_8, D9_15), the mean and standard
+deviation of the realized descriptors over a few random particles per node:
+
+    Ei, Fi, D2_8, D9_15
+                  measured on the coefficients (descriptors.shape_descriptors),
+                  the definition of the 'realized' particle metadata
+    Ei_inertia, Fi_inertia
+                  form of the inertia-equivalent ellipsoid of the mesh
+    sphericity    of the mesh
+    size_ratio    volume-equivalent diameter / requested D_eq (scale_mode
+                  'radius', coeff_multiplier 1; it scales linearly with the
+                  multiplier, the other outputs do not depend on it)
+
+Tables are built once and cached as .npz files named after a hash of the
+build settings. requested_for inverts the table: it solves mean(x) = target
+for named outputs (by default CALIBRATION_TARGETS: the inertia form of the
+mesh and the realized D2_8, D9_15) on the multilinear interpolant with a
+batched Gauss-Newton iteration, so a recipe can ask for realized values
+directly (the 'calibrate' key of param_sampler recipes).
+"""
+
+import os
+import hashlib
+import numpy as np
+
+from SHPSG import SHPSG_batch
+from sh_basis import get_basis, sh_reconstruct
+from mass_properties import mass_properties, mesh_triangles
+from descriptors import shape_descriptors
+
+# grid axes (requested values) and realized outputs
+CALIBRATION_INPUTS = ('Ei', 'Fi', 'D2_8', 'D9_15')
+CALIBRATION_OUTPUTS = ('Ei', 'Fi', 'D2_8', 'D9_15', 'Ei_inertia', 'Fi_inertia',
+                       'sphericity', 'size_ratio')
+# outputs that recipes calibrate, matched to the inputs in order: the form of
+# the mesh and the roughness of the coefficients
+CALIBRATION_TARGETS = ('Ei_inertia', 'Fi_inertia', 'D2_8', 'D9_15')
+
+DEFAULT_GRID = {
+    'Ei': np.linspace(0.4, 1.0, 7),
+    'Fi': np.linspace(0.4, 1.0, 7),
+    'D2_8': np.linspace(0.0, 0.5, 6),
+    'D9_15': np.linspace(0.0, 0.25, 5)
+}
+
+# bump when the measured quantities change, so old cache files are not reused
+CALIBRATION_VERSION = 2
+
+# cache of loaded tables by path
+_TABLE_CACHE = {}
+
+
+def measure_realized(coeff, level=2):
+    """
+    Realized descriptors of a batch of particles.
+
+    Parameters:
+    - coeff: (N, L^2, 3) SH coefficients
+    - level: icosphere level of the measured meshes
+
+    Returns:
+    - dict with one (N,) array per name in CALIBRATION_OUTPUTS
+    """
+    base = get_basis(level, int(round(np.sqrt(coeff.shape[1]))))
+    props = mass_properties(mesh_triangles(sh_reconstruct(coeff, base['Y']), base['faces']))
+    # semi-axes of the solid ellipsoid with the same principal moments:
+    # a^2 = 5 (I_b + I_c - I_a) / (2 V), the longest axis has the smallest moment
+    I = props['principal_moments']
+    axes2 = 5.0 * (I.sum(axis=-1)[:, None] - 2.0 * I) / (2.0 * props['volume'][:, None])
+    axes = np.sqrt(np.maximum(axes2, 0.0))
+    coeff_desc = shape_descriptors(coeff)
+    return {
+        'Ei': coeff_desc['Ei'],
+        'Fi': coeff_desc['Fi'],
+        'D2_8': coeff_desc['D2_8'],
+        'D9_15': coeff_desc['D9_15'],
+        'Ei_inertia': axes[:, 1] / axes[:, 0],
+        'Fi_inertia': axes[:, 2] / axes[:, 1],
+        'sphericity': props['sphericity'],
+        # scale_mode 'radius' writes the unit shape times D_eq/2
+        'size_ratio': props['D_eq'] / 2.0
+    }
+
+
+def _table_key(grid, samples, level, seed):
+    """Hash of the build settings, used as the cache file name"""
+    h = hashlib.sha1()
+    h.update(repr((CALIBRATION_VERSION, samples, level, seed)).encode())
+    for name in CALIBRATION_INPUTS:
+        h.update(np.asarray(grid[name], dtype=float).tobytes())
+    return h.hexdigest()[:16]
+
+
+def build_calibration(grid=None, samples=4, level=2, seed=0, chunk=1024, verbose=False):
+    """
+    Measure the realized descriptors on a grid of requested ones.
+
+    Parameters:
+    - grid: dict of increasing axis values per name in CALIBRATION_INPUTS
+      (default DEFAULT_GRID)
+    - samples: random particles per grid node
+    - level: icosphere level of the measured meshes
+    - seed: seed of the particle draws
+    - chunk: particles reconstructed at once
+
+    Returns:
+    - table dict with 'grid' (axes), 'mean' and 'std' (grid shape + (outputs,))
+      and 'outputs' (CALIBRATION_OUTPUTS)
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    axes = [np.asarray(grid[name], dtype=float) for name in CALIBRATION_INPUTS]
+    nodes = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, len(axes))
+    requested = np.repeat(nodes, samples, axis=0)
+    rng = np.random.RandomState(seed)
+    realized = np.empty((len(requested), len(CALIBRATION_OUTPUTS)))
+    for start in range(0, len(requested), chunk):
+        block = requested[start:start + chunk]
+        coeff = SHPSG_batch(block[:, 0], block[:, 1], block[:, 2], block[:, 3], rng=rng)
+        measured = measure_realized(coeff, level)
+        realized[start:start + chunk] = np.column_stack([measured[k] for k in CALIBRATION_OUTPUTS])
+        if verbose:
+            print("calibration: {}/{} particles".format(min(start + chunk, len(requested)),
+                                                        len(requested)))
+    realized = realized.reshape(len(nodes), samples, -1)
+    shape = tuple(len(a) for a in axes) + (len(CALIBRATION_OUTPUTS),)
+    return {
+        'grid': dict(zip(CALIBRATION_INPUTS, axes)),
+        'mean': realized.mean(axis=1).reshape(shape),
+        'std': realized.std(axis=1).reshape(shape),
+        'outputs': CALIBRATION_OUTPUTS
+    }
+
+
+def save_calibration(path, table):
+    """Write a calibration table to an .npz file"""
+    arrays = {'grid_' + name: table['grid'][name] for name in CALIBRATION_INPUTS}
+    np.savez(path, mean=table['mean'], std=table['std'],
+             outputs=np.array(table['outputs']), **arrays)
+
+
+def load_calibration(path):
+    """Read a calibration table written by save_calibration (cached per path)"""
+    if path not in _TABLE_CACHE:
+        with np.load(path) as data:
+            _TABLE_CACHE[path] = {
+                'grid': {name: data['grid_' + name] for name in CALIBRATION_INPUTS},
+                'mean': data['mean'],
+                'std': data['std'],
+                'outputs': tuple(data['outputs'].tolist())
+            }
+    return _TABLE_CACHE[path]
+
+
+def calibration_table(grid=None, samples=4, level=2, seed=0,
+                      cache_dir='./data/calibration', verbose=False):
+    """
+    Calibration table for the given settings, built on first use and cached on disk.
+
+    Parameters:
+    - grid, samples, level, seed: see build_calibration
+    - cache_dir: directory of the cached tables
+
+    Returns:
+    - table dict (see build_calibration); table['path'] is the cache file
+    """
+    if grid is None:
+        grid = DEFAULT_GRID
+    path = os.path.join(cache_dir, "calibration_{}.npz".format(_table_key(grid, samples, level, seed)))
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_calibration(path, build_calibration(grid, samples, level, seed, verbose=verbose))
+    table = load_calibration(path)
+    table['path'] = path
+    return table
+
+
+def predict_realized(table, requested, outputs=None, statistic='mean'):
+    """
+    Interpolate the realized descriptors of requested inputs.
+
+    Parameters:
+    - table: calibration table
+    - requested: (N, 4) requested values in CALIBRATION_INPUTS order
+      (clipped to the grid)
+    - outputs: names of the returned outputs (default all)
+    - statistic: 'mean' or 'std'
+
+    Returns:
+    - (N, len(outputs)) interpolated values
+    """
+    if outputs is None:
+        outputs = table['outputs']
+    columns = [table['outputs'].index(name) for name in outputs]
+    values = table[statistic][..., columns]
+    x = np.atleast_2d(np.asarray(requested, dtype=float))
+    # multilinear interpolation: cell index and weight along every axis
+    index, weight = [], []
+    for j, name in enumerate(CALIBRATION_INPUTS):
+        axis = table['grid'][name]
+        xj = np.clip(x[:, j], axis[0], axis[-1])
+        i = np.clip(np.searchsorted(axis, xj) - 1, 0, len(axis) - 2)
+        index.append(i)
+        weight.append((xj - axis[i]) / (axis[i + 1] - axis[i]))
+    result = np.zeros((len(x), len(columns)))
+    for corner in range(2 ** len(CALIBRATION_INPUTS)):
+        bits = [(corner >> j) & 1 for j in range(len(CALIBRATION_INPUTS))]
+        w = np.ones(len(x))
+        for j, b in enumerate(bits):
+            w = w * (weight[j] if b else 1.0 - weight[j])
+        result += w[:, None] * values[tuple(index[j] + bits[j] for j in range(len(bits)))]
+    return result
+
+
+def requested_for(table, targets, outputs=CALIBRATION_TARGETS, iterations=20, tol=1e-6):
+    """
+    Requested inputs whose mean realized descriptors hit the given targets.
+
+    Parameters:
+    - table: calibration table (calibration_table / load_calibration)
+    - targets: (N, len(outputs)) realized values in outputs order, or a dict of
+      (N,) arrays keyed by output name
+    - outputs: names of the targeted outputs (default CALIBRATION_TARGETS, the
+      inertia form and the realized D2_8, D9_15)
+    - iterations: maximum Gauss-Newton iterations
+    - tol: stop once every residual is below this
+
+    Returns:
+    - requested: (N, 4) requested inputs, clipped to the grid
+    - residual: (N,) largest remaining |mean realized - target| per particle;
+      targets outside the realizable range keep a large residual
+    """
+    outputs = tuple(outputs)
+    if isinstance(targets, dict):
+        targets = np.column_stack([targets[name] for name in outputs])
+    targets = np.atleast_2d(np.asarray(targets, dtype=float))
+    lo = np.array([table['grid'][name][0] for name in CALIBRATION_INPUTS])
+    hi = np.array([table['grid'][name][-1] for name in CALIBRATION_INPUTS])
+    forward = lambda x: predict_realized(table, x, outputs)
+
+    # start from the best grid node
+    nodes = np.stack(np.meshgrid(*[table['grid'][name] for name in CALIBRATION_INPUTS],
+                                 indexing='ij'), axis=-1).reshape(-1, len(CALIBRATION_INPUTS))
+    means = forward(nodes)
+    x = np.empty((len(targets), len(CALIBRATION_INPUTS)))
+    for start in range(0, len(targets), 1024):
+        t = targets[start:start + 1024]
+        d2 = np.sum((t[:, None, :] - means[None, :, :]) ** 2, axis=2)
+        x[start:start + 1024] = nodes[np.argmin(d2, axis=1)]
+
+    h = 1e-4 * (hi - lo)
+    for _ in range(iterations):
+        r = forward(x) - targets
+        if np.abs(r).max() < tol:
+            break
+        # finite-difference Jacobian (one-sided, towards the grid interior)
+        J = np.empty((len(x), targets.shape[1], x.shape[1]))
+        for j in range(x.shape[1]):
+            step = np.where(x[:, j] + h[j] <= hi[j], h[j], -h[j])
+            xs = x.copy()
+            xs[:, j] += step
+            J[:, :, j] = (forward(xs) - targets - r) / step[:, None]
+        # Levenberg-damped normal equations: flat directions at the grid border stay put
+        JT = np.swapaxes(J, 1, 2)
+        dx = -np.linalg.solve(JT @ J + 1e-8 * np.eye(x.shape[1]), JT @ r[:, :, None])[:, :, 0]
+        x = np.clip(x + dx, lo, hi)
+    residual = np.abs(forward(x) - targets).max(axis=1)
+    return x, residual
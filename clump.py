@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-sphere clump approximation of SH particles for DEM
+
+Medial-axis style fit: every interior node of a lattice over the particle is a
+candidate sphere centre, with the largest inscribed radius there (the exact
+distance to the reconstructed mesh, see sdf.bvh_nearest, bounded by the
+radial distance of the node). Candidates are
+scored by how much of the particle volume (the interior lattice nodes) they
+cover; spheres are picked greedily by the volume they add to the clump, all
+candidates scored at once per pick. The reported coverage is measured on a
+staggered lattice the picks were not scored on.
+
+Clumps are expressed in the STL frame of the particle (unit shape times
+scale, as written by sh2stl with scale_mode='radius').
+"""
+
+import os
+import numpy as np
+
+from sh_basis import get_basis, sh_degree, sh_reconstruct
+from radial import radial_fit, signed_radial_distance, points_inside
+from sdf import build_bvh, bvh_nearest
+
+
+def fit_clump(coeff, num_spheres=10, scale=1.0, resolution=24, level=3, min_radius=0.05):
+    """
+    Fit a clump of inscribed spheres to one particle.
+
+    Parameters:
+    - coeff: (L^2, 3) SH coefficients
+    - num_spheres: maximum number of spheres
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2)
+    - resolution: lattice nodes along the longest bounding-box edge
+    - level: icosphere level of the mesh used for the inscribed radii
+    - min_radius: smallest sphere radius, relative to the largest inscribed radius
+
+    Returns:
+    - dict with 'centers' (n, 3), 'radii' (n,) and 'coverage' (fraction of the
+      particle volume covered by the clump)
+    """
+    base = get_basis(level, sh_degree(coeff))
+    xyz = sh_reconstruct(coeff, base['Y']) * scale
+    triangles = xyz[base['faces']]
+    a, center = radial_fit(coeff)
+
+    # interior lattice nodes: coverage samples and candidate centres
+    lo, hi = xyz.min(axis=0), xyz.max(axis=0)
+    step = (hi - lo).max() / resolution
+    axes = [np.arange(lo[k] + step / 2, hi[k], step) for k in range(3)]
+    nodes = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    guess = signed_radial_distance(a, nodes, center * scale, scale=scale)
+    nodes, guess = nodes[guess < 0], guess[guess < 0]
+    # the radial guess plus the fit error bounds the distance (see sdf.particle_sdf)
+    fit_error = np.abs(signed_radial_distance(a, xyz, center * scale, scale=scale)).max()
+    radii = bvh_nearest(build_bvh(triangles), triangles, nodes, -guess + fit_error)[0]
+    keep = radii >= min_radius * radii.max()
+    candidates, cand_radii = nodes[keep], radii[keep]
+
+    # coverage[i, j]: candidate sphere i contains sample j
+    coverage = np.zeros((len(candidates), len(nodes)), dtype=bool)
+    for start in range(0, len(candidates), 512):
+        c = candidates[start:start + 512]
+        d2 = np.sum((c[:, None, :] - nodes[None, :, :]) ** 2, axis=2)
+        coverage[start:start + 512] = d2 <= cand_radii[start:start + 512, None] ** 2
+
+    covered = np.zeros(len(nodes), dtype=bool)
+    chosen = []
+    for _ in range(num_spheres):
+        gain = np.count_nonzero(coverage & ~covered, axis=1)
+        best = int(np.argmax(gain))
+        if gain[best] == 0:
+            break
+        chosen.append(best)
+        covered |= coverage[best]
+
+    # the picks favour the lattice they were scored on: the coverage is measured
+    # on the staggered lattice (offset by half a step) instead
+    axes = [np.arange(lo[k] + step, hi[k], step) for k in range(3)]
+    staggered = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+    staggered = staggered[points_inside(a, staggered, center * scale, scale=scale)]
+    d2 = np.sum((staggered[:, None, :] - candidates[chosen][None]) ** 2, axis=2)
+    return {
+        'centers': candidates[chosen],
+        'radii': cand_radii[chosen],
+        'coverage': float(np.mean(np.any(d2 <= cand_radii[chosen] ** 2, axis=1)))
+    }
+
+
+def clump_library(coeffs, num_spheres=10, scales=None, resolution=24, level=3, min_radius=0.05):
+    """
+    Fit clumps to a whole particle library.
+
+    Parameters:
+    - coeffs: sequence of (L^2, 3) SH coefficient arrays
+    - scales: per-particle scale factors (default 1.0)
+    - num_spheres, resolution, level, min_radius: see fit_clump
+
+    Returns:
+    - list of clump dicts from fit_clump
+    """
+    if scales is None:
+        scales = np.ones(len(coeffs))
+    return [fit_clump(coeff, num_spheres, scales[i], resolution, level, min_radius)
+            for i, coeff in enumerate(coeffs)]
+
+
+def write_clump_templates(clumps, output_dir, prefix='clump'):
+    """
+    Write clump templates, one 'x y z r' file per particle plus an index.
+
+    Parameters:
+    - clumps: list of clump dicts (fit_clump / clump_library)
+    - output_dir: directory of the template files
+    - prefix: file name prefix, files are <prefix>_0000.txt, ...
+
+    Returns:
+    - list of written template paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    with open(os.path.join(output_dir, prefix + '_index.txt'), 'w') as index:
+        index.write("# template spheres coverage\n")
+        for i, clump in enumerate(clumps):
+            name = "{}_{:04d}.txt".format(prefix, i)
+            path = os.path.join(output_dir, name)
+            with open(path, 'w') as f:
+                for c, r in zip(clump['centers'], clump['radii']):
+                    f.write("{:.6g} {:.6g} {:.6g} {:.6g}\n".format(c[0], c[1], c[2], r))
+            index.write("{} {} {:.4f}\n".format(name, len(clump['radii']), clump['coverage']))
+            paths.append(path)
+    return paths
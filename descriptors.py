@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Rotation-invariant shape descriptors computed from SH coefficients
+
+SHPSG builds a particle from target descriptors: d_n is the norm of the
+degree-n coefficient block (all orders m and all three components), the form
+follows from the degree-1 block and
+
+    D2_8  = (d_2 + ... + d_8)  / d_1
+    D9_15 = (d_9 + ... + d_15) / d_1
+
+Here the same quantities are measured on given coefficients, so the realized
+values of any batch (including coeff_multiplier, redraws and the quirks of the
+generator) can be checked with a few array reductions, without meshing.
+
+The degree-1 block is a linear map u -> A u of the unit sphere, i.e. an
+ellipsoid with semi-axes equal to the singular values s1 >= s2 >= s3 of A;
+the realized form indices are Ei = s2 / s1 and Fi = s3 / s2.
+"""
+
+import numpy as np
+
+from sh_basis import sh_basis, sh_degree, sh_orders
+
+
+def degree_norms(coeff):
+    """
+    Descriptors d_n of every degree.
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) coefficients
+
+    Returns:
+    - d: (L,) or (N, L) norms of the degree blocks
+    """
+    coeff = np.asarray(coeff)
+    n, _ = sh_orders(sh_degree(coeff))
+    power = np.sum(np.abs(coeff) ** 2, axis=-1)
+    starts = np.arange(n[-1] + 1) ** 2
+    return np.sqrt(np.add.reduceat(power, starts, axis=-1))
+
+
+def form_matrix(coeff):
+    """
+    Real 3x3 linear map A of the degree-1 block, x(u) = x_0 + A u.
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) coefficients
+
+    Returns:
+    - A: (3, 3) or (N, 3, 3)
+    """
+    # degree-1 basis at the unit axes: column j of A is the degree-1 part of x(e_j)
+    phi = np.array([np.pi / 2, np.pi / 2, 0.0])
+    theta = np.array([0.0, np.pi / 2, 0.0])
+    Y1 = sh_basis(phi, theta, 2)[:, 1:4]
+    return np.swapaxes(np.matmul(Y1, np.asarray(coeff)[..., 1:4, :]).real, -1, -2)
+
+
+def shape_descriptors(coeff):
+    """
+    Realized SHPSG descriptors of one particle or a batch.
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) coefficients
+
+    Returns:
+    - dict with 'd' (per-degree norms), 'D2_8', 'D9_15', 'Ei', 'Fi' and the
+      form semi-axes 'axes' (descending); scalars become (N,) arrays for batches
+    """
+    d = degree_norms(coeff)
+    pad = np.zeros(d.shape[:-1] + (max(16 - d.shape[-1], 0),))
+    dd = np.concatenate((d, pad), axis=-1)
+    axes = np.linalg.svd(form_matrix(coeff), compute_uv=False)
+    return {
+        'd': d,
+        'D2_8': dd[..., 2:9].sum(axis=-1) / dd[..., 1],
+        'D9_15': dd[..., 9:16].sum(axis=-1) / dd[..., 1],
+        'Ei': axes[..., 1] / axes[..., 0],
+        'Fi': axes[..., 2] / axes[..., 1],
+        'axes': axes
+    }
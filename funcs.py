@@ -1,20 +1,13 @@
 import numpy as np
-from scipy.special import sph_harm
+from sh_basis import (sh_basis, sh_degree, sh_reconstruct, sh_basis_derivatives,
+                      surface_geometry, POLE_EPS)
+from mass_properties import mass_properties, mesh_triangles
 
-# calcualte coordinates with SH expansion (now supports up to degree 16)
+# calcualte coordinates with SH expansion (degree taken from the coefficient rows)
 def sph2cart(coeff, phi, theta):
-    x = 0
-    y = 0
-    z = 0
-    index = 0
-    for n in range(16):  # Extended from 9 to 16 to support higher-order features
-        order = [*range(-n,n+1)]
-        for m in range(2*n+1):
-            x += coeff[index,0]*sph_harm(order[m], n, theta, phi)
-            y += coeff[index,1]*sph_harm(order[m], n, theta, phi)
-            z += coeff[index,2]*sph_harm(order[m], n, theta, phi)
-            index += 1
-    return x, y, z
+    Y = sh_basis(phi, theta, sh_degree(coeff))
+    xyz = np.matmul(Y, coeff)
+    return xyz[:,0], xyz[:,1], xyz[:,2]
 
 # define icosahedron surface
 def icosahedron():
@@ -87,6 +80,35 @@ def subdivsurf(f,v):
         f_[idx,:] = nfc
     return v,f_.astype(int)
 
+def nested_subdivsurf(f, v):
+    """
+    Vectorized 1-to-4 subdivision that keeps the vertex order.
+
+    Unlike subdivsurf + cleanmesh (which sorts the vertices), the edge midpoints
+    are appended after the existing vertices, so the vertices of every coarser
+    level are an exact prefix of the finer ones.
+
+    Parameters:
+    - f: faces
+    - v: vertices on the sphere (radius 0.5, as from icosahedron)
+
+    Returns:
+    - v: old vertices followed by the new midpoints
+    - f: subdivided faces (same winding as subdivsurf)
+    """
+    f = np.asarray(f, dtype=int)
+    # unique edges and the face -> edge map (edge k joins vertex k and k+1)
+    e = np.sort(f[:,[0,1,1,2,2,0]].reshape(-1,2), axis=1)
+    edges, f2e = np.unique(e, axis=0, return_inverse=True)
+    ab, bc, ca = (len(v) + f2e.reshape(-1,3)).T
+    mid = v[edges[:,0]] + v[edges[:,1]]
+    mid = mid/np.linalg.norm(mid, axis=1)[:,None]/2
+    f_ = np.concatenate((np.column_stack((f[:,0], ab, ca)),
+                         np.column_stack((f[:,1], bc, ab)),
+                         np.column_stack((f[:,2], ca, bc)),
+                         np.column_stack((ab, bc, ca))))
+    return np.vstack((v, mid)), f_
+
 def getMidPoint(t1,t2,v):
     # GETMIDPOINT calculates point between two vertices
     # Calculate new vertex in sub-division and normalise to unit length
@@ -111,13 +133,141 @@ def cleanmesh(f,v):
             f[i,j] = TC[f[i,j]]
     return v,f
 
-from stl import mesh
-from mpl_toolkits import mplot3d
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+def adaptive_subdivsurf(coeff, f, v, tol=1e-3, max_iter=4, max_faces=200000):
+    """
+    Curvature-adaptive red-green subdivision of the SH surface.
+
+    Every edge is tested once, when it first appears: the SH expansion at its
+    midpoint is compared with the linear interpolation of its end points, and
+    the midpoint (sphere point, surface point, deviation) is kept. Edges whose
+    deviation exceeds tol are split, so flat regions keep large triangles while
+    sharp corners are refined until the tolerance is met; a split edge reuses
+    its stored midpoint, so the basis is evaluated only for new edges.
+
+    Triangles with three split edges are divided into four (red), triangles
+    with two get the third edge split as well, and triangles with one are
+    bisected (green) to avoid T-junctions. Green triangles are never bisected
+    again: when one of them needs refinement, the green pair is merged back
+    into its parent, which is divided into four instead. This keeps the
+    triangles well shaped and the face count low.
+
+    Measured from level 2 on regular and weird particles (tol 3e-3 and 1e-3),
+    meeting tol takes 51-59% of the faces of the smallest uniform level that
+    meets it. At exactly the deviation of a uniform level the face counts are
+    only 0-20% lower: SHPSG roughness spreads the curvature over the whole
+    surface, so most edges need the uniform length anyway.
 
-def plotstl(stlpath, figpath, D_eq=1.0):
+    Parameters:
+    - coeff: SH coefficients (L^2 x 3 complex array)
+    - f: starting faces (e.g. level-1 or level-2 icosphere)
+    - v: starting vertices on the sphere (radius 0.5, as from icosahedron)
+    - tol: allowed midpoint deviation in unit-shape lengths (before D_eq scaling)
+    - max_iter: maximum number of refinement passes
+    - max_faces: stop refining once another pass would exceed this face count
+
+    Returns:
+    - v: refined sphere vertices
+    - f: refined faces
+    - xyz: SH surface points at v (unit shape, not scaled)
+    """
+    degree = sh_degree(coeff)
+    v = np.asarray(v, dtype=float)
+    f = np.asarray(f, dtype=int)
+    sph = car2sph(v)
+    xyz = sh_reconstruct(coeff, sh_basis(sph[:,4], sph[:,5], degree))
+    # parent of each green triangle (split edge first), -1 for the others
+    parent = np.full(f.shape, -1)
+    # tested edges, sorted by key: midpoint, surface point, deviation, vertex index
+    known = {'key': np.zeros(0, dtype=np.int64), 'mid': np.zeros((0,3)), 'xyz': np.zeros((0,3)),
+             'dev': np.zeros(0), 'vertex': np.zeros(0, dtype=int)}
+
+    def edge_keys(a, b):
+        return np.minimum(a, b).astype(np.int64) << 32 | np.maximum(a, b)
+
+    def lookup(keys):
+        return np.searchsorted(known['key'], keys)
+
+    def mesh_edges(f):
+        # unique edges and the face -> edge map (edge k joins vertex k and k+1)
+        keys = edge_keys(f[:,[0,1,2]].ravel(), f[:,[1,2,0]].ravel())
+        keys, f2e = np.unique(keys, return_inverse=True)
+        return keys, f2e.reshape(-1,3)
+
+    for it in range(max_iter):
+        keys, f2e = mesh_edges(f)
+        # evaluate the SH surface at the midpoints of the edges not tested before
+        new = keys[~np.isin(keys, known['key'], assume_unique=True)]
+        if len(new):
+            a, b = (new >> 32).astype(int), (new & 0xffffffff).astype(int)
+            mid = v[a] + v[b]
+            mid = mid/np.linalg.norm(mid, axis=1)[:,None]/2
+            sph = car2sph(mid)
+            xyz_mid = sh_reconstruct(coeff, sh_basis(sph[:,4], sph[:,5], degree))
+            dev = np.linalg.norm(xyz_mid - (xyz[a] + xyz[b])/2, axis=1)
+            order = np.argsort(np.concatenate((known['key'], new)))
+            known = {'key': np.concatenate((known['key'], new))[order],
+                     'mid': np.vstack((known['mid'], mid))[order],
+                     'xyz': np.vstack((known['xyz'], xyz_mid))[order],
+                     'dev': np.concatenate((known['dev'], dev))[order],
+                     'vertex': np.concatenate((known['vertex'], np.full(len(new), -1)))[order]}
+        forced = np.zeros(0, dtype=np.int64)
+        f_, parent_ = f, parent
+        # closure: merge green pairs that need refinement, complete two-edge splits
+        while True:
+            split = (known['dev'][lookup(keys)] > tol) | np.isin(keys, forced)
+            count = split[f2e].sum(axis=1)
+            green = parent_[:,0] >= 0
+            merge = green & (count > 0)
+            if merge.any():
+                # both triangles of every affected green pair go back to the parent,
+                # which is divided into four
+                pairs, pair_id = np.unique(parent_[green], axis=0, return_inverse=True)
+                group = np.full(len(f_), -1)
+                group[green] = pair_id.ravel()
+                bad = np.unique(group[merge])
+                drop = np.isin(group, bad)
+                pairs = pairs[bad]
+                f_ = np.concatenate((f_[~drop], pairs))
+                parent_ = np.concatenate((parent_[~drop], np.full(pairs.shape, -1)))
+                forced = np.concatenate((forced, edge_keys(pairs, np.roll(pairs, -1, axis=1)).ravel()))
+                keys, f2e = mesh_edges(f_)
+                continue
+            if (count == 2).any():
+                forced = np.concatenate((forced, keys[f2e[count == 2]].ravel()))
+                continue
+            break
+        if not split.any():
+            break
+        if len(f_) + 3*np.sum(count == 3) + np.sum(count == 1) > max_faces:
+            break
+        # split edges of merged parents are no longer mesh edges but already have a vertex
+        all_split = np.union1d(keys[split], forced)
+        j = lookup(all_split)
+        fresh = j[known['vertex'][j] < 0]
+        known['vertex'][fresh] = len(v) + np.arange(len(fresh))
+        v = np.vstack((v, known['mid'][fresh]))
+        xyz = np.vstack((xyz, known['xyz'][fresh]))
+        # split into four
+        f3 = f_[count == 3]
+        ab, bc, ca = (known['vertex'][lookup(edge_keys(f3, np.roll(f3, -1, axis=1)))]).T
+        red = np.concatenate((np.column_stack((f3[:,0], ab, ca)),
+                              np.column_stack((f3[:,1], bc, ab)),
+                              np.column_stack((f3[:,2], ca, bc)),
+                              np.column_stack((ab, bc, ca))))
+        # bisect, after rolling each face so that the split edge comes first
+        sel = count == 1
+        k = np.argmax(split[f2e[sel]], axis=1)
+        roll = (k[:,None] + np.arange(3)) % 3
+        f1 = np.take_along_axis(f_[sel], roll, axis=1)
+        m1 = known['vertex'][lookup(keys[f2e[sel][np.arange(len(k)), k]])]
+        green = np.concatenate((np.column_stack((f1[:,0], m1, f1[:,2])),
+                                np.column_stack((m1, f1[:,1], f1[:,2]))))
+        keep = count == 0
+        f = np.concatenate((f_[keep], red, green))
+        parent = np.concatenate((parent_[keep], np.full(red.shape, -1), f1, f1))
+    return v, f, xyz
+
+def plotstl(stlpath, figpath, D_eq=1.0, dpi=150, elev=20, azim=45, color='#4a90e2'):
     """
     Plot and save STL mesh as PNG.
     
@@ -125,9 +275,17 @@ def plotstl(stlpath, figpath, D_eq=1.0):
     - stlpath: input STL file path
     - figpath: output PNG file path
     - D_eq: equivalent diameter (for setting appropriate axis limits)
+    - dpi, elev, azim, color: preview settings (resolution, view angles, face colour)
     """
+    # plotting libraries are only loaded when a preview is drawn
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    from mpl_toolkits import mplot3d
+    from stl import mesh
+
     # create a new plot
-    fig = plt.figure(figsize=(8, 8), dpi=150, facecolor='white')
+    fig = plt.figure(figsize=(8, 8), dpi=dpi, facecolor='white')
     ax = fig.add_subplot(111, projection='3d')
     ax.set_facecolor('#f0f0f0')  # light gray background
 
@@ -136,7 +294,7 @@ def plotstl(stlpath, figpath, D_eq=1.0):
     
     # Create 3D polygon collection with better visualization
     surf = mplot3d.art3d.Poly3DCollection(your_mesh.vectors,
-                                          facecolors='#4a90e2', 
+                                          facecolors=color, 
                                           edgecolor='#1a1a1a',
                                           alpha=0.9,
                                           linewidth=0.1)
@@ -158,7 +316,7 @@ def plotstl(stlpath, figpath, D_eq=1.0):
     ax.set_zticks(np.arange(-margin, margin + 0.1, step=tick_step))
     
     # Set better viewing angle
-    ax.view_init(elev=20, azim=45)
+    ax.view_init(elev=elev, azim=azim)
     
     # Remove axis labels for cleaner look
     ax.set_xlabel('')
@@ -166,13 +324,14 @@ def plotstl(stlpath, figpath, D_eq=1.0):
     ax.set_zlabel('')
 
     # Save figure directly without showing
-    fig.savefig(figpath, dpi=150, bbox_inches='tight', facecolor='white')
+    fig.savefig(figpath, dpi=dpi, bbox_inches='tight', facecolor='white')
     plt.close(fig)
 
-def sh2stl(coeff, sph_cor, vertices, faces, stlpath, D_eq=1.0):
+def sh2stl(coeff, sph_cor, vertices, faces, stlpath, D_eq=1.0, refine_tol=None, max_refine=4,
+           analytic_normals=False, scale_mode='radius'):
     """
     Convert spherical harmonics coefficients to STL mesh.
-    
+
     Parameters:
     - coeff: SH coefficients (256x3 complex array)
     - sph_cor: spherical coordinates
@@ -180,20 +339,86 @@ def sh2stl(coeff, sph_cor, vertices, faces, stlpath, D_eq=1.0):
     - faces: mesh faces
     - stlpath: output file path
     - D_eq: equivalent diameter for scaling (in micrometers), default 1.0
+    - refine_tol: if given, refine the mesh adaptively (see adaptive_subdivsurf)
+      until the SH surface deviates less than refine_tol from it (unit-shape lengths)
+    - max_refine: maximum number of adaptive refinement passes
+    - analytic_normals: store facet normals averaged from the exact SH surface
+      normals at the vertices instead of letting numpy-stl use cross products
+    - scale_mode: 'radius' multiplies the unit shape by D_eq/2 (original behaviour);
+      'volume' scales the mesh so its volume equals pi*D_eq^3/6 and centres it
+      on its centroid
+
+    Returns:
+    - vertices_copy: scaled surface points written to the STL
+    - faces: face array of the written mesh (refined if refine_tol is given)
+    """
+    xyz, vertices, faces = sh_mesh(coeff, sph_cor, vertices, faces, refine_tol, max_refine)
+    vertices_copy = scale_mesh(xyz, faces, D_eq, scale_mode)
+
+    # Write the mesh to file
+    normals = None
+    if analytic_normals:
+        sph = car2sph(vertices) if refine_tol is not None else sph_cor
+        phi = np.clip(sph[:,4], POLE_EPS, np.pi - POLE_EPS)
+        basis = sh_basis_derivatives(phi, sph[:,5], sh_degree(coeff))
+        n = surface_geometry(coeff, basis, curvature=False)['normals'][faces].sum(axis=1)
+        normals = n/np.linalg.norm(n, axis=1)[:,None]
+    save_stl(stlpath, vertices_copy, faces, normals)
+    return vertices_copy, faces
+
+def sh_mesh(coeff, sph_cor, vertices, faces, refine_tol=None, max_refine=4, Y=None):
+    """
+    Unit-shape SH surface on the base mesh (the first step of sh2stl).
+
+    Parameters:
+    - coeff, sph_cor, vertices, faces, refine_tol, max_refine: see sh2stl
+    - Y: precomputed basis of the base mesh (e.g. get_basis(level, degree)['Y']),
+      used instead of evaluating it from sph_cor when the mesh is not refined
+
+    Returns:
+    - xyz: unit-shape surface points
+    - vertices: sphere vertices of the mesh (refined if refine_tol is given)
+    - faces: face array of the mesh
+    """
+    if refine_tol is not None:
+        vertices, faces, xyz = adaptive_subdivsurf(coeff, faces, vertices,
+                                                   tol=refine_tol, max_iter=max_refine)
+    else:
+        if Y is None:
+            Y = sh_basis(sph_cor[:,4], sph_cor[:,5], sh_degree(coeff))
+        xyz = sh_reconstruct(coeff, Y)
+    return xyz, vertices, faces
+
+def scale_mesh(xyz, faces, D_eq=1.0, scale_mode='radius'):
     """
+    Scale a unit-shape surface to D_eq (see scale_mode of sh2stl).
+
+    Returns:
+    - scaled surface points
+    """
+    if scale_mode not in ('radius', 'volume'):
+        raise ValueError("scale_mode must be 'radius' or 'volume'")
+    if scale_mode == 'volume':
+        # Scale the true mesh volume to that of a sphere with diameter D_eq
+        props = mass_properties(mesh_triangles(xyz, faces))
+        return (xyz - props['centroid']) * (D_eq / props['D_eq'])
     # Calculate scale factor from equivalent diameter (D_eq/2 = radius)
-    scale_factor = D_eq / 2.0
-    
-    # Update vertices by SH expansion and apply scaling
-    vertices_copy = vertices.copy()
-    for i in range(3):
-        vertices_copy[:,i] = sph2cart(coeff, sph_cor[:,4], sph_cor[:,5])[i] * scale_factor
+    return xyz * (D_eq / 2.0)
 
-    # Create the mesh
+def save_stl(stlpath, vertices, faces, normals=None):
+    """
+    Write a triangle mesh as STL.
+
+    Parameters:
+    - stlpath: output file path
+    - vertices, faces: indexed mesh
+    - normals: optional (F, 3) facet normals (default: computed by numpy-stl)
+    """
+    from stl import mesh
     cube = mesh.Mesh(np.zeros(faces.shape[0], dtype=mesh.Mesh.dtype))
-    for i, f in enumerate(faces):
-        for j in range(3):
-            cube.vectors[i][j] = vertices_copy[f[j],:]
-    
-    # Write the mesh to file
-    cube.save(stlpath)
+    cube.vectors[:] = vertices[faces]
+    if normals is not None:
+        cube.normals[:] = normals
+        cube.save(stlpath, update_normals=False)
+    else:
+        cube.save(stlpath)
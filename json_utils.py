@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+JSON helpers shared by the particle cache and the stage manifests
+
+Particle parameters and details mix Python and NumPy values; json_default
+lets json.dump / json.dumps write them, e.g.
+
+    json.dumps(record, sort_keys=True, default=json_default)
+"""
+
+import numpy as np
+
+
+def json_default(value):
+    """JSON conversion of NumPy scalars and arrays (the default hook of json.dump)"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("not JSON serializable: {!r}".format(value))
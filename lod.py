@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-level-of-detail export of SH particles
+
+Icosphere levels 0..k are built with funcs.nested_subdivsurf, so the vertices
+of level l are the first V_l vertices of level l+1. One SH reconstruction on
+the finest level (against a cached basis) therefore yields every level: a
+coarse mesh is a vertex prefix plus its own face array.
+
+Packed file layout (little endian):
+
+    magic      6 bytes   b'SHLOD1'
+    levels     uint32    number of levels n
+    vertices   uint32    vertex count of the finest level
+    table      n x (uint32 V_l, uint32 F_l, uint64 face byte offset)
+    vertex block         (V_max, 3) float32, shared by all levels
+    face blocks          (F_l, 3) int32 per level, at the listed offsets
+
+read_lod maps only the requested level.
+"""
+
+import numpy as np
+
+from funcs import icosahedron, nested_subdivsurf, car2sph
+from sh_basis import sh_basis, sh_degree, sh_reconstruct
+
+LOD_MAGIC = b'SHLOD1'
+
+# cache of max_level -> nested vertices and per-level faces
+_LOD_CACHE = {}
+
+
+def nested_icospheres(max_level):
+    """
+    Nested icospheres of levels 0..max_level.
+
+    Returns:
+    - vertices: (V_max, 3) vertices of the finest level (coarser levels are prefixes)
+    - faces: list of (F_l, 3) face arrays, one per level
+    - counts: list of vertex counts V_l
+    """
+    if max_level not in _LOD_CACHE:
+        v, f = icosahedron()
+        faces, counts = [f], [len(v)]
+        for level in range(max_level):
+            v, f = nested_subdivsurf(f, v)
+            faces.append(f)
+            counts.append(len(v))
+        _LOD_CACHE[max_level] = {'vertices': v, 'faces': faces, 'counts': counts, 'Y': {}}
+    cached = _LOD_CACHE[max_level]
+    return cached['vertices'], cached['faces'], cached['counts']
+
+
+def reconstruct_lods(coeff, max_level=3, scale=1.0):
+    """
+    SH surface at every level of detail from one reconstruction.
+
+    Parameters:
+    - coeff: (L^2, 3) SH coefficients
+    - max_level: finest icosphere level
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2, as sh2stl)
+
+    Returns:
+    - xyz: (V_max, 3) surface points of the finest level
+    - faces: list of per-level face arrays (indices into the xyz prefix)
+    - counts: per-level vertex counts
+    """
+    vertices, faces, counts = nested_icospheres(max_level)
+    degree = sh_degree(coeff)
+    bases = _LOD_CACHE[max_level]['Y']
+    if degree not in bases:
+        sph = car2sph(vertices)
+        bases[degree] = sh_basis(sph[:, 4], sph[:, 5], degree)
+    return sh_reconstruct(coeff, bases[degree]) * scale, faces, counts
+
+
+def write_lod(path, coeff, max_level=3, scale=1.0):
+    """
+    Write levels 0..max_level of one particle to a packed LOD file.
+
+    Parameters:
+    - path: output file path
+    - coeff: (L^2, 3) SH coefficients
+    - max_level: finest icosphere level
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2)
+    """
+    xyz, faces, counts = reconstruct_lods(coeff, max_level, scale)
+    n = len(faces)
+    header = len(LOD_MAGIC) + 8 + 16 * n
+    offset = header + 12 * len(xyz)
+    table = np.zeros(n, dtype=[('vertices', '<u4'), ('faces', '<u4'), ('offset', '<u8')])
+    for level in range(n):
+        table[level] = (counts[level], len(faces[level]), offset)
+        offset += 12 * len(faces[level])
+    with open(path, 'wb') as f:
+        f.write(LOD_MAGIC)
+        f.write(np.array([n, len(xyz)], dtype='<u4').tobytes())
+        f.write(table.tobytes())
+        f.write(xyz.astype('<f4').tobytes())
+        for level in range(n):
+            f.write(faces[level].astype('<i4').tobytes())
+
+
+def read_lod(path, level=None):
+    """
+    Read one level of detail from a packed LOD file.
+
+    Parameters:
+    - path: LOD file written by write_lod
+    - level: level to read (default: the finest)
+
+    Returns:
+    - vertices: (V_l, 3) float32 array
+    - faces: (F_l, 3) int32 array
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(LOD_MAGIC)) != LOD_MAGIC:
+            raise ValueError("not an SH LOD file: {}".format(path))
+        n, total = np.frombuffer(f.read(8), dtype='<u4')
+        table = np.frombuffer(f.read(16 * int(n)),
+                              dtype=[('vertices', '<u4'), ('faces', '<u4'), ('offset', '<u8')])
+    if level is None:
+        level = int(n) - 1
+    entry = table[level]
+    header = len(LOD_MAGIC) + 8 + 16 * int(n)
+    vertices = np.memmap(path, dtype='<f4', mode='r', offset=header,
+                         shape=(int(entry['vertices']), 3))
+    faces = np.memmap(path, dtype='<i4', mode='r', offset=int(entry['offset']),
+                      shape=(int(entry['faces']), 3))
+    return np.array(vertices), np.array(faces)
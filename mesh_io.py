@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed (shared-vertex) mesh export
+
+STL stores every triangle with its own three vertices, so each vertex of a
+closed triangle mesh is written about six times. PLY and OBJ store the unique
+vertices once plus a face index array, which is exactly what sh2stl returns.
+Both writers dump whole arrays at once (no per-face Python loop).
+"""
+
+import numpy as np
+
+
+def write_ply(path, vertices, faces):
+    """
+    Write a binary little-endian PLY file.
+
+    Parameters:
+    - path: output file path
+    - vertices: (V, 3) vertex coordinates (stored as float32)
+    - faces: (F, 3) triangle vertex indices
+    """
+    vertices = np.asarray(vertices, dtype='<f4')
+    faces = np.asarray(faces)
+    records = np.empty(len(faces), dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    records['n'] = 3
+    records['v'] = faces
+    header = ("ply\n"
+              "format binary_little_endian 1.0\n"
+              "element vertex {}\n"
+              "property float x\n"
+              "property float y\n"
+              "property float z\n"
+              "element face {}\n"
+              "property list uchar int vertex_indices\n"
+              "end_header\n").format(len(vertices), len(faces))
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(np.ascontiguousarray(vertices).tobytes())
+        f.write(records.tobytes())
+
+
+def read_ply(path):
+    """
+    Read a triangle mesh written by write_ply.
+
+    Returns:
+    - vertices: (V, 3) float32 array
+    - faces: (F, 3) int32 array
+    """
+    with open(path, 'rb') as f:
+        counts = {}
+        line = f.readline()
+        while not line.startswith(b'end_header'):
+            words = line.split()
+            if words[:1] == [b'element']:
+                counts[words[1].decode()] = int(words[2])
+            line = f.readline()
+        vertices = np.frombuffer(f.read(12 * counts['vertex']), dtype='<f4').reshape(-1, 3)
+        records = np.frombuffer(f.read(13 * counts['face']),
+                                dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+    return vertices, records['v']
+
+
+def write_obj(path, vertices, faces):
+    """
+    Write a Wavefront OBJ file (1-based face indices).
+
+    Parameters:
+    - path: output file path
+    - vertices: (V, 3) vertex coordinates
+    - faces: (F, 3) triangle vertex indices
+    """
+    with open(path, 'w') as f:
+        np.savetxt(f, np.asarray(vertices, dtype=float), fmt='v %.7g %.7g %.7g')
+        np.savetxt(f, np.asarray(faces) + 1, fmt='f %d %d %d')
+
+
+def write_mesh(path, vertices, faces):
+    """Write an indexed mesh, format chosen by the extension (.ply or .obj)"""
+    if path.lower().endswith('.ply'):
+        write_ply(path, vertices, faces)
+    elif path.lower().endswith('.obj'):
+        write_obj(path, vertices, faces)
+    else:
+        raise ValueError("unsupported mesh format: {}".format(path))
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Random sequential addition (RSA) packing in a cylindrical container
+
+Particles are inserted one by one (largest first) at random positions and
+random orientations; a trial is accepted when it overlaps neither the
+container nor any particle placed before, otherwise it is retried up to
+max_attempts times and then skipped.
+
+- broad phase: a uniform spatial grid with cells of the largest bounding
+  diameter, so only particles in the 27 neighbouring cells are examined and
+  pairs whose bounding spheres are apart are dropped
+- narrow phase: surface samples of each particle are tested against the
+  radial function r(phi, theta) of the other (see radial.py) along the
+  centre-to-point direction; inscribed spheres reject trials early, and all
+  neighbours of a trial are tested in one batched basis evaluation
+
+The narrow phase only sees the surface samples, so a trial can be accepted
+with a small overlap where the two surfaces cross between samples. The
+largest undetected penetration shrinks with the sample level (icosphere
+level 2, 3, 4 = 162, 642, 2562 samples per particle); measured with
+penetration_depths on dense packings of SHPSG particles with Ei, Fi = 0.6 it
+stays below about 2.5%, 0.6% and 0.1% of the smaller particle diameter.
+
+Shapes are given as radial coefficients (radial.radial_fit) in unit-shape
+coordinates and placed with a scale factor, e.g. D_eq/2 for STLs written with
+sh2stl(scale_mode='radius').
+"""
+
+import numpy as np
+
+from radial import (radial_surface, radial_weights, radial_function_rows, stack_radial,
+                    direction_angles)
+from mass_properties import mass_properties, mesh_triangles
+
+
+def random_quaternions(n, rng=None):
+    """Uniformly distributed random unit quaternions (w, x, y, z), shape (n, 4)"""
+    if rng is None:
+        rng = np.random
+    u1, u2, u3 = rng.rand(3, n)
+    a, b = np.sqrt(1.0 - u1), np.sqrt(u1)
+    return np.column_stack((b * np.cos(2 * np.pi * u3), a * np.sin(2 * np.pi * u2),
+                            a * np.cos(2 * np.pi * u2), b * np.sin(2 * np.pi * u3)))
+
+
+def quaternion_matrix(q):
+    """Rotation matrices (..., 3, 3) of unit quaternions (..., 4)"""
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=float), -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], -1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], -1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], -1)
+    ], -2)
+
+
+def shape_table(shapes, level=2, bound_level=4):
+    """
+    Per-shape data used by the packing engine.
+
+    Parameters:
+    - shapes: list of radial coefficient arrays (radial.radial_fit)
+    - level: icosphere level of the surface samples used in the narrow phase
+    - bound_level: icosphere level used for the bounding / inscribed radii and volume
+
+    Returns:
+    - dict with 'points' (S, P, 3) surface samples, 'r_max', 'r_min' and
+      'volume' (S,), all in unit-shape coordinates, and 'weights' of the radial
+      functions (see radial.radial_weights)
+    """
+    points, r_max, r_min, volume = [], [], [], []
+    for a in shapes:
+        points.append(radial_surface(a, level)[0])
+        fine, faces = radial_surface(a, bound_level)
+        r = np.linalg.norm(fine, axis=1)
+        # small margins: the samples miss the extrema between vertices
+        r_max.append(1.02 * r.max())
+        r_min.append(0.98 * r.min())
+        volume.append(mass_properties(mesh_triangles(fine, faces))['volume'])
+    return {
+        'points': np.array(points),
+        'r_max': np.array(r_max),
+        'r_min': np.array(r_min),
+        'volume': np.array(volume),
+        'weights': radial_weights(stack_radial(shapes))
+    }
+
+
+def _overlaps(table, shape, position, rotation, scale, others, positions, rotations, scales,
+              bounds, bound):
+    """
+    Whether a posed particle overlaps any of J posed neighbours (batched narrow phase).
+
+    Surface samples of the particle are tested against the radial functions of the
+    neighbours and those of the neighbours against the particle's; only samples
+    inside the bounding sphere of the other particle are evaluated.
+    """
+    samples = table['points']
+    # particle samples in the body frames of the neighbours (J, P, 3), unit-shape lengths
+    world = position + (samples[shape] * scale) @ rotation.T
+    rel = world[None] - positions[:, None]
+    near = np.einsum('jpi,jpi->jp', rel, rel) < bounds[:, None] ** 2
+    local = np.einsum('jpi,jik->jpk', rel, rotations) / scales[:, None, None]
+    rows = np.broadcast_to(others[:, None], near.shape)
+    points, point_rows = [local[near]], [rows[near]]
+    # neighbour samples in the body frame of the particle
+    world = positions[:, None] + np.einsum('jik,jpk->jpi', rotations,
+                                           samples[others] * scales[:, None, None])
+    rel = world - position
+    near = np.einsum('jpi,jpi->jp', rel, rel) < bound ** 2
+    points.append(rel[near] @ rotation / scale)
+    point_rows.append(np.full(np.count_nonzero(near), shape))
+    points, point_rows = np.concatenate(points), np.concatenate(point_rows)
+    if len(points) == 0:
+        return False
+    # samples inside the inscribed sphere of the other particle overlap outright
+    norm = np.linalg.norm(points, axis=1)
+    if np.any(norm < table['r_min'][point_rows]):
+        return True
+    phi, theta = direction_angles(points)
+    r = radial_function_rows(table['weights'], phi, theta, point_rows)
+    return bool(np.any(norm < r))
+
+
+def rsa_pack(shapes, diameter, height, scales, shape_index=None, max_attempts=200,
+             rng=None, level=3, verbose=False):
+    """
+    Pack particles into a cylinder by random sequential addition.
+
+    Parameters:
+    - shapes: list of radial coefficient arrays (radial.radial_fit), unit-shape coordinates
+    - diameter, height: container size (same length unit as the scaled particles);
+      the cylinder axis is +Z with its base centred at the origin
+    - scales: (N,) scale factor of each particle (e.g. D_eq/2)
+    - shape_index: (N,) shape of each particle (default particle i uses shape i)
+    - max_attempts: trial placements per particle before it is skipped
+    - rng: random state with the np.random interface (default the global np.random)
+    - level: icosphere level of the narrow-phase surface samples; it sets the overlap
+      tolerance (undetected penetration below about 2.5%, 0.6% and 0.1% of the smaller
+      particle diameter at levels 2, 3 and 4, see the module docstring)
+    - verbose: print progress every 1000 particles
+
+    Returns:
+    - dict with
+      'particle'         (M,)    index of every placed particle in the input
+      'shape_index'      (M,)    its shape
+      'scale'            (M,)    its scale
+      'position'         (M, 3)  centre of its radial function
+      'quaternion'       (M, 4)  its orientation (w, x, y, z), body to world
+      'volume'           (M,)    its volume
+      'packing_fraction'         total particle volume / container volume
+      'attempts'                 total number of trial placements
+    """
+    if rng is None:
+        rng = np.random
+    scales = np.asarray(scales, dtype=float)
+    if shape_index is None:
+        shape_index = np.arange(len(scales))
+    shape_index = np.asarray(shape_index)
+    table = shape_table(shapes, level)
+    bound = table['r_max'][shape_index] * scales
+    inner = table['r_min'][shape_index] * scales
+    radius = diameter / 2.0
+
+    # uniform grid broad phase: no two overlapping particles are more than one cell apart
+    cell = 2.0 * bound.max()
+    grid = {}
+
+    n = len(scales)
+    positions = np.zeros((n, 3))
+    rotations = np.zeros((n, 3, 3))
+    quaternions = np.zeros((n, 4))
+    placed = []
+    attempts = 0
+
+    # largest particles first
+    for count, i in enumerate(np.argsort(-bound, kind='stable')):
+        if verbose and count % 1000 == 0:
+            print("Placing particle {}/{} ({} placed)".format(count, n, len(placed)))
+        s = shape_index[i]
+        if bound[i] > radius or 2.0 * bound[i] > height:
+            continue
+        for attempt in range(max_attempts):
+            attempts += 1
+            # centre such that the bounding sphere stays inside the container
+            rho = (radius - bound[i]) * np.sqrt(rng.rand())
+            angle = 2.0 * np.pi * rng.rand()
+            c = np.array([rho * np.cos(angle), rho * np.sin(angle),
+                          rng.uniform(bound[i], height - bound[i])])
+            q = random_quaternions(1, rng)[0]
+            R = quaternion_matrix(q)
+
+            key = tuple(np.floor(c / cell).astype(int))
+            near = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                    for j in grid.get((key[0] + dx, key[1] + dy, key[2] + dz), ())]
+            near = np.array(near, dtype=int)
+            dist = np.linalg.norm(positions[near] - c, axis=1)
+            close = dist < bound[i] + bound[near]
+            near, dist = near[close], dist[close]
+            if len(near):
+                if np.any(dist < inner[i] + inner[near]):
+                    continue
+                if _overlaps(table, s, c, R, scales[i], shape_index[near], positions[near],
+                             rotations[near], scales[near], bound[near], bound[i]):
+                    continue
+            positions[i], rotations[i], quaternions[i] = c, R, q
+            grid.setdefault(key, []).append(i)
+            placed.append(i)
+            break
+
+    placed = np.array(placed, dtype=int)
+    volume = table['volume'][shape_index[placed]] * scales[placed] ** 3
+    return {
+        'particle': placed,
+        'shape_index': shape_index[placed],
+        'scale': scales[placed],
+        'position': positions[placed],
+        'quaternion': quaternions[placed],
+        'volume': volume,
+        'packing_fraction': volume.sum() / (np.pi * radius ** 2 * height),
+        'attempts': attempts
+    }
+
+
+def penetration_depths(shapes, result, level=5):
+    """
+    Largest mutual penetration of every pair of packed particles, from dense samples.
+
+    Surface samples of each particle are tested against the radial function of
+    every particle whose bounding sphere it meets, so the result reports the overlaps the coarser narrow phase of rsa_pack let
+    through.
+
+    Parameters:
+    - shapes: list of radial coefficient arrays passed to rsa_pack
+    - result: dict returned by rsa_pack
+    - level: icosphere level of the dense surface samples
+
+    Returns:
+    - dict with 'pairs' (K, 2) indices into the placed particles whose bounding
+      spheres meet and 'depth' (K,) their largest radial penetration in world
+      units (0 where no sample lies inside the other particle)
+    """
+    table = shape_table(shapes, level)
+    shape, scale, position = result['shape_index'], result['scale'], result['position']
+    R = quaternion_matrix(result['quaternion'])
+    bound = table['r_max'][shape] * scale
+    world = position[:, None] + np.einsum('kij,kpj->kpi', R, table['points'][shape] * scale[:, None, None])
+    pairs, depth = [], []
+    for i in range(len(shape)):
+        near = np.arange(i + 1, len(shape))
+        near = near[np.linalg.norm(position[near] - position[i], axis=1) < bound[i] + bound[near]]
+        if len(near) == 0:
+            continue
+        # samples of i in the frames of its neighbours and theirs in the frame of i
+        rel = np.concatenate((world[i][None] - position[near][:, None], world[near] - position[i]))
+        body = np.concatenate((near, np.full(len(near), i)))
+        local = np.einsum('jpi,jik->jpk', rel, R[body]) / scale[body][:, None, None]
+        pair = np.tile(np.arange(len(near)), 2)
+        inside = np.einsum('jpi,jpi->jp', local, local) < table['r_max'][shape[body]][:, None] ** 2
+        points, rows = local[inside], np.broadcast_to(pair[:, None], inside.shape)[inside]
+        d = np.zeros(len(near))
+        if len(points):
+            phi, theta = direction_angles(points)
+            rows_shape = np.broadcast_to(shape[body][:, None], inside.shape)[inside]
+            r = radial_function_rows(table['weights'], phi, theta, rows_shape)
+            # radial penetration in world units
+            pen = (r - np.linalg.norm(points, axis=1)) * np.broadcast_to(
+                scale[body][:, None], inside.shape)[inside]
+            np.maximum.at(d, rows, pen)
+        pairs.extend((i, j) for j in near)
+        depth.extend(d)
+    return {'pairs': np.array(pairs, dtype=int).reshape(-1, 2), 'depth': np.array(depth)}
+
+
+def write_placements(result, output_file, centers=None):
+    """
+    Write packed placements to a text file, one particle per line.
+
+    Parameters:
+    - result: dict returned by rsa_pack
+    - output_file: path of the text file
+    - centers: optional (S, 3) radial centres (radial.radial_fit) of the shapes in
+      unit-shape coordinates; if given, the translation to apply to the rotated
+      STL vertices is written as well (tx, ty, tz)
+    """
+    R = quaternion_matrix(result['quaternion'])
+    with open(output_file, 'w') as f:
+        f.write("# RSA packing: {} particles, packing fraction {:.4f}, {} attempts\n".format(
+            len(result['particle']), result['packing_fraction'], result['attempts']))
+        header = ['particle', 'shape', 'scale', 'x', 'y', 'z', 'qw', 'qx', 'qy', 'qz', 'volume']
+        if centers is not None:
+            header += ['tx', 'ty', 'tz']
+        f.write("# " + " ".join(header) + "\n")
+        for k in range(len(result['particle'])):
+            row = [result['particle'][k], result['shape_index'][k], result['scale'][k]]
+            row += list(result['position'][k]) + list(result['quaternion'][k]) + [result['volume'][k]]
+            if centers is not None:
+                offset = R[k] @ (np.asarray(centers[result['shape_index'][k]]) * result['scale'][k])
+                row += list(result['position'][k] - offset)
+            f.write("{:d} {:d} ".format(int(row[0]), int(row[1])) +
+                    " ".join("{:.6g}".format(v) for v in row[2:]) + "\n")
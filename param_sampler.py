@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized particle parameter sampling from declarative recipes
+
+A recipe is a plain dict describing how each parameter is drawn:
+
+    {
+        'Ei':   ('uniform', 0.4, 0.7),
+        'D_eq': ('uniform', 30, 90),
+        'max_degree': ('randint', 12, 18),
+        'coeff_multiplier': ('constant', 1.2),
+        'category': 'regular',
+        'clip': {'Ei': (0.3, 1.0)}           # optional
+    }
+
+Supported distributions: ('uniform', lo, hi), ('normal', mean, std),
+('lognormal', mean, sigma) of log(x), ('randint', lo, hi) with hi exclusive,
+('constant', value) and ('choice', [values]), plus the particle size
+distributions ('rosin_rammler', d63, n) with P(D < d) = 1 - exp(-(d/d63)^n)
+and ('sieve', sizes, passing) for a tabulated cumulative passing curve
+(fractions 0..1, interpolated in log size). ('truncated', spec, lo, hi)
+restricts a continuous distribution to [lo, hi] by inverse-CDF sampling over
+[F(lo), F(hi)] (unlike 'clip', which piles the cut-off mass onto the bounds).
+
+A recipe may instead define a 'transition' schedule (any cycle length and
+any number of stages, see GRADUAL_RECIPE) or a category 'mix' of sub-recipes
+(see MIXED_RECIPE), and a 'design' that replaces the independent random draws
+of some parameters by a scrambled Sobol or Latin hypercube design over their
+ranges (see DESIGN_RECIPE). With 'calibrate' (True, or a dict of
+calibration.calibration_table settings) the sampled Ei, Fi, D2_8 and D9_15
+are read as realized targets (Ei, Fi as the inertia form of the mesh, see
+calibration.CALIBRATION_TARGETS) and replaced by the requested inputs that
+hit them on average (see calibration.py).
+
+generate_params_batch returns one structured NumPy array row per particle;
+its columns can be passed to SHPSG_batch / generate_coeffs_batch directly.
+The particle generators instead draw one row per attempt from the particle's
+own random stream (start_index places it in schedules and designs), so
+redraws, caching and parallel workers stay reproducible per particle.
+"""
+
+import numpy as np
+
+
+# One row per particle
+PARAM_DTYPE = np.dtype([
+    ('Ei', 'f8'),
+    ('Fi', 'f8'),
+    ('D2_8', 'f8'),
+    ('D9_15', 'f8'),
+    ('D_eq', 'f8'),
+    ('max_degree', 'i4'),
+    ('coeff_multiplier', 'f8'),
+    ('category', 'U16')
+])
+
+# Same ranges as generate_random_particle_params(category='regular')
+REGULAR_RECIPE = {
+    'Ei': ('uniform', 0.4, 0.7),
+    'Fi': ('uniform', 0.4, 0.7),
+    'D2_8': ('uniform', 0.2, 0.45),
+    'D9_15': ('uniform', 0.08, 0.25),
+    'D_eq': ('uniform', 30, 90),
+    'max_degree': ('randint', 12, 18),
+    'coeff_multiplier': ('constant', 1.2),
+    'category': 'regular'
+}
+
+# Same ranges as generate_random_particle_params(category='weird')
+WEIRD_RECIPE = {
+    'Ei': ('uniform', 0.2, 0.5),
+    'Fi': ('uniform', 0.1, 0.4),
+    'D2_8': ('uniform', 0.2, 0.4),
+    'D9_15': ('uniform', 0.1, 0.2),
+    'D_eq': ('uniform', 30, 90),
+    'max_degree': ('randint', 30, 51),
+    'coeff_multiplier': ('uniform', 5, 10),
+    'category': 'weird'
+}
+
+# 80% regular + 20% weird, as in batch_generate_mixed_particles
+MIXED_RECIPE = {
+    'mix': [('regular', 0.8, REGULAR_RECIPE), ('weird', 0.2, WEIRD_RECIPE)]
+}
+
+# The gradual transition of generate_random_particle_params(particle_index=...):
+# a 50-particle cycle split into 5 stages. Parameters move linearly from 'start'
+# to 'end' with the stage factor k = stage / (stages - 1); 'jitter' gives the
+# half-width of the uniform perturbation at k = 0 and k = 1.
+GRADUAL_RECIPE = {
+    'transition': {
+        'cycle': 50,
+        'stages': 5,
+        'start': {'Ei': 0.9, 'Fi': 0.9, 'D2_8': 0.05, 'D9_15': 0.0,
+                  'max_degree': 8, 'coeff_multiplier': 1.0},
+        'end': {'Ei': 0.4, 'Fi': 0.4, 'D2_8': 0.3, 'D9_15': 0.25,
+                'max_degree': 16, 'coeff_multiplier': 1.5},
+        'jitter': {'Ei': (0.15, 0.0), 'Fi': (0.15, 0.0),
+                   'D2_8': (0.03, 0.03), 'D9_15': (0.02, 0.02)}
+    },
+    'D_eq': ('uniform', 30, 90),
+    'category': 'gradual',
+    'clip': {'Ei': (0.3, 1.0), 'Fi': (0.3, 1.0), 'D2_8': (0.0, 0.4), 'D9_15': (0.0, 0.3)}
+}
+
+# Calibration sweep: scrambled Sobol points over the regular parameter box.
+# Use a power-of-two number of particles (per shard) to keep Sobol balanced.
+DESIGN_RECIPE = dict(REGULAR_RECIPE, design={
+    'method': 'sobol',
+    'params': ('Ei', 'Fi', 'D2_8', 'D9_15', 'D_eq'),
+    'seed': 0
+})
+
+# Log-normal size distribution around a 55 um median, truncated to the 30-90 um window
+PSD_RECIPE = dict(REGULAR_RECIPE,
+                  D_eq=('truncated', ('lognormal', np.log(55.0), 0.3), 30.0, 90.0))
+
+
+def sample_distribution(spec, size, rng):
+    """
+    Draw size values from a distribution spec such as ('uniform', lo, hi).
+
+    Parameters:
+    - spec: distribution tuple (see module docstring) or a plain number
+    - size: number of values
+    - rng: random state with the np.random interface
+    """
+    if np.isscalar(spec):
+        return np.full(size, spec)
+    kind, args = spec[0], spec[1:]
+    if kind == 'uniform':
+        return rng.uniform(args[0], args[1], size)
+    if kind == 'normal':
+        return rng.normal(args[0], args[1], size)
+    if kind == 'lognormal':
+        return rng.lognormal(args[0], args[1], size)
+    if kind == 'randint':
+        return rng.randint(args[0], args[1], size)
+    if kind == 'constant':
+        return np.full(size, args[0])
+    if kind == 'choice':
+        return np.asarray(args[0])[rng.randint(0, len(args[0]), size)]
+    if kind in ('rosin_rammler', 'sieve', 'truncated'):
+        return distribution_ppf(spec, rng.rand(size))
+    raise ValueError("unknown distribution '{}'".format(kind))
+
+
+def distribution_cdf(spec, x):
+    """
+    Cumulative distribution function of a continuous distribution spec.
+
+    Parameters:
+    - spec: 'uniform', 'normal', 'lognormal', 'rosin_rammler' or 'sieve' tuple
+    - x: values, any shape
+    """
+    x = np.asarray(x, dtype=float)
+    kind, args = spec[0], spec[1:]
+    if kind == 'uniform':
+        return np.clip((x - args[0]) / (args[1] - args[0]), 0.0, 1.0)
+    if kind in ('normal', 'lognormal'):
+        from scipy.special import ndtr
+        if kind == 'lognormal':
+            x = np.log(np.maximum(x, 1e-300))
+        return ndtr((x - args[0]) / args[1])
+    if kind == 'rosin_rammler':
+        return -np.expm1(-(np.maximum(x, 0.0) / args[0]) ** args[1])
+    if kind == 'sieve':
+        sizes, passing = np.asarray(args[0], dtype=float), np.asarray(args[1], dtype=float)
+        return np.interp(np.log(np.maximum(x, 1e-300)), np.log(sizes), passing)
+    raise ValueError("no CDF for distribution '{}'".format(kind))
+
+
+def distribution_ppf(spec, u):
+    """
+    Map unit-interval points u through the inverse CDF of a distribution spec.
+
+    Parameters:
+    - spec: distribution tuple (see module docstring) or a plain number
+    - u: points in [0, 1), any shape
+    """
+    u = np.asarray(u, dtype=float)
+    if np.isscalar(spec):
+        return np.full(u.shape, spec)
+    kind, args = spec[0], spec[1:]
+    if kind == 'uniform':
+        return args[0] + u * (args[1] - args[0])
+    if kind == 'randint':
+        return args[0] + np.floor(u * (args[1] - args[0])).astype(int)
+    if kind == 'constant':
+        return np.full(u.shape, args[0])
+    if kind == 'choice':
+        return np.asarray(args[0])[np.floor(u * len(args[0])).astype(int)]
+    if kind in ('normal', 'lognormal'):
+        from scipy.special import ndtri
+        value = args[0] + args[1] * ndtri(np.clip(u, 1e-12, 1 - 1e-12))
+        return np.exp(value) if kind == 'lognormal' else value
+    if kind == 'rosin_rammler':
+        return args[0] * (-np.log1p(-u)) ** (1.0 / args[1])
+    if kind == 'sieve':
+        sizes, passing = np.asarray(args[0], dtype=float), np.asarray(args[1], dtype=float)
+        return np.exp(np.interp(u, passing, np.log(sizes)))
+    if kind == 'truncated':
+        base, lo, hi = args
+        f_lo, f_hi = distribution_cdf(base, lo), distribution_cdf(base, hi)
+        return np.clip(distribution_ppf(base, f_lo + u * (f_hi - f_lo)), lo, hi)
+    raise ValueError("unknown distribution '{}'".format(kind))
+
+
+# cache of (dim, seed, total) -> Latin hypercube design
+_LHS_CACHE = {}
+
+
+def design_points(num_points, dim, method='sobol', seed=0, start_index=0, total=None):
+    """
+    Rows start_index .. start_index + num_points of a seeded unit-cube design.
+
+    The whole design is fixed by (method, dim, seed), so workers that ask for
+    disjoint row ranges (see shard_range) cover disjoint parts of one design.
+
+    Parameters:
+    - num_points: number of rows
+    - dim: number of dimensions
+    - method: 'sobol' (scrambled, rows reached with fast_forward), 'lhs'
+      (Latin hypercube of total rows) or 'random'
+    - seed: design seed
+    - start_index: first row
+    - total: size of the full design, needed by 'lhs' (default num_points; required
+      when start_index > 0, otherwise every shard would use its own hypercube)
+
+    Returns:
+    - (num_points, dim) array in [0, 1)
+    """
+    if method == 'random':
+        rng = np.random.RandomState(seed)
+        return rng.rand(start_index + num_points, dim)[start_index:]
+    from scipy.stats import qmc
+    if method == 'sobol':
+        sampler = qmc.Sobol(dim, scramble=True, seed=seed)
+        if start_index > 0:
+            sampler.fast_forward(start_index)
+        return sampler.random(num_points)
+    if method == 'lhs':
+        if total is None:
+            if start_index > 0:
+                raise ValueError("an 'lhs' design needs 'total' when start_index > 0")
+            total = num_points
+        # the generators ask for one row per particle: build each design once
+        key = (dim, seed, total)
+        if key not in _LHS_CACHE:
+            _LHS_CACHE[key] = qmc.LatinHypercube(dim, seed=seed).random(total)
+        return _LHS_CACHE[key][start_index:start_index + num_points].copy()
+    raise ValueError("unknown design method '{}'".format(method))
+
+
+def shard_range(total, shard, num_shards):
+    """
+    Contiguous block of rows owned by one of num_shards workers.
+
+    Returns:
+    - (start_index, num_points) to pass to generate_params_batch / design_points
+    """
+    if not 0 <= shard < num_shards:
+        raise ValueError("shard must be in [0, {})".format(num_shards))
+    size = -(-total // num_shards)
+    start = min(shard * size, total)
+    return start, min(size, total - start)
+
+
+def mean_particle_volume(spec, num_points=4096):
+    """
+    Expected volume pi/6 * E[D^3] of a D_eq distribution spec.
+
+    Evaluated on a midpoint grid of the inverse CDF (deterministic), e.g. to
+    estimate how many particles fill a volume budget.
+    """
+    u = (np.arange(num_points) + 0.5) / num_points
+    return np.pi / 6.0 * np.mean(distribution_ppf(spec, u) ** 3)
+
+
+def _sample_transition(params, schedule, index, rng):
+    """Fill params for particle indices following a staged transition schedule"""
+    cycle = schedule.get('cycle', len(index))
+    stages = schedule.get('stages', 1)
+    stage = (index % cycle) * stages // cycle
+    k = stage / max(stages - 1, 1)
+    start, end = schedule['start'], schedule['end']
+    jitter = schedule.get('jitter', {})
+    for name in start:
+        value = start[name] + k * (end[name] - start[name])
+        if name in jitter:
+            half = jitter[name][0] + k * (jitter[name][1] - jitter[name][0])
+            value = value + rng.uniform(-1.0, 1.0, len(index)) * half
+        if params.dtype[name].kind == 'i':
+            value = np.floor(value + 1e-9).astype(int)
+        params[name] = value
+    return stage
+
+
+def _mix_counts(recipe, num_particles):
+    """Exact number of particles per mix entry (the last entry takes the remainder)"""
+    fractions = np.array([entry[1] for entry in recipe['mix']], dtype=float)
+    counts = np.floor(num_particles * fractions / fractions.sum() + 0.5).astype(int)
+    counts[-1] = num_particles - counts[:-1].sum()
+    return counts
+
+
+def recipe_for_index(recipe, index, num_particles):
+    """
+    Recipe that generates particle index of an N-particle batch on its own.
+
+    For a category mix this is the sub-recipe of the category the particle falls
+    into (with 'category' set to the mix name), so single particles can be
+    redrawn without changing the category counts of the batch. Transition
+    schedules and designs without an explicit 'cycle' / 'total' get the batch
+    size, so that one-particle calls still walk through every stage and take
+    their rows from one design.
+    """
+    if 'mix' in recipe:
+        bounds = np.cumsum(_mix_counts(recipe, num_particles))
+        name, _, sub_recipe = recipe['mix'][int(np.searchsorted(bounds, index, side='right'))]
+        recipe = dict(sub_recipe, category=name)
+    if 'transition' in recipe and 'cycle' not in recipe['transition']:
+        recipe = dict(recipe, transition=dict(recipe['transition'], cycle=num_particles))
+    if 'design' in recipe and 'total' not in recipe['design']:
+        recipe = dict(recipe, design=dict(recipe['design'], total=num_particles))
+    return recipe
+
+
+def generate_params_batch(num_particles, recipe=None, rng=None, start_index=0):
+    """
+    Sample parameters for a whole batch of particles at once.
+
+    Parameters:
+    - num_particles: number of rows N
+    - recipe: recipe dict (default REGULAR_RECIPE), see module docstring
+    - rng: random state with the np.random interface (default the global np.random)
+    - start_index: index of the first particle, used by transition schedules
+      and designs (give each worker its own shard_range)
+
+    Returns:
+    - params: structured array of shape (N,) with dtype PARAM_DTYPE
+    """
+    if recipe is None:
+        recipe = REGULAR_RECIPE
+    if rng is None:
+        rng = np.random
+    params = np.zeros(num_particles, dtype=PARAM_DTYPE)
+    params['max_degree'] = 16
+    params['coeff_multiplier'] = 1.0
+
+    if 'mix' in recipe:
+        # exact counts per category, in the listed order
+        row = 0
+        for (name, _, sub_recipe), count in zip(recipe['mix'], _mix_counts(recipe, num_particles)):
+            sub = generate_params_batch(count, sub_recipe, rng, start_index + row)
+            sub['category'] = name
+            params[row:row + count] = sub
+            row += count
+        return params
+
+    category = recipe.get('category', 'regular')
+    params['category'] = category
+    if 'transition' in recipe:
+        index = start_index + np.arange(num_particles)
+        stage = _sample_transition(params, recipe['transition'], index, rng)
+        params['category'] = np.char.add(category + '_', stage.astype(str))
+    for name in PARAM_DTYPE.names:
+        if name in recipe and name != 'category':
+            params[name] = sample_distribution(recipe[name], num_particles, rng)
+    if 'design' in recipe:
+        design = recipe['design']
+        names = design['params']
+        u = design_points(num_particles, len(names), design.get('method', 'sobol'),
+                          design.get('seed', 0), start_index, design.get('total'))
+        for j, name in enumerate(names):
+            params[name] = distribution_ppf(recipe[name], u[:, j])
+    for name, (lo, hi) in recipe.get('clip', {}).items():
+        params[name] = np.clip(params[name], lo, hi)
+    if recipe.get('calibrate'):
+        from calibration import CALIBRATION_INPUTS, calibration_table, requested_for
+        settings = recipe['calibrate'] if isinstance(recipe['calibrate'], dict) else {}
+        # sampled values in input order target CALIBRATION_TARGETS in the same order
+        targets = np.column_stack([params[name] for name in CALIBRATION_INPUTS])
+        requested, _ = requested_for(calibration_table(**settings), targets)
+        for j, name in enumerate(CALIBRATION_INPUTS):
+            params[name] = requested[:, j]
+    return params
+
+
+def params_to_dict(row):
+    """Convert one structured parameter row to the params dict used by the generators"""
+    return {name: row[name].item() for name in PARAM_DTYPE.names}
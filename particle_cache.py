@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of generated particles
+
+A particle is fully determined by its sampled parameters (including
+max_degree and coeff_multiplier), the random stream it was drawn from
+(batch seed, particle key and retry attempt) and the output settings (base
+mesh size, refine_tol, scale_mode and the plotstl preview settings of the
+PNG). particle_key hashes exactly these into a stable SHA-256 key; the entry
+directory <cache_dir>/<key[:2]>/<key>/ holds
+the output files by role ('stl', 'png', 'mesh') and the particle details as
+JSON.
+
+On a hit the outputs are copied (or hard-linked) to the requested paths and
+generation is skipped. Entries are evicted least recently used first (entry
+mtimes, refreshed on every hit) once the cache exceeds its size cap.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+from json_utils import json_default
+
+# bump when generation changes in a way that invalidates cached particles
+CACHE_VERSION = 3
+
+
+def open_particle_cache(cache_dir, max_bytes=2 * 1024 ** 3, link=False):
+    """
+    Open (or create) a particle cache.
+
+    Parameters:
+    - cache_dir: cache directory
+    - max_bytes: size cap of all entries together
+    - link: hard-link cached files to the outputs instead of copying them
+
+    Returns:
+    - cache dict (entry sizes and access times are scanned once here)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    entries = {}
+    for prefix in os.listdir(cache_dir):
+        prefix_dir = os.path.join(cache_dir, prefix)
+        if not os.path.isdir(prefix_dir):
+            continue
+        for key in os.listdir(prefix_dir):
+            entry = os.path.join(prefix_dir, key)
+            if os.path.exists(os.path.join(entry, 'details.json')):
+                entries[key] = [_entry_size(entry), os.path.getmtime(entry)]
+    cache = {'dir': cache_dir, 'max_bytes': max_bytes, 'link': link, 'entries': entries,
+             'hits': 0, 'misses': 0}
+    _evict(cache)
+    return cache
+
+
+def _entry_size(entry):
+    """Total file size of one entry directory"""
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+
+def _entry_dir(cache, key):
+    return os.path.join(cache['dir'], key[:2], key)
+
+
+def particle_key(params, seed, key, attempt, settings):
+    """
+    Stable content hash of one particle attempt.
+
+    Parameters:
+    - params: sampled parameter dict
+    - seed, key, attempt: random stream of the attempt (see particle_rng)
+    - settings: dict of output settings (base mesh size, refine_tol, scale_mode, preview)
+
+    Returns:
+    - hex SHA-256 key
+    """
+    record = {
+        'version': CACHE_VERSION,
+        'params': params,
+        'stream': [seed, list(key), attempt],
+        'settings': settings
+    }
+    text = json.dumps(record, sort_keys=True, default=json_default)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def cache_fetch(cache, key, outputs):
+    """
+    Restore a cached particle.
+
+    Parameters:
+    - cache: particle cache
+    - key: particle_key of the attempt
+    - outputs: dict role -> output path ('stl', 'png', 'mesh'); roles with a
+      None path are not needed
+
+    Returns:
+    - cached details dict, or None on a miss (also when a needed role is missing)
+    """
+    entry = _entry_dir(cache, key)
+    wanted = {role: path for role, path in outputs.items() if path is not None}
+    files = {role: os.path.join(entry, role + os.path.splitext(path)[1])
+             for role, path in wanted.items()}
+    if key not in cache['entries'] or not all(os.path.exists(f) for f in files.values()):
+        cache['misses'] += 1
+        return None
+    for role, path in wanted.items():
+        if os.path.lexists(path):
+            os.remove(path)
+        if cache['link']:
+            try:
+                os.link(files[role], path)
+                continue
+            except OSError:
+                pass
+        shutil.copyfile(files[role], path)
+    with open(os.path.join(entry, 'details.json')) as f:
+        details = json.load(f)
+    os.utime(entry)
+    cache['entries'][key][1] = os.path.getmtime(entry)
+    cache['hits'] += 1
+    return details
+
+
+def cache_store(cache, key, outputs, details):
+    """
+    Store a generated particle and evict least recently used entries over the cap.
+
+    Parameters:
+    - cache: particle cache
+    - key: particle_key of the attempt
+    - outputs: dict role -> written output path (None roles are skipped)
+    - details: particle details (JSON-serializable up to NumPy scalars)
+    """
+    entry = _entry_dir(cache, key)
+    os.makedirs(entry, exist_ok=True)
+    for role, path in outputs.items():
+        if path is not None and os.path.exists(path):
+            shutil.copyfile(path, os.path.join(entry, role + os.path.splitext(path)[1]))
+    with open(os.path.join(entry, 'details.json'), 'w') as f:
+        json.dump(details, f, default=json_default)
+    cache['entries'][key] = [_entry_size(entry), os.path.getmtime(entry)]
+    _evict(cache, keep=key)
+
+
+def _evict(cache, keep=None):
+    """Remove the least recently used entries until the cache fits its cap"""
+    entries = cache['entries']
+    total = sum(size for size, _ in entries.values())
+    for key in sorted(entries, key=lambda k: entries[k][1]):
+        if total <= cache['max_bytes']:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(_entry_dir(cache, key), ignore_errors=True)
+        total -= entries.pop(key)[0]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight core of particle generation: coefficients and reconstruction
+
+NumPy-only entry point for worker processes and coefficient-only runs. It
+imports neither matplotlib nor numpy-stl nor scipy (those are loaded by
+funcs.plotstl / funcs.save_stl and the optional analyses only when used), so
+a fresh process can start generating within milliseconds.
+particle_generator re-exports generate_coeffs, generate_coeffs_batch and
+particle_rng from here.
+"""
+
+import numpy as np
+
+from SHPSG import SHPSG, SHPSG_batch
+from sh_basis import get_basis, sh_degree, sh_reconstruct
+
+
+def generate_coeffs(Ei, Fi, D2_8, D9_15, max_degree=16, coeff_multiplier=1.0, rng=None):
+    """
+    Generate spherical harmonics coefficients with morphological control.
+    
+    Parameters:
+    - Ei: Elongation index (b/a), range [0.5, 1.0]
+    - Fi: Flatness index (c/b), range [0.5, 1.0]
+    - D2_8: Angularity descriptor, range [0.0, 0.4]
+    - D9_15: Roughness descriptor, range [0.0, 0.2]
+    - max_degree: Maximum SH degree (default 16), can be 8-50 for weird particles
+    - coeff_multiplier: Multiply coefficients by this factor (1.0 for regular, 5-10 for weird)
+    - rng: random state (np.random interface), default the global np.random
+    
+    Returns:
+    - coeff: SH coefficients matrix (max_degree^2 x 3 complex)
+    """
+    # Call the original SHPSG function which handles all the math
+    coeff = SHPSG(Ei, Fi, D2_8, D9_15, rng=rng)
+    
+    # Apply coefficient multiplier for extreme geometries
+    if coeff_multiplier != 1.0:
+        coeff = coeff * coeff_multiplier
+    
+    return coeff
+
+
+def generate_coeffs_batch(params, rng=None):
+    """
+    Vectorized generate_coeffs for a whole batch of particles.
+    
+    Parameters:
+    - params: structured parameter array from param_sampler.generate_params_batch
+    - rng: random state (np.random interface), default the global np.random
+    
+    Returns:
+    - coeff: SH coefficients tensor (N x 256 x 3 complex)
+    """
+    coeff = SHPSG_batch(params['Ei'], params['Fi'], params['D2_8'], params['D9_15'], rng=rng)
+    return coeff * params['coeff_multiplier'][:, None, None]
+
+
+def particle_rng(seed, *key):
+    """
+    Deterministic random stream for one particle attempt.
+    
+    The stream depends only on (seed, *key), e.g. (seed, index, attempt), so a
+    particle that is redrawn uses its own sub-stream and leaves every other
+    particle of the batch unchanged.
+    
+    Returns:
+    - np.random.RandomState (same interface as np.random)
+    """
+    return np.random.RandomState(np.random.SeedSequence([seed] + list(key)).generate_state(4))
+
+
+def reconstruct_particles(coeff, level=2, D_eq=None):
+    """
+    Surface points of one particle or a batch on the cached base icosphere.
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) SH coefficients
+    - level: icosphere subdivision level of the base mesh
+    - D_eq: scalar or (N,) equivalent diameters; the unit shape is scaled by
+      D_eq/2 as in scale_mode='radius' (default: unit shape)
+
+    Returns:
+    - xyz: (V, 3) or (N, V, 3) surface points
+    - faces: (F, 3) face array shared by all particles
+    """
+    coeff = np.asarray(coeff)
+    base = get_basis(level, sh_degree(coeff))
+    xyz = sh_reconstruct(coeff, base['Y'])
+    if D_eq is not None:
+        xyz = xyz * (np.asarray(D_eq, dtype=float)[..., None, None] / 2.0)
+    return xyz, base['faces']
@@ -8,57 +8,63 @@ Supports:
 - Mixed morphology generation (Regular + Weird particles)
 """
 
+import os
 import numpy as np
-from SHPSG import SHPSG
-from funcs import icosahedron, subdivsurf, cleanmesh, car2sph, sh2stl, plotstl
+from particle_core import generate_coeffs, particle_rng
+from funcs import (icosahedron, subdivsurf, cleanmesh, car2sph, plotstl,
+                   sh_mesh, scale_mesh, save_stl)
+from mass_properties import mass_properties, mesh_triangles, mass_metadata
+from validity import check_validity
+from mesh_io import write_mesh
+from descriptors import shape_descriptors
+from morphometry import morphometry, morphometry_metadata
+from shape_index import build_shape_index, add_to_index, is_duplicate, save_shape_index
+from particle_cache import particle_key, cache_fetch, cache_store
+from build_stages import (STAGES, stage_fingerprints, load_manifest, save_manifest,
+                          load_stage_arrays, save_stage_arrays)
+from shared_basis import publish_basis, attach_basis, release_basis
+from param_sampler import (generate_params_batch, params_to_dict, recipe_for_index,
+                           sample_distribution, GRADUAL_RECIPE)
 
 
-def generate_coeffs(Ei, Fi, D2_8, D9_15, max_degree=16, coeff_multiplier=1.0):
-    """
-    Generate spherical harmonics coefficients with morphological control.
-    
-    Parameters:
-    - Ei: Elongation index (b/a), range [0.5, 1.0]
-    - Fi: Flatness index (c/b), range [0.5, 1.0]
-    - D2_8: Angularity descriptor, range [0.0, 0.4]
-    - D9_15: Roughness descriptor, range [0.0, 0.2]
-    - max_degree: Maximum SH degree (default 16), can be 8-50 for weird particles
-    - coeff_multiplier: Multiply coefficients by this factor (1.0 for regular, 5-10 for weird)
-    
-    Returns:
-    - coeff: SH coefficients matrix (max_degree^2 x 3 complex)
-    """
-    # Call the original SHPSG function which handles all the math
-    coeff = SHPSG(Ei, Fi, D2_8, D9_15)
-    
-    # Apply coefficient multiplier for extreme geometries
-    if coeff_multiplier != 1.0:
-        coeff = coeff * coeff_multiplier
-    
-    return coeff
-
-
-def generate_random_particle_params(category='regular', particle_index=None, total_particles=50):
+def generate_random_particle_params(category='regular', particle_index=None, total_particles=50,
+                                    rng=None, D_eq_dist=None, cycle=None):
     """
     Generate random morphological parameters for a unique particle.
     
     Parameters:
     - category: 'regular' (realistic rock-like) or 'weird' (extreme spikes/hollows)
-    - particle_index: if provided, enables gradual morphology transition (0-49)
+    - particle_index: if provided, enables gradual morphology transition (position
+      within the cycle)
     - total_particles: total number of particles in batch
+    - rng: random state (np.random interface), default the global np.random
+    - D_eq_dist: particle size distribution spec for D_eq, e.g. ('rosin_rammler', 60, 3)
+      (see param_sampler); default None keeps uniform 30-90 micrometers
+    - cycle: length of the gradual transition cycle, default that of
+      param_sampler.GRADUAL_RECIPE (50 particles)
     
     Returns:
     - params: dict with keys Ei, Fi, D2_8, D9_15, D_eq, max_degree, coeff_multiplier, category
     """
+    if rng is None:
+        rng = np.random
+    if D_eq_dist is not None:
+        params = generate_random_particle_params(category, particle_index, total_particles, rng,
+                                                 cycle=cycle)
+        params['D_eq'] = float(sample_distribution(D_eq_dist, 1, rng)[0])
+        return params
+    
     # If particle_index is provided, use gradual transition mode
     if particle_index is not None:
-        # Gradual transition from regular (k=0) to extremely weird (k=1)
-        # With 50-particle cycle: resets every 50 particles
-        particle_index_in_cycle = particle_index % 50  # 0-49 repeating
+        # Gradual transition from regular (k=0) to extremely weird (k=1),
+        # restarting every cycle (the schedule of GRADUAL_RECIPE)
+        schedule = GRADUAL_RECIPE['transition']
+        if cycle is None:
+            cycle = schedule['cycle']
         
-        # Divide 50 particles into 5 groups of 10
-        group = particle_index_in_cycle // 10  # 0-4
-        k = group / 4.0              # 0.0 to 1.0 (gradual factor)
+        # Divide the cycle into 5 equal groups
+        group = (particle_index % cycle) * schedule['stages'] // cycle  # 0-4
+        k = group / (schedule['stages'] - 1.0)  # 0.0 to 1.0 (gradual factor)
         
         # Form parameters: transition from near-spherical (0.9) to strange (0.4)
         ei_regular, ei_strange = 0.9, 0.4
@@ -70,20 +76,20 @@ def generate_random_particle_params(category='regular', particle_index=None, tot
         # Add randomness within a shrinking range
         ei_range = 0.15 * (1 - k)  # Range decreases with k
         fi_range = 0.15 * (1 - k)
-        ei_value += np.random.uniform(-ei_range, ei_range)
-        fi_value += np.random.uniform(-fi_range, fi_range)
+        ei_value += rng.uniform(-ei_range, ei_range)
+        fi_value += rng.uniform(-fi_range, fi_range)
         
         # Roundness (D2_8): transition from 0.05 (smooth) to 0.4 (angular)
         d2_8_base_min = 0.05
         d2_8_base_max = 0.1
         d2_8_value = d2_8_base_min + k * (d2_8_base_max * 3.0 - d2_8_base_min)
-        d2_8_value += np.random.uniform(-0.03, 0.03)  # Small random perturbation
+        d2_8_value += rng.uniform(-0.03, 0.03)  # Small random perturbation
         
         # Roughness (D9_15): transition from near-0 to 0.25
         d9_15_base_min = 0.0
         d9_15_base_max = 0.05
         d9_15_value = d9_15_base_min + k * (d9_15_base_max * 5.0)
-        d9_15_value += np.random.uniform(-0.02, 0.02)  # Small random perturbation
+        d9_15_value += rng.uniform(-0.02, 0.02)  # Small random perturbation
         
         # max_degree: gradually increase from 8 to 16 for more complexity
         max_degree_value = int(8 + k * 8)
@@ -96,7 +102,7 @@ def generate_random_particle_params(category='regular', particle_index=None, tot
             'Fi': np.clip(fi_value, 0.3, 1.0),
             'D2_8': np.clip(d2_8_value, 0.0, 0.4),
             'D9_15': np.clip(d9_15_value, 0.0, 0.3),
-            'D_eq': np.random.uniform(30, 90),      # Size remains random
+            'D_eq': rng.uniform(30, 90),      # Size remains random
             'max_degree': max_degree_value,
             'coeff_multiplier': coeff_mult_value,
             'category': 'gradual_' + str(group)
@@ -107,25 +113,25 @@ def generate_random_particle_params(category='regular', particle_index=None, tot
     if category == 'regular':
         # Irregular particles with "strange" morphology - enhanced angularity and roughness
         params = {
-            'Ei': np.random.uniform(0.4, 0.7),      # Highly elongated (breaks spherical form)
-            'Fi': np.random.uniform(0.4, 0.7),      # Significantly flattened (breaks spherical form)
-            'D2_8': np.random.uniform(0.2, 0.45),   # Enhanced angularity with macroscopic features
-            'D9_15': np.random.uniform(0.08, 0.25), # Increased roughness for surface texture
-            'D_eq': np.random.uniform(30, 90),      # Equivalent diameter: 30-90 micrometers
-            'max_degree': np.random.randint(12, 18),# Increased SH degree: 12-17 for more detail
+            'Ei': rng.uniform(0.4, 0.7),      # Highly elongated (breaks spherical form)
+            'Fi': rng.uniform(0.4, 0.7),      # Significantly flattened (breaks spherical form)
+            'D2_8': rng.uniform(0.2, 0.45),   # Enhanced angularity with macroscopic features
+            'D9_15': rng.uniform(0.08, 0.25), # Increased roughness for surface texture
+            'D_eq': rng.uniform(30, 90),      # Equivalent diameter: 30-90 micrometers
+            'max_degree': rng.randint(12, 18),# Increased SH degree: 12-17 for more detail
             'coeff_multiplier': 1.2,                # Slight amplification for more pronounced features
             'category': 'regular'
         }
     elif category == 'weird':
         # Extreme particles with spikes and hollows
         params = {
-            'Ei': np.random.uniform(0.2, 0.5),      # Highly elongated
-            'Fi': np.random.uniform(0.1, 0.4),      # Highly flattened
-            'D2_8': np.random.uniform(0.2, 0.4),    # High angularity
-            'D9_15': np.random.uniform(0.1, 0.2),   # High roughness
-            'D_eq': np.random.uniform(30, 90),      # Equivalent diameter: 30-90 micrometers
-            'max_degree': np.random.randint(30, 51),# SH degree: 30-50 for extreme features
-            'coeff_multiplier': np.random.uniform(5, 10),  # Amplified coefficients (5-10x)
+            'Ei': rng.uniform(0.2, 0.5),      # Highly elongated
+            'Fi': rng.uniform(0.1, 0.4),      # Highly flattened
+            'D2_8': rng.uniform(0.2, 0.4),    # High angularity
+            'D9_15': rng.uniform(0.1, 0.2),   # High roughness
+            'D_eq': rng.uniform(30, 90),      # Equivalent diameter: 30-90 micrometers
+            'max_degree': rng.randint(30, 51),# SH degree: 30-50 for extreme features
+            'coeff_multiplier': rng.uniform(5, 10),  # Amplified coefficients (5-10x)
             'category': 'weird'
         }
     else:
@@ -134,18 +140,324 @@ def generate_random_particle_params(category='regular', particle_index=None, tot
     return params
 
 
-def generate_regular_particle_params():
+def generate_regular_particle_params(rng=None):
     """Generate parameters for a regular (realistic) particle"""
-    return generate_random_particle_params(category='regular')
+    return generate_random_particle_params(category='regular', rng=rng)
 
 
-def generate_weird_particle_params():
+def generate_weird_particle_params(rng=None):
     """Generate parameters for a weird (extreme) particle"""
-    return generate_random_particle_params(category='weird')
+    return generate_random_particle_params(category='weird', rng=rng)
+
+
+def container_fill_volume(diameter, height, fill_fraction=0.6):
+    """
+    Solid volume budget of a cylindrical container.
+    
+    Parameters:
+    - diameter, height: container size (micrometers)
+    - fill_fraction: target solid fraction of the container volume
+    
+    Returns:
+    - target volume (cubic micrometers), for the target_volume option of the batch generators
+    """
+    return fill_fraction * np.pi * diameter ** 2 / 4.0 * height
+
+
+# numerical failures of an attempt (degenerate parameters or meshes): the particle is
+# redrawn; any other exception is a programming error and propagates
+ATTEMPT_ERRORS = (ValueError, ArithmeticError)
+
+
+def _invalid_reason(details):
+    """Retry reason of a particle whose mesh failed check_validity"""
+    return "invalid mesh ({:.0%} of the volume folded; {} inverted faces, {} self-intersections)".format(
+        details['folded_volume'], details['inverted_faces'], details['self_intersections'])
+
+
+def _replace_output(path):
+    """Remove an output file before rewriting it (it may be a hard link into a particle cache)"""
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def particle_details(scaled, faces, realized, max_folded=None):
+    """
+    Metadata of a written particle mesh: mass properties, validity and morphometry.
+    
+    Parameters:
+    - scaled: (V, 3) scaled surface points
+    - faces: (F, 3) face indices
+    - realized: realized descriptors of the coefficients (see descriptors.shape_descriptors)
+    - max_folded: folded volume tolerance of check_validity (None: strict)
+    
+    Returns:
+    - details dict (see generate_particle)
+    """
+    props = mass_properties(mesh_triangles(scaled, faces))
+    details = mass_metadata(props)
+    details.update(check_validity(scaled, faces, center=props['centroid'], max_folded=max_folded))
+    details.update(morphometry_metadata(morphometry(scaled, faces, props)))
+    details['realized'] = realized
+    return details
+
+
+def _stage_plan(job, params, attempt):
+    """Stage fingerprints of an attempt and which stages can be reused (incremental mode)"""
+    stages = stage_fingerprints(params, (job['seed'], list(job['key']), attempt),
+                                {'base_mesh': job['settings']['base_mesh'],
+                                 'refine_tol': job['refine_tol']},
+                                job['scale_mode'], job['preview'],
+                                {'max_folded': job['max_folded']})
+    build = job['build']
+    done = build['manifest']['stages'] if build is not None else {}
+    reuse = {stage: done.get(stage) == stages[stage] for stage in STAGES}
+    if build is None:
+        reuse['arrays'] = {}
+    else:
+        reuse['arrays'] = build['arrays']
+    return stages, reuse
+
+
+def _particle_coeffs(params, rng, reuse):
+    """SH coefficients of an attempt (stored ones if the coefficient stage is unchanged)"""
+    if reuse['coeff'] and 'coeff' in reuse['arrays']:
+        return reuse['arrays']['coeff']
+    return generate_coeffs(
+        params['Ei'],
+        params['Fi'],
+        params['D2_8'],
+        params['D9_15'],
+        max_degree=params.get('max_degree', 16),
+        coeff_multiplier=params.get('coeff_multiplier', 1.0),
+        rng=rng
+    )
+
+
+def _duplicate_reason(job, params, realized):
+    """Retry reason of a near-duplicate of an indexed particle, None if it is new"""
+    if job['shape_index'] is None or job['unique_tol'] is None:
+        return None
+    duplicate, other = is_duplicate(job['shape_index'], job['unique_tol'],
+                                    D_eq=params['D_eq'], **realized)
+    return "near-duplicate of particle {}".format(other) if duplicate else None
+
+
+def _particle_mesh(job, coeff, reuse):
+    """Unit-shape surface points and faces (stored ones if the mesh stage is unchanged)"""
+    arrays = reuse['arrays']
+    if reuse['mesh'] and 'xyz' in arrays:
+        return arrays['xyz'], arrays['faces']
+    sph_cor, vertices, faces, basis = job['geometry']
+    xyz, _, mesh_faces = sh_mesh(coeff, sph_cor, vertices.copy(), faces, job['refine_tol'], Y=basis)
+    return xyz, mesh_faces
+
+
+def _write_outputs(job, params, scaled, faces, reuse):
+    """Write the STL, the indexed mesh and the PNG that are missing or out of date"""
+    outputs = job['outputs']
+    rewrite = not (reuse['stl'] and os.path.exists(outputs['stl']))
+    if rewrite:
+        _replace_output(outputs['stl'])
+        save_stl(outputs['stl'], scaled, faces)
+    if outputs['mesh'] is not None and (rewrite or not os.path.exists(outputs['mesh'])):
+        _replace_output(outputs['mesh'])
+        write_mesh(outputs['mesh'], scaled, faces)
+    if outputs['png'] is not None and not (reuse['png'] and os.path.exists(outputs['png'])):
+        _replace_output(outputs['png'])
+        plotstl(outputs['stl'], outputs['png'], D_eq=params['D_eq'], **job['preview'])
+
+
+def _attempt_particle(job, params, rng, attempt):
+    """
+    One attempt of generate_particle.
+    
+    Returns:
+    - (details, None) on success, (None, reason) if the attempt is rejected
+    """
+    # Identical particle generated before: restore its outputs
+    cache_id = cached = None
+    if job['cache'] is not None:
+        cache_id = particle_key(params, job['seed'], job['key'], attempt, job['settings'])
+        cached = cache_fetch(job['cache'], cache_id, job['outputs'])
+    if cached is not None:
+        reason = _duplicate_reason(job, params, cached['realized'])
+        if reason is None and job['require_valid'] and not cached['valid']:
+            reason = _invalid_reason(cached)
+        return (None, reason) if reason else (cached, None)
+    
+    # Stages whose inputs are unchanged since the last run (incremental mode)
+    stages, reuse = _stage_plan(job, params, attempt)
+    build = job['build']
+    rejected = build['manifest']['rejected'] if build is not None else {}
+    if job['require_valid'] and stages['metadata'] in rejected:
+        return None, rejected[stages['metadata']]
+    
+    # Coefficients; near-duplicates are rejected before any meshing
+    coeff = _particle_coeffs(params, rng, reuse)
+    realized = shape_descriptors(coeff)
+    realized = {k: float(realized[k]) for k in ('Ei', 'Fi', 'D2_8', 'D9_15')}
+    reason = _duplicate_reason(job, params, realized)
+    if reason:
+        return None, reason
+    
+    # Unit-shape mesh scaled with D_eq, then the details of the written mesh
+    xyz, mesh_faces = _particle_mesh(job, coeff, reuse)
+    scaled = scale_mesh(xyz, mesh_faces, params['D_eq'], job['scale_mode'])
+    if reuse['metadata'] and build['manifest']['details'] is not None:
+        details = build['manifest']['details']
+    else:
+        details = particle_details(scaled, mesh_faces, realized, job['max_folded'])
+    if job['require_valid'] and not details['valid']:
+        reason = _invalid_reason(details)
+        if build is not None:
+            build['manifest']['rejected'][stages['metadata']] = reason
+            save_manifest(job['outputs']['stl'], build['manifest'])
+        return None, reason
+    
+    _write_outputs(job, params, scaled, mesh_faces, reuse)
+    if build is not None:
+        if not (reuse['mesh'] and 'xyz' in build['arrays']):
+            build['arrays'] = {'coeff': coeff, 'xyz': xyz, 'faces': mesh_faces}
+            save_stage_arrays(job['outputs']['stl'], **build['arrays'])
+        build['manifest']['stages'] = stages
+        build['manifest']['details'] = details
+        save_manifest(job['outputs']['stl'], build['manifest'])
+    if job['cache'] is not None:
+        cache_store(job['cache'], cache_id, job['outputs'], details)
+    return details, None
+
+
+def generate_particle(make_params, stl_filename, png_filename, sph_cor, vertices, faces,
+                      seed, key, max_retries=5, require_valid=False, max_folded=None,
+                      refine_tol=None, scale_mode='radius', mesh_filename=None,
+                      shape_index=None, unique_tol=None, cache=None,
+                      incremental=False, preview=None, basis=None):
+    """
+    Generate and save one particle, redrawing its parameters on failure.
+    
+    Each attempt draws parameters and coefficients from particle_rng(seed, *key, attempt).
+    An attempt fails when it raises one of ATTEMPT_ERRORS (degenerate parameters or
+    meshes), when it is a near-duplicate, or (with require_valid) when check_validity
+    judges its mesh invalid; the particle is then redrawn from the next sub-stream, up
+    to max_retries times. Other exceptions propagate.
+    
+    Parameters:
+    - make_params: callable rng -> params dict (e.g. generate_regular_particle_params)
+    - stl_filename: output STL path
+    - png_filename: output PNG path, None to skip the PNG
+    - sph_cor, vertices, faces: base mesh geometry
+    - seed: base seed of the batch
+    - key: tuple of ints identifying the particle within the batch
+    - max_retries: maximum number of redraws after the first attempt
+    - require_valid: also redraw particles whose mesh fails the validity checks
+      (off by default; validity is recorded in the details either way)
+    - max_folded: folded volume tolerance of check_validity. None (default) is strict:
+      about half of the regular and nearly all weird particles have self-intersecting
+      wrinkles, so require_valid alone needs a much larger max_retries (and rarely finds
+      an intersection-free weird particle). A fraction accepts wrinkled meshes whose folded volume is
+      at most that fraction (the generator's own output stays below 0.15 at level 2)
+    - refine_tol, scale_mode: meshing and scaling as in funcs.sh2stl
+    - mesh_filename: optional indexed mesh path (.ply or .obj, see mesh_io) written
+      alongside the STL
+    - shape_index, unique_tol: with both given, an attempt whose realized descriptors
+      and D_eq lie within unique_tol (scaled distance, see shape_index) of an indexed
+      particle is rejected as a near-duplicate and redrawn
+    - cache: particle cache (see particle_cache.open_particle_cache); attempts whose
+      parameters, random stream, meshing and preview settings were generated before
+      restore the cached outputs instead of generating them again
+    - incremental: keep per-stage fingerprints next to the outputs (see build_stages)
+      and redo only the stages whose inputs changed since the last run
+    - preview: dict of plotstl preview settings (dpi, elev, azim, color)
+    - basis: precomputed SH basis of the base mesh (see funcs.sh_mesh), e.g. the
+      shared basis of a worker process
+    
+    Returns:
+    - params: parameters of the successful attempt
+    - details: dict with mass properties, validity results, morphometry, realized descriptors
+      ('realized', see descriptors.shape_descriptors), 'retries' and 'retry_reasons'
+    
+    Raises:
+    - RuntimeError if every attempt failed
+    """
+    job = {
+        'outputs': {'stl': stl_filename, 'png': png_filename, 'mesh': mesh_filename},
+        'settings': {'base_mesh': [len(vertices), len(faces)], 'refine_tol': refine_tol,
+                     'scale_mode': scale_mode, 'preview': preview or {},
+                     'max_folded': max_folded},
+        'geometry': (sph_cor, vertices, faces, basis),
+        'seed': seed, 'key': key, 'require_valid': require_valid, 'max_folded': max_folded,
+        'refine_tol': refine_tol, 'scale_mode': scale_mode, 'preview': preview or {},
+        'shape_index': shape_index, 'unique_tol': unique_tol, 'cache': cache,
+        'build': None
+    }
+    if incremental:
+        job['build'] = {'manifest': load_manifest(stl_filename),
+                        'arrays': load_stage_arrays(stl_filename)}
+    reasons = []
+    for attempt in range(max_retries + 1):
+        rng = particle_rng(seed, *(tuple(key) + (attempt,)))
+        try:
+            params = make_params(rng)
+            details, reason = _attempt_particle(job, params, rng, attempt)
+        except ATTEMPT_ERRORS as e:
+            reason = str(e)
+        if reason is None:
+            return params, dict(details, retries=attempt, retry_reasons=reasons)
+        reasons.append(reason)
+    
+    raise RuntimeError("failed after {} attempts: {}".format(max_retries + 1, "; ".join(reasons)))
+
+
+def particle_options(max_retries=5, require_valid=False, max_folded=None, refine_tol=None,
+                     scale_mode='radius', unique_tol=None, cache=None, incremental=False,
+                     preview=None):
+    """
+    Per-particle options of generate_particle, collected once by every batch path.
+    
+    Parameters:
+    - see generate_particle
+    
+    Returns:
+    - dict of generate_particle keyword arguments
+    """
+    return {'max_retries': max_retries, 'require_valid': require_valid, 'max_folded': max_folded,
+            'refine_tol': refine_tol, 'scale_mode': scale_mode, 'unique_tol': unique_tol,
+            'cache': cache, 'incremental': incremental, 'preview': preview}
+
+
+def generate_batch_particle(batch, name, key, make_params, shape_index=None):
+    """
+    Generate one named particle of a batch with the options of the batch.
+    
+    Parameters:
+    - batch: dict with 'output_dir', 'include_png', 'mesh_ext' (extension of the
+      indexed mesh, None for none), 'geometry' (sph_cor, vertices, faces, basis),
+      'seed' and 'options' (see particle_options)
+    - name: file name stem of the particle
+    - key, make_params, shape_index: see generate_particle
+    
+    Returns:
+    - params, details (see generate_particle) and the dict of output paths
+      ('stl', 'png', 'mesh'; None for outputs not written)
+    """
+    stem = "{}/{}".format(batch['output_dir'], name)
+    paths = {'stl': stem + '.stl',
+             'png': stem + '.png' if batch['include_png'] else None,
+             'mesh': stem + batch['mesh_ext'] if batch['mesh_ext'] else None}
+    sph_cor, vertices, faces, basis = batch['geometry']
+    params, details = generate_particle(
+        make_params, paths['stl'], paths['png'], sph_cor, vertices, faces, batch['seed'], key,
+        mesh_filename=paths['mesh'], shape_index=shape_index, basis=basis, **batch['options'])
+    return params, details, paths
 
 
 def batch_generate_particles(num_particles=50, output_dir='./data/particles', 
-                             include_png=True, verbose=True):
+                             include_png=True, verbose=True, refine_tol=None,
+                             scale_mode='radius', seed=None, max_retries=5,
+                             require_valid=False, max_folded=None, recipe=None,
+                             target_volume=None, unique_tol=None, cache=None, incremental=False,
+                             preview=None):
     """
     Generate a batch of particles with unique random attributes.
     
@@ -154,6 +466,26 @@ def batch_generate_particles(num_particles=50, output_dir='./data/particles',
     - output_dir: directory to save STL and PNG files
     - include_png: whether to generate PNG visualizations
     - verbose: whether to print progress information
+    - refine_tol: if given, mesh each particle adaptively to this tolerance
+      (unit-shape lengths, see funcs.adaptive_subdivsurf) instead of the uniform level-2 mesh
+    - scale_mode: 'radius' (unit shape times D_eq/2) or 'volume' (mesh volume equals
+      pi*D_eq^3/6, particle centred on its centroid), see funcs.sh2stl
+    - seed: base seed of the per-particle random streams (default: drawn from np.random)
+    - max_retries: redraws allowed per particle before the batch fails
+    - require_valid, max_folded: redraw particles whose mesh fails the validity checks,
+      with an optional folded volume tolerance (see generate_particle)
+    - recipe: parameter recipe for param_sampler.generate_params_batch; default
+      None keeps the gradual transition of generate_random_particle_params
+    - target_volume: fill budget (see container_fill_volume); particles are generated
+      until their total mesh volume reaches it, with num_particles as the upper limit
+      (and as the batch size seen by transition schedules and mixes)
+    - unique_tol: redraw particles closer than this to an earlier one in descriptor
+      space (see generate_particle); the shape index of the batch is saved as
+      shape_index.npz in output_dir either way
+    - cache: particle cache (see particle_cache.open_particle_cache) to skip
+      particles generated in earlier runs
+    - incremental, preview: redo only changed stages / plotstl preview settings,
+      see generate_particle
     
     Returns:
     - particle_list: list of generated particle metadata
@@ -173,54 +505,153 @@ def batch_generate_particles(num_particles=50, output_dir='./data/particles',
         vertices, faces = cleanmesh(faces, vertices)
     sph_cor = car2sph(vertices)
     
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    
+    batch = {
+        'output_dir': output_dir, 'include_png': include_png, 'mesh_ext': None,
+        'geometry': (sph_cor, vertices, faces, None), 'seed': seed,
+        'options': particle_options(max_retries, require_valid, max_folded, refine_tol,
+                                    scale_mode, unique_tol, cache, incremental, preview)
+    }
     particle_list = []
+    total_volume = 0.0
+    index = build_shape_index()
     
     for i in range(num_particles):
+        if target_volume is not None and total_volume >= target_volume:
+            break
         if verbose and (i + 1) % 10 == 0:
             print("Generating particle {}/{}...".format(i + 1, num_particles))
         
-        # Generate random parameters for this particle with gradual transition
-        params = generate_random_particle_params(particle_index=i, total_particles=num_particles)
-        
-        # Generate SH coefficients
-        coeff = generate_coeffs(
-            params['Ei'],
-            params['Fi'],
-            params['D2_8'],
-            params['D9_15'],
-            max_degree=params.get('max_degree', 16),
-            coeff_multiplier=params.get('coeff_multiplier', 1.0)
-        )
-        
-        # Create output filenames
-        stl_filename = "{}/particle_{:04d}.stl".format(output_dir, i)
-        png_filename = "{}/particle_{:04d}.png".format(output_dir, i) if include_png else None
-        
-        # Generate and save STL with scaling based on D_eq
-        vertices_copy = vertices.copy()
-        sh2stl(coeff, sph_cor, vertices_copy, faces, stl_filename, D_eq=params['D_eq'])
-        
-        # Generate PNG if requested
-        if include_png:
-            plotstl(stl_filename, png_filename, D_eq=params['D_eq'])
+        # Generate random parameters with gradual transition (or the recipe), coefficients, STL and PNG
+        if recipe is None:
+            make_params = lambda rng: generate_random_particle_params(
+                particle_index=i, total_particles=num_particles, rng=rng)
+        else:
+            particle_recipe = recipe_for_index(recipe, i, num_particles)
+            make_params = lambda rng: params_to_dict(
+                generate_params_batch(1, particle_recipe, rng, start_index=i)[0])
+        params, details, paths = generate_batch_particle(
+            batch, "particle_{:04d}".format(i), (i,), make_params, shape_index=index)
+        add_to_index(index, i, D_eq=params['D_eq'], **details['realized'])
         
         # Store metadata
-        particle_metadata = {
-            'index': i,
-            'filename': "particle_{:04d}".format(i),
-            'D_eq': params['D_eq'],
-            'Ei': params['Ei'],
-            'Fi': params['Fi'],
-            'D2_8': params['D2_8'],
-            'D9_15': params['D9_15'],
-            'stl_path': stl_filename,
-            'png_path': png_filename,
-            'category': params.get('category', 'regular')
+        particle_list.append(_particle_metadata(i, params, details, paths['stl'], paths['png']))
+        total_volume += details['volume']
+    
+    save_shape_index(os.path.join(output_dir, 'shape_index.npz'), index)
+    
+    if verbose:
+        print("Successfully generated {} particles!".format(len(particle_list)))
+        if target_volume is not None:
+            print("Filled {:.1f}% of the volume budget".format(100.0 * total_volume / target_volume))
+    
+    return particle_list
+
+
+def _particle_metadata(i, params, details, stl_filename, png_filename):
+    """Metadata record of particle i of a batch"""
+    particle_metadata = {
+        'index': i,
+        'filename': "particle_{:04d}".format(i),
+        'D_eq': params['D_eq'],
+        'Ei': params['Ei'],
+        'Fi': params['Fi'],
+        'D2_8': params['D2_8'],
+        'D9_15': params['D9_15'],
+        'stl_path': stl_filename,
+        'png_path': png_filename,
+        'category': params.get('category', 'regular')
+    }
+    particle_metadata.update(details)
+    return particle_metadata
+
+
+# state of a parallel_generate_particles worker process (set by _init_worker)
+_WORKER = {}
+
+
+def _init_worker(handle, settings):
+    """Pool initializer: attach the shared base mesh and basis"""
+    _WORKER['base'] = attach_basis(handle)
+    _WORKER.update(settings)
+
+
+def _generate_indexed(i):
+    """Generate particle i of a parallel batch (runs in a worker)"""
+    w = _WORKER
+    base = w['base']
+    if w['recipe'] is None:
+        make_params = lambda rng: generate_random_particle_params(
+            particle_index=i, total_particles=w['num_particles'], rng=rng)
+    else:
+        particle_recipe = recipe_for_index(w['recipe'], i, w['num_particles'])
+        make_params = lambda rng: params_to_dict(
+            generate_params_batch(1, particle_recipe, rng, start_index=i)[0])
+    batch = dict(w['batch'], geometry=(base['sph_cor'], base['vertices'], base['faces'], base['Y']))
+    params, details, paths = generate_batch_particle(
+        batch, "particle_{:04d}".format(i), (i,), make_params)
+    return i, params, details, paths['stl'], paths['png']
+
+
+def parallel_generate_particles(num_particles=50, output_dir='./data/particles', processes=None,
+                                include_png=True, verbose=True, refine_tol=None,
+                                scale_mode='radius', seed=None, max_retries=5,
+                                require_valid=False, max_folded=None, recipe=None,
+                                incremental=False, preview=None):
+    """
+    Generate a batch on a process pool that shares one base mesh and SH basis.
+    
+    The level-2 base mesh, its spherical coordinates and basis are published once in
+    shared memory (see shared_basis) and every worker uses zero-copy views of them.
+    Each particle is drawn from its own random stream, so the batch equals that of
+    batch_generate_particles with the same seed. Near-duplicate rejection, fill budgets
+    and the particle cache need the state of the whole batch and are only available
+    in batch_generate_particles.
+    
+    Parameters:
+    - processes: number of worker processes (default os.cpu_count())
+    - other parameters: see batch_generate_particles
+    
+    Returns:
+    - particle_list: list of generated particle metadata, in particle order
+    """
+    from multiprocessing import Pool
+    
+    os.makedirs(output_dir, exist_ok=True)
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    settings = {
+        'num_particles': num_particles, 'recipe': recipe,
+        'batch': {
+            'output_dir': output_dir, 'include_png': include_png, 'mesh_ext': None, 'seed': seed,
+            'options': particle_options(max_retries, require_valid, max_folded, refine_tol,
+                                        scale_mode, incremental=incremental, preview=preview)
         }
-        particle_list.append(particle_metadata)
+    }
+    
+    # SHPSG coefficients always have 16 degrees
+    handle = publish_basis(level=2, degree=16)
+    results = []
+    try:
+        with Pool(processes, initializer=_init_worker, initargs=(handle, settings)) as pool:
+            for result in pool.imap(_generate_indexed, range(num_particles)):
+                results.append(result)
+                if verbose and len(results) % 10 == 0:
+                    print("Generated particle {}/{}...".format(len(results), num_particles))
+    finally:
+        release_basis(handle)
+    
+    index = build_shape_index()
+    particle_list = []
+    for i, params, details, stl_filename, png_filename in results:
+        add_to_index(index, i, D_eq=params['D_eq'], **details['realized'])
+        particle_list.append(_particle_metadata(i, params, details, stl_filename, png_filename))
+    save_shape_index(os.path.join(output_dir, 'shape_index.npz'), index)
     
     if verbose:
-        print("Successfully generated {} particles!".format(num_particles))
+        print("Successfully generated {} particles!".format(len(particle_list)))
     
     return particle_list
 
@@ -229,7 +660,17 @@ def batch_generate_mixed_particles(output_dir='./Output_Batch',
                                    regular_count=40, 
                                    weird_count=10,
                                    include_png=True, 
-                                   verbose=True):
+                                   verbose=True,
+                                   refine_tol=None,
+                                   scale_mode='radius',
+                                   seed=None,
+                                   max_retries=5,
+                                   require_valid=False,
+                                   max_folded=None,
+                                   unique_tol=None,
+                                   cache=None,
+                                   incremental=False,
+                                   preview=None):
     """
     Generate a mixed batch of Regular and Weird particles.
     
@@ -239,6 +680,22 @@ def batch_generate_mixed_particles(output_dir='./Output_Batch',
     - weird_count: number of weird particles (default 10 = 20%)
     - include_png: whether to generate PNG visualizations
     - verbose: whether to print progress information
+    - refine_tol: if given, mesh each particle adaptively to this tolerance
+      (unit-shape lengths, see funcs.adaptive_subdivsurf) instead of the uniform level-2 mesh
+    - scale_mode: 'radius' (unit shape times D_eq/2) or 'volume' (mesh volume equals
+      pi*D_eq^3/6, particle centred on its centroid), see funcs.sh2stl
+    - seed: base seed of the per-particle random streams (default: drawn from np.random)
+    - max_retries: redraws allowed per particle before the batch fails
+    - require_valid, max_folded: redraw particles whose mesh fails the validity checks,
+      with an optional folded volume tolerance (see generate_particle)
+    - unique_tol: redraw particles closer than this to an earlier one in descriptor
+      space (see generate_particle); the shape index of the batch (ids are positions
+      in the returned list, regular particles first) is saved as shape_index.npz in
+      output_dir either way
+    - cache: particle cache (see particle_cache.open_particle_cache) to skip
+      particles generated in earlier runs
+    - incremental, preview: redo only changed stages / plotstl preview settings,
+      see generate_particle
     
     Returns:
     - particle_list: list of all generated particle metadata (regular + weird)
@@ -258,8 +715,18 @@ def batch_generate_mixed_particles(output_dir='./Output_Batch',
         vertices, faces = cleanmesh(faces, vertices)
     sph_cor = car2sph(vertices)
     
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    
+    batch = {
+        'output_dir': output_dir, 'include_png': include_png, 'mesh_ext': '.obj',
+        'geometry': (sph_cor, vertices, faces, None), 'seed': seed,
+        'options': particle_options(max_retries, require_valid, max_folded, refine_tol,
+                                    scale_mode, unique_tol, cache, incremental, preview)
+    }
     particle_list = []
     total_count = regular_count + weird_count
+    index = build_shape_index()
     
     # ====================================================================
     # GENERATE REGULAR PARTICLES (Category A)
@@ -273,55 +740,33 @@ def batch_generate_mixed_particles(output_dir='./Output_Batch',
         if verbose and (i + 1) % 10 == 0:
             print("Generating regular particle {}/{}...".format(i + 1, regular_count))
         
-        try:
-            # Generate random parameters for regular particle
-            params = generate_regular_particle_params()
-            
-            # Generate SH coefficients
-            coeff = generate_coeffs(
-                params['Ei'],
-                params['Fi'],
-                params['D2_8'],
-                params['D9_15'],
-                max_degree=params.get('max_degree', 16),
-                coeff_multiplier=params.get('coeff_multiplier', 1.0)
-            )
-            
-            # Create output filenames with naming convention
-            stl_filename = "{}/particle_reg_{:02d}.stl".format(output_dir, i + 1)
-            obj_filename = "{}/particle_reg_{:02d}.obj".format(output_dir, i + 1)
-            png_filename = "{}/particle_reg_{:02d}.png".format(output_dir, i + 1) if include_png else None
-            
-            # Generate and save STL with scaling based on D_eq
-            vertices_copy = vertices.copy()
-            sh2stl(coeff, sph_cor, vertices_copy, faces, stl_filename, D_eq=params['D_eq'])
-            
-            # Generate PNG if requested
-            if include_png:
-                plotstl(stl_filename, png_filename, D_eq=params['D_eq'])
-            
-            # Store metadata
-            particle_metadata = {
-                'index': i + 1,
-                'filename': "particle_reg_{:02d}".format(i + 1),
-                'D_eq': params['D_eq'],
-                'Ei': params['Ei'],
-                'Fi': params['Fi'],
-                'D2_8': params['D2_8'],
-                'D9_15': params['D9_15'],
-                'max_degree': params.get('max_degree', 16),
-                'coeff_multiplier': params.get('coeff_multiplier', 1.0),
-                'stl_path': stl_filename,
-                'obj_path': obj_filename,
-                'png_path': png_filename,
-                'category': 'regular'
-            }
-            particle_list.append(particle_metadata)
-            
-        except Exception as e:
-            if verbose:
-                print("ERROR generating regular particle {}: {}".format(i + 1, str(e)))
-            continue
+        # Generate parameters, coefficients, STL, OBJ and PNG (redrawn on failure)
+        params, details, paths = generate_batch_particle(
+            batch, "particle_reg_{:02d}".format(i + 1), (0, i), generate_regular_particle_params,
+            shape_index=index)
+        add_to_index(index, len(particle_list), D_eq=params['D_eq'], **details['realized'])
+        if verbose and details['retries']:
+            print("  Regular particle {} redrawn {} time(s): {}".format(
+                i + 1, details['retries'], "; ".join(details['retry_reasons'])))
+        
+        # Store metadata
+        particle_metadata = {
+            'index': i + 1,
+            'filename': "particle_reg_{:02d}".format(i + 1),
+            'D_eq': params['D_eq'],
+            'Ei': params['Ei'],
+            'Fi': params['Fi'],
+            'D2_8': params['D2_8'],
+            'D9_15': params['D9_15'],
+            'max_degree': params.get('max_degree', 16),
+            'coeff_multiplier': params.get('coeff_multiplier', 1.0),
+            'stl_path': paths['stl'],
+            'obj_path': paths['mesh'],
+            'png_path': paths['png'],
+            'category': 'regular'
+        }
+        particle_metadata.update(details)
+        particle_list.append(particle_metadata)
     
     # ====================================================================
     # GENERATE WEIRD PARTICLES (Category B)
@@ -335,55 +780,35 @@ def batch_generate_mixed_particles(output_dir='./Output_Batch',
         if verbose and (i + 1) % 5 == 0:
             print("Generating weird particle {}/{}...".format(i + 1, weird_count))
         
-        try:
-            # Generate random parameters for weird particle
-            params = generate_weird_particle_params()
-            
-            # Generate SH coefficients with extreme morphology
-            coeff = generate_coeffs(
-                params['Ei'],
-                params['Fi'],
-                params['D2_8'],
-                params['D9_15'],
-                max_degree=params.get('max_degree', 30),
-                coeff_multiplier=params.get('coeff_multiplier', 5.0)
-            )
-            
-            # Create output filenames with naming convention
-            stl_filename = "{}/particle_weird_{:02d}.stl".format(output_dir, i + 1)
-            obj_filename = "{}/particle_weird_{:02d}.obj".format(output_dir, i + 1)
-            png_filename = "{}/particle_weird_{:02d}.png".format(output_dir, i + 1) if include_png else None
-            
-            # Generate and save STL with scaling based on D_eq
-            vertices_copy = vertices.copy()
-            sh2stl(coeff, sph_cor, vertices_copy, faces, stl_filename, D_eq=params['D_eq'])
-            
-            # Generate PNG if requested
-            if include_png:
-                plotstl(stl_filename, png_filename, D_eq=params['D_eq'])
-            
-            # Store metadata
-            particle_metadata = {
-                'index': i + 1,
-                'filename': "particle_weird_{:02d}".format(i + 1),
-                'D_eq': params['D_eq'],
-                'Ei': params['Ei'],
-                'Fi': params['Fi'],
-                'D2_8': params['D2_8'],
-                'D9_15': params['D9_15'],
-                'max_degree': params.get('max_degree', 30),
-                'coeff_multiplier': params.get('coeff_multiplier', 5.0),
-                'stl_path': stl_filename,
-                'obj_path': obj_filename,
-                'png_path': png_filename,
-                'category': 'weird'
-            }
-            particle_list.append(particle_metadata)
-            
-        except Exception as e:
-            if verbose:
-                print("ERROR generating weird particle {}: {}".format(i + 1, str(e)))
-            continue
+        # Generate parameters, coefficients, STL, OBJ and PNG (redrawn on failure)
+        params, details, paths = generate_batch_particle(
+            batch, "particle_weird_{:02d}".format(i + 1), (1, i), generate_weird_particle_params,
+            shape_index=index)
+        add_to_index(index, len(particle_list), D_eq=params['D_eq'], **details['realized'])
+        if verbose and details['retries']:
+            print("  Weird particle {} redrawn {} time(s): {}".format(
+                i + 1, details['retries'], "; ".join(details['retry_reasons'])))
+        
+        # Store metadata
+        particle_metadata = {
+            'index': i + 1,
+            'filename': "particle_weird_{:02d}".format(i + 1),
+            'D_eq': params['D_eq'],
+            'Ei': params['Ei'],
+            'Fi': params['Fi'],
+            'D2_8': params['D2_8'],
+            'D9_15': params['D9_15'],
+            'max_degree': params.get('max_degree', 30),
+            'coeff_multiplier': params.get('coeff_multiplier', 5.0),
+            'stl_path': paths['stl'],
+            'obj_path': paths['mesh'],
+            'png_path': paths['png'],
+            'category': 'weird'
+        }
+        particle_metadata.update(details)
+        particle_list.append(particle_metadata)
+    
+    save_shape_index(os.path.join(output_dir, 'shape_index.npz'), index)
     
     if verbose:
         print("\n" + "=" * 80)
@@ -448,6 +873,19 @@ def save_particle_metadata(particle_list, output_file='./data/particles/metadata
                 min(p.get('coeff_multiplier', 1.0) for p in particle_list), 
                 max(p.get('coeff_multiplier', 1.0) for p in particle_list)))
         
+        if any('valid' in p for p in particle_list):
+            invalid = [p for p in particle_list if not p.get('valid', True)]
+            f.write("Invalid meshes: {} (inside out or folded through the body)\n".format(len(invalid)))
+        
+        if any('intersection_free' in p for p in particle_list):
+            crossing = [p for p in particle_list if not p.get('intersection_free', True)]
+            f.write("Self-intersecting meshes: {}\n".format(len(crossing)))
+        
+        if any('retries' in p for p in particle_list):
+            f.write("Redrawn particles: {} ({} retries in total)\n".format(
+                len([p for p in particle_list if p.get('retries', 0) > 0]),
+                sum(p.get('retries', 0) for p in particle_list)))
+        
         f.write("\n" + "=" * 100 + "\n\n")
         f.write("Individual Particle Data:\n")
         f.write("=" * 100 + "\n")
@@ -457,6 +895,12 @@ def save_particle_metadata(particle_list, output_file='./data/particles/metadata
             f.write(" {:<6}".format('L'))
         if any('coeff_multiplier' in p for p in particle_list):
             f.write(" {:<6}".format('Mult'))
+        if any('volume' in p for p in particle_list):
+            f.write(" {:<10} {:<12} {:<12} {:<6}".format('Dv(um)', 'Vol(um3)', 'Area(um2)', 'Sph'))
+        if any('valid' in p for p in particle_list):
+            f.write(" {:<6}".format('Valid'))
+        if any('retries' in p for p in particle_list):
+            f.write(" {:<6}".format('Retry'))
         f.write("\n")
         f.write("-" * 100 + "\n")
         
@@ -468,7 +912,55 @@ def save_particle_metadata(particle_list, output_file='./data/particles/metadata
                 line += " {:<6d}".format(p['max_degree'])
             if 'coeff_multiplier' in p:
                 line += " {:<6.1f}".format(p['coeff_multiplier'])
+            if 'volume' in p:
+                line += " {:<10.2f} {:<12.1f} {:<12.1f} {:<6.3f}".format(
+                    p['D_eq_volume'], p['volume'], p['surface_area'], p['sphericity'])
+            if 'valid' in p:
+                line += " {:<6}".format('yes' if p['valid'] else 'NO')
+            if 'retries' in p:
+                line += " {:<6d}".format(p['retries'])
             f.write(line + "\n")
+        
+        # Mass properties of the written meshes (unit density, about the centroid)
+        mass_particles = [p for p in particle_list if 'volume' in p]
+        if mass_particles:
+            f.write("\n" + "=" * 100 + "\n")
+            f.write("Mass Properties (unit density, inertia about centroid):\n")
+            f.write("=" * 100 + "\n")
+            f.write("{:<20} {:<30} {:<36}\n".format('Filename', 'Centroid (x, y, z)', 'Principal moments (I1, I2, I3)'))
+            f.write("-" * 100 + "\n")
+            for p in mass_particles:
+                f.write("{:<20} {:<30} {:<36}\n".format(
+                    p['filename'],
+                    "{:.3f} {:.3f} {:.3f}".format(*p['centroid']),
+                    "{:.4e} {:.4e} {:.4e}".format(*p['principal_moments'])))
+        
+        # Feret / PCA box / convexity measurements of the written meshes
+        morph_particles = [p for p in particle_list if 'convexity' in p]
+        if morph_particles:
+            f.write("\n" + "=" * 100 + "\n")
+            f.write("Morphometry (Feret and PCA box in um, convexity = volume / hull volume):\n")
+            f.write("=" * 100 + "\n")
+            f.write("{:<20} {:<10} {:<10} {:<10} {:<10} {:<10} {:<8} {:<8}\n".format(
+                'Filename', 'FeretMax', 'FeretMin', 'L', 'I', 'S', 'Convex', 'Sph'))
+            f.write("-" * 100 + "\n")
+            for p in morph_particles:
+                f.write("{:<20} {:<10.2f} {:<10.2f} {:<10.2f} {:<10.2f} {:<10.2f} {:<8.3f} {:<8.3f}\n".format(
+                    p['filename'], p['feret_max'], p['feret_min'], p['L'], p['I'], p['S'],
+                    p['convexity'], p['sphericity']))
+        
+        # Descriptors measured on the generated coefficients (see descriptors.py)
+        realized_particles = [p for p in particle_list if 'realized' in p]
+        if realized_particles:
+            f.write("\n" + "=" * 100 + "\n")
+            f.write("Realized Descriptors (measured on the SH coefficients):\n")
+            f.write("=" * 100 + "\n")
+            f.write("{:<20} {:<8} {:<8} {:<8} {:<8}\n".format('Filename', 'Ei', 'Fi', 'D2_8', 'D9_15'))
+            f.write("-" * 100 + "\n")
+            for p in realized_particles:
+                r = p['realized']
+                f.write("{:<20} {:<8.3f} {:<8.3f} {:<8.3f} {:<8.3f}\n".format(
+                    p['filename'], r['Ei'], r['Fi'], r['D2_8'], r['D9_15']))
 
 if __name__ == '__main__':
     """
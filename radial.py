@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Radial-function form of SHPSG particles
+
+SHPSG coefficients describe the surface as x(u) = sum_nm c_nm * Y_n^m(u), so
+a surface point generally does not lie in direction u. Unfolded particles are
+star-shaped about their centre, however, and can be written as a radial
+function r(direction) = sum_nm a_nm * Y_n^m(direction). Fitting a_nm once per
+particle turns inside/outside tests into a single basis evaluation:
+
+    a, center = radial_fit(coeff)
+    r = radial_function(a, phi, theta)          # (M,)
+
+The fit is a least-squares projection of dense surface samples (icosphere
+level 4 by default) onto the SH basis of the directions they lie in, with a
+small curvature penalty (n(n+1))^2 that keeps it bounded where folds leave
+directions unsampled.
+It reproduces star-shaped particles to the sampling accuracy; folded surfaces
+(see validity.inverted_faces) get a smoothed radius that averages the folds.
+"""
+
+import numpy as np
+
+from sh_basis import (sh_basis, sh_degree, sh_orders, sh_reconstruct, get_basis,
+                      legendre_basis, unit_directions)
+
+
+def direction_angles(points):
+    """Polar and azimuthal angles (phi, theta) of (M, 3) vectors"""
+    points = np.asarray(points, dtype=float)
+    r = np.linalg.norm(points, axis=-1)
+    phi = np.arccos(np.clip(points[..., 2] / np.where(r > 0, r, 1.0), -1.0, 1.0))
+    theta = np.arctan2(points[..., 1], points[..., 0])
+    return phi, theta
+
+
+def radial_fit(coeff, degree=None, level=4, smoothing=1e-6):
+    """
+    Radial SH coefficients of a star-shaped SHPSG surface.
+
+    Parameters:
+    - coeff: (L^2, 3) SH coefficients of the surface
+    - degree: number of SH degrees of the radial expansion (default L)
+    - level: icosphere level of the surface samples used for the fit
+    - smoothing: weight of the (n(n+1))^2 regularization, relative to the sample count
+
+    Returns:
+    - a: (degree^2,) complex radial coefficients, r = (Y @ a).real
+    - center: (3,) centre of the radial function (the degree-0 term of the surface)
+    """
+    if degree is None:
+        degree = sh_degree(coeff)
+    xyz = sh_reconstruct(coeff, get_basis(level, sh_degree(coeff))['Y'])
+    center = coeff[0].real * np.sqrt(1.0 / (4.0 * np.pi))
+    rel = xyz - center
+    phi, theta = direction_angles(rel)
+    Y = sh_basis(phi, theta, degree)
+    n, _ = sh_orders(degree)
+    A = Y.conj().T @ Y + smoothing * len(Y) * np.diag((n * (n + 1.0)) ** 2)
+    a = np.linalg.solve(A, Y.conj().T @ np.linalg.norm(rel, axis=1))
+    return a, center
+
+
+def radial_function(a, phi, theta):
+    """
+    Radius of the particle in the directions (phi, theta).
+
+    Parameters:
+    - a: (K^2,) radial coefficients from radial_fit
+    - phi, theta: polar and azimuthal angles, shape (M,)
+
+    Returns:
+    - r: (M,) radii
+    """
+    phi = np.asarray(phi, dtype=float)
+    return radial_function_rows(radial_weights(np.asarray(a)[None]), phi, theta,
+                                np.zeros(phi.shape, dtype=int))
+
+
+def radial_weights(A):
+    """
+    Real contraction weights of radial coefficients, shape (S, K^2, 2K).
+
+    r is real, so the complex basis is never formed: the Legendre table is
+    contracted per order |m| with these weights, then combined with cos(m*theta)
+    (first K columns) and sin(m*theta) (last K columns).
+
+    Parameters:
+    - A: (S, K^2) radial coefficients of S particles (radial_fit, zero-padded to
+      a common degree, see stack_radial)
+    """
+    A = np.asarray(A)
+    degree = sh_degree(A[0][:, None])
+    _, m = sh_orders(degree)
+    W = np.zeros((len(A), len(m), 2, degree))
+    W[:, np.arange(len(m)), 0, np.abs(m)] = A.real
+    W[:, np.arange(len(m)), 1, np.abs(m)] = -np.sign(m) * A.imag
+    return W.reshape(len(A), len(m), 2 * degree)
+
+
+def radial_function_rows(W, phi, theta, rows):
+    """
+    Radii of several particles at once: r[k] = r_rows[k](phi[k], theta[k]).
+
+    One Legendre table is built for all directions, so testing points against
+    many particles costs one basis evaluation instead of one per particle.
+
+    Parameters:
+    - W: (S, K^2, 2K) weights of S particles from radial_weights
+    - phi, theta: polar and azimuthal angles, shape (M,)
+    - rows: (M,) particle of every direction
+
+    Returns:
+    - r: (M,) radii
+    """
+    rows = np.asarray(rows)
+    degree = W.shape[2] // 2
+    P = legendre_basis(phi, degree)
+    T = np.empty((len(P), 2 * degree))
+    for row in np.unique(rows):
+        sel = rows == row
+        T[sel] = P[sel] @ W[row]
+    # exp(i*m*theta) for m = 0 .. degree-1 by repeated multiplication
+    E = np.empty((len(P), degree), dtype=complex)
+    E[:, 0] = 1.0
+    step = np.exp(1j * np.asarray(theta, dtype=float))
+    for k in range(1, degree):
+        E[:, k] = E[:, k - 1] * step
+    return np.sum(T[:, :degree] * E.real + T[:, degree:] * E.imag, axis=1)
+
+
+def stack_radial(shapes):
+    """(S, K^2) array of radial coefficients, zero-padded to the largest degree"""
+    size = max(len(a) for a in shapes)
+    A = np.zeros((len(shapes), size), dtype=complex)
+    for k, a in enumerate(shapes):
+        A[k, :len(a)] = a
+    return A
+
+
+def radial_surface(a, level=3):
+    """
+    Surface samples of a radial function on an icosphere.
+
+    Returns:
+    - points: (V, 3) surface points relative to the centre
+    - faces: (F, 3) icosphere faces (closed, outward wound)
+    """
+    base = get_basis(level, 1)
+    sph_cor = base['sph_cor']
+    r = radial_function(a, sph_cor[:, 4], sph_cor[:, 5])
+    return r[:, None] * unit_directions(sph_cor[:, 4], sph_cor[:, 5]), base['faces']
+
+
+def radial_bounds(a, level=4):
+    """
+    Inscribed and bounding radii (r_min, r_max) of a radial function.
+
+    r is evaluated at the icosphere vertices of the given level; 2% margins
+    cover the extrema between the vertices.
+    """
+    r = np.linalg.norm(radial_surface(a, level)[0], axis=1)
+    return 0.98 * r.min(), 1.02 * r.max()
+
+
+def signed_radial_distance(a, points, position=None, rotation=None, scale=1.0, chunk=16384):
+    """
+    Signed radial distance of world points to a posed particle.
+
+    The distance is measured along the ray from the particle centre through the
+    point: |p - c| - scale * r(direction). It is negative inside and positive
+    outside, and equals the true surface distance only on the surface itself.
+
+    Parameters:
+    - a: (K^2,) radial coefficients from radial_fit
+    - points: (M, 3) world points
+    - position: (3,) world position of the radial centre (default origin)
+    - rotation: (3, 3) body-to-world rotation matrix (default identity)
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2)
+    - chunk: number of points evaluated per basis matrix (bounds memory)
+
+    Returns:
+    - d: (M,) signed radial distances in world units
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    local = points if position is None else points - np.asarray(position, dtype=float)
+    if rotation is not None:
+        local = local @ np.asarray(rotation, dtype=float)
+    dist = np.linalg.norm(local, axis=1)
+    d = np.empty(len(points))
+    for start in range(0, len(points), chunk):
+        phi, theta = direction_angles(local[start:start + chunk])
+        d[start:start + chunk] = dist[start:start + chunk] - scale * radial_function(a, phi, theta)
+    return d
+
+
+def points_inside(a, points, position=None, rotation=None, scale=1.0, chunk=16384):
+    """
+    Whether world points lie inside a posed particle, shape (M,) boolean.
+
+    Parameters as for signed_radial_distance.
+    """
+    return signed_radial_distance(a, points, position, rotation, scale, chunk) < 0
@@ -8,8 +8,13 @@ import numpy as np
 from particle_generator import (
     batch_generate_particles,
     save_particle_metadata,
-    generate_random_particle_params
+    generate_random_particle_params,
+    generate_batch_particle,
+    particle_options,
+    container_fill_volume
 )
+from param_sampler import mean_particle_volume
+from shape_index import build_shape_index, add_to_index, save_shape_index
 import os
 import sys
 from datetime import datetime
@@ -32,15 +37,19 @@ def print_header():
 
 
 def get_user_input():
-    """Get number of particles from user with validation"""
+    """Get number of particles from user with validation ('fill' returns None: fill-budget mode)"""
     default_num = 50
     
     print("\nParticle Batch Configuration:")
     print("-" * 80)
     
     try:
-        user_input = input("Enter number of particles to generate (default: {}): ".format(default_num))
+        user_input = input("Enter number of particles to generate (default: {}, "
+                           "'fill' to fill the container): ".format(default_num))
         
+        if user_input.strip().lower() == "fill":
+            print(">> Fill-budget mode: generating until the container volume budget is reached")
+            return None
         if user_input.strip() == "":
             num_particles = default_num
             print(">> Using default: {} particles".format(default_num))
@@ -108,14 +117,34 @@ def progress_bar(current, total, width=50):
 
 
 def enhanced_batch_generate_particles(num_particles, output_dir='./data/competition_particles', 
-                                      include_png=True):
+                                      include_png=True, refine_tol=None, scale_mode='radius',
+                                      seed=None, max_retries=5, require_valid=False,
+                                      max_folded=None,
+                                      target_volume=None, D_eq_dist=None, unique_tol=None,
+                                      cache=None, incremental=False, preview=None):
     """
     Enhanced batch generation with interactive progress reporting.
-    Returns list of particles with error tracking.
+    Returns the list of generated particles.
+    If refine_tol is given, each particle is meshed adaptively to that tolerance.
+    scale_mode='volume' scales each particle to the exact volume of a D_eq sphere.
+    Failed particles are redrawn from their own random stream (see
+    particle_generator.generate_particle); a particle that still fails after
+    max_retries redraws is reported and stops the batch. With require_valid, particles
+    whose mesh fails the validity checks are redrawn as well (max_folded is the folded
+    volume tolerance, see validity.check_validity).
+    With target_volume (see particle_generator.container_fill_volume) generation
+    stops as soon as the particle volumes add up to the budget; num_particles is
+    then only an upper limit. D_eq_dist is a size distribution spec for D_eq
+    (see param_sampler), default uniform 30-90 micrometers.
+    With unique_tol, particles closer than that to an earlier one in descriptor
+    space are redrawn; the shape index is saved as shape_index.npz in output_dir.
+    With a particle cache (see particle_cache) particles generated in earlier runs
+    are restored instead of generated again. With incremental=True only the stages
+    whose inputs changed since the last run into output_dir are redone (see
+    build_stages); preview holds plotstl preview settings.
     """
     import os
-    from SHPSG import SHPSG
-    from funcs import sh2stl, plotstl, icosahedron, subdivsurf, cleanmesh, car2sph
+    from funcs import icosahedron, subdivsurf, cleanmesh, car2sph
     
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
@@ -137,32 +166,39 @@ def enhanced_batch_generate_particles(num_particles, output_dir='./data/competit
     print("\nGeneration Phase:")
     print("-" * 80)
     
+    if seed is None:
+        seed = np.random.randint(2**31 - 1)
+    
+    batch = {
+        'output_dir': output_dir, 'include_png': include_png, 'mesh_ext': None,
+        'geometry': (sph_cor, vertices, faces, None), 'seed': seed,
+        'options': particle_options(max_retries, require_valid, max_folded, refine_tol,
+                                    scale_mode, unique_tol, cache, incremental, preview)
+    }
     particle_list = []
-    failed_particles = []
+    total_volume = 0.0
+    index = build_shape_index()
     
     for i in range(num_particles):
+        if target_volume is not None and total_volume >= target_volume:
+            break
         try:
-            # Show progress
-            sys.stdout.write("\r" + progress_bar(i + 1, num_particles) + " ")
+            # Show progress (of the volume budget in fill-budget mode)
+            if target_volume is not None:
+                sys.stdout.write("\r" + progress_bar(min(total_volume, target_volume), target_volume) + " ")
+            else:
+                sys.stdout.write("\r" + progress_bar(i + 1, num_particles) + " ")
             sys.stdout.flush()
             
-            # Generate random parameters with gradual transition
-            params = generate_random_particle_params(particle_index=i, total_particles=num_particles)
-            
-            # Generate coefficients
-            coeff = SHPSG(params['Ei'], params['Fi'], params['D2_8'], params['D9_15'])
-            
-            # Create filenames
-            stl_filename = "{}/particle_{:04d}.stl".format(output_dir, i)
-            png_filename = "{}/particle_{:04d}.png".format(output_dir, i) if include_png else None
-            
-            # Generate STL
-            vertices_copy = vertices.copy()
-            sh2stl(coeff, sph_cor, vertices_copy, faces, stl_filename, D_eq=params['D_eq'])
-            
-            # Generate PNG
-            if include_png:
-                plotstl(stl_filename, png_filename, D_eq=params['D_eq'])
+            # Generate random parameters with gradual transition, then STL and PNG
+            # (this script uses the plain SHPSG coefficients, without coeff_multiplier)
+            params, details, paths = generate_batch_particle(
+                batch, "particle_{:04d}".format(i), (i,),
+                lambda rng: dict(generate_random_particle_params(
+                    particle_index=i, total_particles=num_particles, rng=rng,
+                    D_eq_dist=D_eq_dist), coeff_multiplier=1.0),
+                shape_index=index)
+            add_to_index(index, i, D_eq=params['D_eq'], **details['realized'])
             
             # Store metadata
             particle_metadata = {
@@ -173,10 +209,12 @@ def enhanced_batch_generate_particles(num_particles, output_dir='./data/competit
                 'Fi': params['Fi'],
                 'D2_8': params['D2_8'],
                 'D9_15': params['D9_15'],
-                'stl_path': stl_filename,
-                'png_path': png_filename
+                'stl_path': paths['stl'],
+                'png_path': paths['png']
             }
+            particle_metadata.update(details)
             particle_list.append(particle_metadata)
+            total_volume += details['volume']
             
             # Print detailed info every 10 particles or at end
             if (i + 1) % 10 == 0 or i == num_particles - 1:
@@ -188,35 +226,38 @@ def enhanced_batch_generate_particles(num_particles, output_dir='./data/competit
                     i + 1, num_particles, i))
                 print("    Size: {:.1f} um | Type: {} | Roundness: {:.2f} | Surface: {}".format(
                     params['D_eq'], particle_type, params['D2_8'], surface))
-                sys.stdout.write(progress_bar(i + 1, num_particles) + " ")
+                if target_volume is None:
+                    sys.stdout.write(progress_bar(i + 1, num_particles) + " ")
                 sys.stdout.flush()
         
         except Exception as e:
-            failed_particles.append((i, str(e)))
-            print("\n  WARNING: Failed to generate particle_{}".format(i))
+            print("\n  ERROR: Failed to generate particle_{:04d}".format(i))
             print("    Error: {}".format(str(e)))
+            raise
     
+    save_shape_index(os.path.join(output_dir, 'shape_index.npz'), index)
+    
+    if target_volume is not None:
+        print("\n>> Volume budget: {:.1f}% filled with {} particles".format(
+            100.0 * total_volume / target_volume, len(particle_list)))
     print("\n")
-    return particle_list, failed_particles
+    return particle_list
 
 
-def print_summary(particles, failed_particles, output_dir):
+def print_summary(particles, output_dir):
     """Print comprehensive summary report"""
     print("\n" + "=" * 80)
     print(" " * 25 + "Work Summary Report")
     print("=" * 80)
     
     successful_count = len(particles)
-    total_count = successful_count + len(failed_particles)
     
     print("\nGeneration Results:")
     print("-" * 80)
     print("  Total particles created:  {}".format(successful_count))
-    if failed_particles:
-        print("  Failed to generate:       {}".format(len(failed_particles)))
-        print("  Success rate:             {:.1f}%".format(100.0 * successful_count / total_count))
-    else:
-        print("  Success rate:             100.0%")
+    redrawn = [p for p in particles if p.get('retries', 0) > 0]
+    if redrawn:
+        print("  Redrawn particles:        {}".format(len(redrawn)))
     
     if successful_count > 0:
         d_eq_values = [p['D_eq'] for p in particles]
@@ -249,12 +290,6 @@ def print_summary(particles, failed_particles, output_dir):
     print("  3. Analyze packing efficiency and particle interactions")
     print("  4. Use metadata.txt for batch documentation")
     
-    if failed_particles:
-        print("\nFailed Particles:")
-        print("-" * 80)
-        for idx, error in failed_particles:
-            print("  particle_{:04d}: {}".format(idx, error))
-    
     print("\n" + "=" * 80)
     print("Generation process completed successfully!")
     print("=" * 80 + "\n")
@@ -275,14 +310,28 @@ def main():
     # Set output directory
     output_dir = './data/competition_particles'
     
+    # Fill-budget mode: 60% solid fraction of a 1000 x 1000 um cylinder.
+    # Particles are scaled to their exact D_eq volume so the expected count holds.
+    target_volume = None
+    scale_mode = 'radius'
+    if num_particles is None:
+        target_volume = container_fill_volume(1000.0, 1000.0, fill_fraction=0.6)
+        expected = target_volume / mean_particle_volume(('uniform', 30, 90))
+        num_particles = int(2 * expected) + 1
+        scale_mode = 'volume'
+        print(">> Volume budget: {:.3e} um^3 (about {} particles expected)".format(
+            target_volume, int(expected)))
+    
     # Generate particles with enhanced progress reporting
     print("\nStarting particle generation...")
     print("This may take a while depending on batch size and PNG generation.\n")
     
-    particles, failed_particles = enhanced_batch_generate_particles(
+    particles = enhanced_batch_generate_particles(
         num_particles=num_particles,
         output_dir=output_dir,
-        include_png=True
+        include_png=True,
+        scale_mode=scale_mode,
+        target_volume=target_volume
     )
     
     # Save metadata
@@ -292,7 +341,7 @@ def main():
         print("WARNING: Failed to save metadata: {}".format(str(e)))
     
     # Print comprehensive summary
-    print_summary(particles, failed_particles, output_dir)
+    print_summary(particles, output_dir)
     
     return particles
 
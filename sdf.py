@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Signed distance fields of SH particles for level-set DEM
+
+A particle template is sampled on a regular grid in its STL frame (unit shape
+times scale, as written by sh2stl with scale_mode='radius'):
+
+1. first guess everywhere from the radial function (radial.signed_radial_distance),
+   which is cheap but only exact on the surface itself
+2. inside a narrow band around the surface the distance is replaced by the
+   exact distance to the reconstructed triangle mesh; nearest triangles are
+   found with a bounding volume hierarchy (BVH) traversed for all band points
+   in lockstep, pruned by an upper bound per point: the radial guess, or the
+   distance to the nearest mesh vertex (scipy cKDTree), whichever is smaller
+
+Distances are negative inside. Far from the surface the radial guess is kept
+(an upper bound of the true distance outside the particle).
+"""
+
+import numpy as np
+
+from sh_basis import get_basis, sh_degree, sh_reconstruct
+from radial import radial_fit, signed_radial_distance
+
+
+def build_bvh(triangles, leaf_size=8):
+    """
+    Median-split bounding volume hierarchy over triangles.
+
+    Parameters:
+    - triangles: (F, 3, 3) triangle array
+    - leaf_size: maximum number of triangles per leaf
+
+    Returns:
+    - dict with node arrays 'lo', 'hi' (nodes, 3) boxes, 'left', 'right' (child
+      indices, -1 for leaves), 'start', 'count' (leaf ranges in 'order') and
+      'order' (triangle indices sorted by leaf)
+    """
+    tri_lo = triangles.min(axis=1)
+    tri_hi = triangles.max(axis=1)
+    centroid = triangles.mean(axis=1)
+    order = np.arange(len(triangles))
+    lo, hi, left, right, start, count = [], [], [], [], [], []
+    stack = [(0, len(triangles), -1, False)]
+    while stack:
+        s, e, parent, is_right = stack.pop()
+        node = len(lo)
+        if parent >= 0:
+            (right if is_right else left)[parent] = node
+        idx = order[s:e]
+        lo.append(tri_lo[idx].min(axis=0))
+        hi.append(tri_hi[idx].max(axis=0))
+        left.append(-1)
+        right.append(-1)
+        start.append(s)
+        count.append(e - s)
+        if e - s > leaf_size:
+            # split at the median centroid along the longest box axis
+            axis = np.argmax(hi[node] - lo[node])
+            order[s:e] = idx[np.argsort(centroid[idx, axis], kind='stable')]
+            mid = (s + e) // 2
+            stack.append((mid, e, node, True))
+            stack.append((s, mid, node, False))
+    return {
+        'lo': np.array(lo), 'hi': np.array(hi),
+        'left': np.array(left), 'right': np.array(right),
+        'start': np.array(start), 'count': np.array(count),
+        'order': order
+    }
+
+
+def closest_points_on_triangles(p, a, b, c):
+    """
+    Closest points on triangles (a, b, c) to points p, all (K, 3).
+
+    Returns:
+    - q: (K, 3) closest points
+    - interior: (K,) True where q lies inside the face (not on an edge or vertex)
+    """
+    ab, ac = b - a, c - a
+    ap, bp, cp = p - a, p - b, p - c
+    d1, d2 = np.sum(ab * ap, axis=1), np.sum(ac * ap, axis=1)
+    d3, d4 = np.sum(ab * bp, axis=1), np.sum(ac * bp, axis=1)
+    d5, d6 = np.sum(ab * cp, axis=1), np.sum(ac * cp, axis=1)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    def ratio(num, den):
+        return num / np.where(den != 0, den, 1.0)
+
+    # Voronoi regions, assigned from lowest to highest priority
+    denom = va + vb + vc
+    q = a + ab * ratio(vb, denom)[:, None] + ac * ratio(vc, denom)[:, None]
+    interior = np.ones(len(p), dtype=bool)
+    regions = [
+        ((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+         lambda: b + (c - b) * ratio(d4 - d3, (d4 - d3) + (d5 - d6))[:, None]),
+        ((vb <= 0) & (d2 >= 0) & (d6 <= 0), lambda: a + ac * ratio(d2, d2 - d6)[:, None]),
+        ((d6 >= 0) & (d5 <= d6), lambda: c),
+        ((vc <= 0) & (d1 >= 0) & (d3 <= 0), lambda: a + ab * ratio(d1, d1 - d3)[:, None]),
+        ((d3 >= 0) & (d4 <= d3), lambda: b),
+        ((d1 <= 0) & (d2 <= 0), lambda: a)
+    ]
+    for mask, point in regions:
+        q = np.where(mask[:, None], point(), q)
+        interior &= ~mask
+    return q, interior
+
+
+def bvh_nearest(bvh, triangles, points, upper=None):
+    """
+    Nearest triangle of every point, all points traversed in lockstep.
+
+    Parameters:
+    - bvh: hierarchy from build_bvh
+    - triangles: (F, 3, 3) triangle array the hierarchy was built on
+    - points: (M, 3) query points
+    - upper: (M,) optional upper bounds of the distances; points with no
+      triangle closer than their bound are queried again
+
+    Every point is also bounded by its distance to the nearest mesh vertex,
+    which lies on the mesh, so the traversal prunes from the first level on
+    instead of expanding every node down to the leaves.
+
+    Returns:
+    - dist: (M,) distances
+    - tri: (M,) nearest triangle indices
+    - closest: (M, 3) closest points on the mesh
+    - interior: (M,) whether the closest point is inside its face
+    """
+    from scipy.spatial import cKDTree
+
+    M = len(points)
+    # the nearest vertex is a point of the mesh; the slack covers rounding of
+    # the point-triangle distances against the tree's
+    vertex = cKDTree(triangles.reshape(-1, 3)).query(points)[0] * (1 + 1e-9)
+    best = vertex if upper is None else np.minimum(np.asarray(upper, dtype=float), vertex)
+    best, tri, closest, interior = _bvh_traverse(bvh, triangles, points, best)
+    # bounds given below the distance miss: query again from the vertex bounds
+    missed = tri < 0
+    if missed.any():
+        redo = _bvh_traverse(bvh, triangles, points[missed], vertex[missed])
+        best[missed], tri[missed], closest[missed], interior[missed] = redo
+    return best, tri, closest, interior
+
+
+def _bvh_traverse(bvh, triangles, points, best):
+    """Lockstep traversal of bvh_nearest from the per-point bounds best (M,)"""
+    M = len(points)
+    best = best.copy()
+    tri = np.full(M, -1)
+    closest = np.zeros((M, 3))
+    interior = np.zeros(M, dtype=bool)
+    pid = np.arange(M)
+    node = np.zeros(M, dtype=int)
+    while len(pid):
+        # prune (point, node) pairs whose box is farther than the best distance
+        gap = np.maximum(bvh['lo'][node] - points[pid], 0) + np.maximum(points[pid] - bvh['hi'][node], 0)
+        keep = np.sum(gap * gap, axis=1) <= best[pid] ** 2
+        pid, node = pid[keep], node[keep]
+        leaf = bvh['left'][node] < 0
+        # exact distances to the triangles of the reached leaves
+        lp, ln = pid[leaf], node[leaf]
+        if len(lp):
+            n = bvh['count'][ln]
+            rep = np.repeat(np.arange(len(lp)), n)
+            local = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            t = bvh['order'][bvh['start'][ln][rep] + local]
+            p = lp[rep]
+            q, inside = closest_points_on_triangles(points[p], triangles[t, 0], triangles[t, 1],
+                                                    triangles[t, 2])
+            d = np.linalg.norm(points[p] - q, axis=1)
+            # keep the smallest distance per point (written last after sorting)
+            s = np.argsort(-d, kind='stable')
+            s = s[d[s] <= best[p[s]]]
+            best[p[s]] = d[s]
+            tri[p[s]] = t[s]
+            closest[p[s]] = q[s]
+            interior[p[s]] = inside[s]
+        pid, node = pid[~leaf], node[~leaf]
+        pid = np.concatenate((pid, pid))
+        node = np.concatenate((bvh['left'][node], bvh['right'][node]))
+    return best, tri, closest, interior
+
+
+def particle_sdf(coeff, resolution=64, scale=1.0, level=3, band=3.0, padding=2,
+                 dtype=np.float32, shape=None):
+    """
+    Signed distance grid of one particle template.
+
+    Parameters:
+    - coeff: (L^2, 3) SH coefficients
+    - resolution: number of grid nodes along the longest box edge
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2)
+    - level: icosphere level of the reconstructed mesh used for exact distances
+    - band: half-width of the exact narrow band, in voxels
+    - padding: empty voxels added around the particle bounding box
+    - dtype: grid dtype (np.float32 or np.float16)
+    - shape: fixed grid node counts (nx, ny, nz) centred on the particle
+      (default: the padded bounding box)
+
+    Returns:
+    - dict with 'sdf' (nx, ny, nz) grid, 'origin' (3,) position of node (0, 0, 0)
+      and 'voxel_size', in the STL frame of the particle
+    """
+    base = get_basis(level, sh_degree(coeff))
+    xyz = sh_reconstruct(coeff, base['Y']) * scale
+    triangles = xyz[base['faces']]
+    a, center = radial_fit(coeff)
+
+    lo, hi = xyz.min(axis=0), xyz.max(axis=0)
+    voxel = (hi - lo).max() / (resolution - 1 - 2 * padding)
+    if shape is None:
+        origin = lo - padding * voxel
+        shape = np.ceil((hi + padding * voxel - origin) / voxel).astype(int) + 1
+    else:
+        origin = (lo + hi) / 2.0 - (np.asarray(shape) - 1) / 2.0 * voxel
+    axes = [origin[k] + voxel * np.arange(shape[k]) for k in range(3)]
+    nodes = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    # radial first guess; its error is bounded by the fit error at the mesh vertices
+    sdf = signed_radial_distance(a, nodes, center * scale, scale=scale)
+    fit_error = np.abs(signed_radial_distance(a, xyz, center * scale, scale=scale)).max()
+    near = np.abs(sdf) < band * voxel + fit_error
+    upper = np.abs(sdf[near]) + fit_error + voxel
+    dist, tri, closest, interior = bvh_nearest(build_bvh(triangles), triangles, nodes[near], upper)
+
+    # sign from the face normal where the closest point is inside a face,
+    # from the radial function at edges and vertices
+    t = triangles[tri]
+    normal = np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0])
+    outside = np.where(interior, np.sum((nodes[near] - closest) * normal, axis=1) > 0,
+                       sdf[near] > 0)
+    sdf[near] = np.where(outside, dist, -dist)
+    return {'sdf': sdf.reshape(tuple(shape)).astype(dtype), 'origin': origin, 'voxel_size': voxel}
+
+
+def library_sdf(coeffs, scales=None, resolution=64, level=3, band=3.0, padding=2,
+                dtype=np.float16):
+    """
+    Signed distance grids of a whole particle library, stacked into one array.
+
+    Every grid gets the same (n, n, n) node count centred on its particle,
+    so the result is a single compact array.
+
+    Parameters:
+    - coeffs: sequence of (L^2, 3) SH coefficient arrays
+    - scales: per-particle scale factors (default 1.0)
+    - resolution, level, band, padding, dtype: see particle_sdf
+
+    Returns:
+    - dict with 'sdf' (N, n, n, n), 'origin' (N, 3) and 'voxel_size' (N,)
+    """
+    if scales is None:
+        scales = np.ones(len(coeffs))
+    grids = np.empty((len(coeffs),) + (resolution,) * 3, dtype=dtype)
+    origins = np.zeros((len(coeffs), 3))
+    voxels = np.zeros(len(coeffs))
+    for i, coeff in enumerate(coeffs):
+        result = particle_sdf(coeff, resolution, scales[i], level, band, padding, dtype,
+                              shape=(resolution,) * 3)
+        grids[i] = result['sdf']
+        origins[i] = result['origin']
+        voxels[i] = result['voxel_size']
+    return {'sdf': grids, 'origin': origins, 'voxel_size': voxels}
+
+
+def save_sdf_library(library, output_file):
+    """Save a library from library_sdf to a compressed .npz file"""
+    np.savez_compressed(output_file, **library)
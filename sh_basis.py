@@ -0,0 +1,253 @@
+"""
+Spherical harmonics basis engine for SHPSG
+
+The surface of an SHPSG particle is x(u) = sum_nm c_nm * Y_n^m(u) for each of
+the three Cartesian components. Instead of calling scipy's sph_harm once per
+(n, m) and per component, the basis is tabulated once as a (V, L^2) matrix
+and every reconstruction becomes a single matrix product:
+
+    xyz = (Y @ coeff).real                      # (V, 3)
+    xyz = (Y @ coeff_batch).real                # (N, V, 3)
+
+Angles follow the convention already used by funcs.sph2cart:
+- phi:   polar angle measured from the +Z axis, [0, pi]
+- theta: azimuthal angle in the XY-plane, (-pi, pi]
+
+Columns are ordered like the SHPSG coefficient rows: degree n = 0, 1, ...
+and order m = -n ... n inside each degree. Y_n^m carries the Condon-Shortley
+phase so the values agree with scipy.special.sph_harm(m, n, theta, phi).
+"""
+
+import numpy as np
+
+
+def sh_degree(coeff):
+    """Number of SH degrees (L) stored in a (..., L^2, 3) coefficient array"""
+    rows = np.shape(coeff)[-2]
+    degree = int(round(np.sqrt(rows)))
+    if degree * degree != rows:
+        raise ValueError("coefficient array must have L^2 rows, got {}".format(rows))
+    return degree
+
+
+def sh_orders(degree):
+    """Degree n and order m of every basis column for degrees 0..degree-1"""
+    n = np.repeat(np.arange(degree), 2 * np.arange(degree) + 1)
+    m = np.arange(degree * degree) - n * n - n
+    return n, m
+
+
+def legendre_basis(phi, degree):
+    """
+    Normalized associated Legendre functions P_n^m(cos(phi)) for all columns.
+
+    Evaluated with the standard three-term recurrence (NumPy only), so no call
+    to scipy is needed. Negative orders use P_n^-m = (-1)^m P_n^m, which makes
+    Y_n^m = P_n^m * exp(i*m*theta) hold for every column.
+
+    Parameters:
+    - phi: polar angles, shape (V,)
+    - degree: number of SH degrees L
+
+    Returns:
+    - P: real array of shape (V, L^2)
+    """
+    phi = np.asarray(phi, dtype=float)
+    x = np.cos(phi)
+    s = np.sin(phi)
+    # filled column by column in a (L^2, V) buffer so every write is contiguous
+    P = np.empty((degree * degree, phi.size))
+    # P_m^m seeds the recurrence for each order
+    pmm = np.full(phi.size, np.sqrt(1.0 / (4.0 * np.pi)))
+    for m in range(degree):
+        if m > 0:
+            pmm = -np.sqrt((2.0 * m + 1.0) / (2.0 * m)) * s * pmm
+        P[m * m + 2 * m] = pmm
+        if m + 1 < degree:
+            p_prev = pmm
+            p_curr = np.sqrt(2.0 * m + 3.0) * x * pmm
+            P[(m + 1) ** 2 + m + 1 + m] = p_curr
+            for n in range(m + 2, degree):
+                a = np.sqrt((4.0 * n * n - 1.0) / (n * n - m * m))
+                b = np.sqrt(((n - 1.0) ** 2 - m * m) / (4.0 * (n - 1.0) ** 2 - 1.0))
+                p_next = a * (x * p_curr - b * p_prev)
+                P[n * n + n + m] = p_next
+                p_prev, p_curr = p_curr, p_next
+    # mirror to negative orders
+    n, m = sh_orders(degree)
+    neg = m < 0
+    P[neg] = ((-1.0) ** m[neg])[:, None] * P[n[neg] * n[neg] + n[neg] - m[neg]]
+    return P.T
+
+
+def _azimuthal_factors(theta, degree):
+    """exp(i*m*theta) for every column, evaluated once per distinct order m"""
+    _, m = sh_orders(degree)
+    orders = np.arange(1 - degree, degree)
+    E = np.exp(1j * np.outer(np.asarray(theta, dtype=float), orders))
+    return E[:, m + degree - 1]
+
+
+def sh_basis(phi, theta, degree):
+    """
+    Complex SH basis matrix Y of shape (V, L^2).
+
+    Parameters:
+    - phi: polar angles, shape (V,)
+    - theta: azimuthal angles, shape (V,)
+    - degree: number of SH degrees L
+    """
+    return legendre_basis(phi, degree) * _azimuthal_factors(theta, degree)
+
+
+def legendre_dphi(P, degree):
+    """
+    Derivative d/dphi of the normalized Legendre table returned by legendre_basis.
+
+    Uses the ladder relation
+        dP_n^m/dphi = (sqrt((n-m)(n+m+1)) P_n^(m+1) - sqrt((n+m)(n-m+1)) P_n^(m-1)) / 2
+    which stays finite at the poles. Applying it twice gives the second derivative.
+    """
+    n, m = sh_orders(degree)
+    idx = np.arange(degree * degree)
+    a = np.sqrt((n - m) * (n + m + 1.0))
+    b = np.sqrt((n + m) * (n - m + 1.0))
+    up = np.where(m < n, idx + 1, idx)
+    down = np.where(m > -n, idx - 1, idx)
+    return 0.5 * (a * P[:, up] - b * P[:, down])
+
+
+def sh_basis_derivatives(phi, theta, degree, second=False):
+    """
+    SH basis together with its angular derivatives, each of shape (V, L^2).
+
+    Parameters:
+    - phi, theta: polar and azimuthal angles, shape (V,)
+    - degree: number of SH degrees L
+    - second: also return the second derivatives
+
+    Returns:
+    - dict with 'Y', 'Y_phi', 'Y_theta' and, if second is True,
+      'Y_phiphi', 'Y_phitheta', 'Y_thetatheta'
+    """
+    _, m = sh_orders(degree)
+    E = _azimuthal_factors(theta, degree)
+    P = legendre_basis(phi, degree)
+    dP = legendre_dphi(P, degree)
+    basis = {'Y': P * E, 'Y_phi': dP * E}
+    basis['Y_theta'] = 1j * m * basis['Y']
+    if second:
+        basis['Y_phiphi'] = legendre_dphi(dP, degree) * E
+        basis['Y_phitheta'] = 1j * m * basis['Y_phi']
+        basis['Y_thetatheta'] = -(m ** 2) * basis['Y']
+    return basis
+
+
+def surface_geometry(coeff, basis, curvature=True):
+    """
+    Exact tangents, normals and principal curvatures of the SH surface.
+
+    Everything is a matrix product with the derivative bases, so a whole batch
+    of particles (N, L^2, 3) is handled at once and no finite differences over
+    a mesh are needed. The parametrisation degenerates at the poles, so the
+    bases should be evaluated slightly off them (get_basis does this).
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) coefficients
+    - basis: dict from sh_basis_derivatives (second=True for curvature)
+    - curvature: whether to compute curvatures
+
+    Returns:
+    - dict with 'xyz', 'tangent_phi', 'tangent_theta', 'normals' and, if
+      curvature is True, 'k1' >= 'k2' (principal), 'mean' and 'gauss'.
+      Curvatures are positive on convex regions, in 1/unit-shape length.
+    """
+    X = sh_reconstruct(coeff, basis['Y'])
+    Xp = sh_reconstruct(coeff, basis['Y_phi'])
+    Xt = sh_reconstruct(coeff, basis['Y_theta'])
+    normals = np.cross(Xp, Xt)
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    geometry = {'xyz': X, 'tangent_phi': Xp, 'tangent_theta': Xt, 'normals': normals}
+    if curvature:
+        # first and second fundamental forms
+        E = np.sum(Xp * Xp, axis=-1)
+        F = np.sum(Xp * Xt, axis=-1)
+        G = np.sum(Xt * Xt, axis=-1)
+        L = np.sum(sh_reconstruct(coeff, basis['Y_phiphi']) * normals, axis=-1)
+        M = np.sum(sh_reconstruct(coeff, basis['Y_phitheta']) * normals, axis=-1)
+        N = np.sum(sh_reconstruct(coeff, basis['Y_thetatheta']) * normals, axis=-1)
+        det = E * G - F * F
+        gauss = (L * N - M * M) / det
+        mean = -(E * N - 2 * F * M + G * L) / (2 * det)
+        root = np.sqrt(np.maximum(mean * mean - gauss, 0.0))
+        geometry.update({'k1': mean + root, 'k2': mean - root,
+                         'mean': mean, 'gauss': gauss})
+    return geometry
+
+
+def sh_reconstruct(coeff, Y):
+    """
+    Surface points from SH coefficients with a precomputed basis.
+
+    Parameters:
+    - coeff: (L^2, 3) or batched (N, L^2, 3) complex coefficients
+    - Y: (V, K^2) basis from sh_basis; only the first min(L, K)^2 columns
+      and rows are used, so a basis built for a higher degree can be reused
+
+    Returns:
+    - xyz: (V, 3) or (N, V, 3) real surface points
+    """
+    k = min(np.shape(coeff)[-2], Y.shape[1])
+    return np.matmul(Y[:, :k], coeff[..., :k, :]).real
+
+
+def unit_directions(phi, theta):
+    """Unit vectors for polar/azimuthal angles, shape (V, 3)"""
+    return np.column_stack((np.sin(phi) * np.cos(theta),
+                            np.sin(phi) * np.sin(theta),
+                            np.cos(phi)))
+
+
+# polar angle offset used for the derivative bases (tangent_theta vanishes at the poles)
+POLE_EPS = 1e-6
+
+# cache of (level, degree) -> precomputed mesh and basis
+_BASIS_CACHE = {}
+
+
+def get_basis(level=2, degree=16, derivatives=False):
+    """
+    Base icosphere mesh and its SH basis, computed once per (level, degree).
+
+    Parameters:
+    - level: icosphere subdivision level
+    - degree: number of SH degrees L
+    - derivatives: also precompute the first and second derivative bases
+      (evaluated at polar angles clipped to [POLE_EPS, pi - POLE_EPS])
+
+    Returns:
+    - dict with 'vertices', 'faces', 'sph_cor' (as used by sh2stl) and 'Y',
+      plus the derivative bases of sh_basis_derivatives if requested
+    """
+    key = (level, degree)
+    if key not in _BASIS_CACHE:
+        from funcs import icosahedron, subdivsurf, cleanmesh, car2sph
+        vertices, faces = icosahedron()
+        for i in range(level):
+            vertices, faces = subdivsurf(faces, vertices)
+            vertices, faces = cleanmesh(faces, vertices)
+        sph_cor = car2sph(vertices)
+        _BASIS_CACHE[key] = {
+            'vertices': vertices,
+            'faces': faces,
+            'sph_cor': sph_cor,
+            'Y': sh_basis(sph_cor[:, 4], sph_cor[:, 5], degree)
+        }
+    cached = _BASIS_CACHE[key]
+    if derivatives and 'Y_phi' not in cached:
+        sph_cor = cached['sph_cor']
+        phi = np.clip(sph_cor[:, 4], POLE_EPS, np.pi - POLE_EPS)
+        bases = sh_basis_derivatives(phi, sph_cor[:, 5], degree, second=True)
+        bases.pop('Y')
+        cached.update(bases)
+    return cached
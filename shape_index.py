@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Nearest-neighbour index over rotation-invariant shape descriptors
+
+Every particle is a point in descriptor space: the realized Ei, Fi, D2_8 and
+D9_15 of its coefficients (descriptors.shape_descriptors) plus log D_eq, each
+divided by a fixed scale so that distances are comparable across features.
+A KD-tree (scipy cKDTree) answers nearest-particle queries for whole arrays
+of targets; queries on a subset of the features (e.g. without D_eq) use a
+tree over those columns, built on first use.
+
+Particles added during generation go to a small pending buffer searched by
+brute force; the trees are rebuilt once the buffer exceeds a quarter of the
+indexed particles, which keeps incremental uniqueness checks cheap.
+
+The index is a plain dict and is saved next to the library as an .npz file
+(features, scales and particle ids; trees are rebuilt on load).
+"""
+
+import numpy as np
+
+INDEX_FEATURES = ('Ei', 'Fi', 'D2_8', 'D9_15', 'D_eq')
+
+# feature scales of the distance (D_eq enters as log D_eq)
+DEFAULT_SCALES = {'Ei': 0.5, 'Fi': 0.5, 'D2_8': 0.4, 'D9_15': 0.2, 'D_eq': 1.0}
+
+
+def _feature_columns(features):
+    """(N, 5) raw feature array from a dict of arrays (log D_eq)"""
+    columns = [np.atleast_1d(np.asarray(features[name], dtype=float)) for name in INDEX_FEATURES]
+    columns[-1] = np.log(columns[-1])
+    return np.column_stack(columns)
+
+
+def build_shape_index(features=None, ids=None, scales=None):
+    """
+    Build a shape index.
+
+    Parameters:
+    - features: dict with one (N,) array per name in INDEX_FEATURES (default empty)
+    - ids: (N,) particle ids (default 0..N-1)
+    - scales: dict of feature scales (default DEFAULT_SCALES)
+
+    Returns:
+    - index dict
+    """
+    if scales is None:
+        scales = DEFAULT_SCALES
+    data = np.zeros((0, len(INDEX_FEATURES))) if features is None else _feature_columns(features)
+    if ids is None:
+        ids = np.arange(len(data))
+    return {
+        'features': data,
+        'ids': np.asarray(ids, dtype=np.int64),
+        'scales': np.array([scales[name] for name in INDEX_FEATURES], dtype=float),
+        'pending': [],
+        'pending_ids': [],
+        'trees': {}
+    }
+
+
+def add_to_index(index, particle_id, **features):
+    """Add one particle (all INDEX_FEATURES as keyword values) to the index"""
+    index['pending'].append(_feature_columns(features)[0])
+    index['pending_ids'].append(particle_id)
+    if len(index['pending']) > max(256, len(index['features']) // 4):
+        _flush(index)
+
+
+def _flush(index):
+    """Move the pending particles into the tree data"""
+    if index['pending']:
+        index['features'] = np.vstack([index['features']] + [np.array(index['pending'])])
+        index['ids'] = np.concatenate((index['ids'], np.array(index['pending_ids'], dtype=np.int64)))
+        index['pending'], index['pending_ids'] = [], []
+        index['trees'] = {}
+
+
+def _tree(index, columns):
+    """KD-tree over the scaled feature columns, cached per column subset"""
+    if columns not in index['trees']:
+        from scipy.spatial import cKDTree
+        cols = list(columns)
+        index['trees'][columns] = cKDTree(index['features'][:, cols] / index['scales'][cols])
+    return index['trees'][columns]
+
+
+def nearest(index, k=1, **targets):
+    """
+    Nearest indexed particles to target descriptors.
+
+    Parameters:
+    - index: shape index
+    - k: number of neighbours
+    - targets: values (scalars or (M,) arrays) for any subset of INDEX_FEATURES,
+      e.g. nearest(index, Ei=0.6, Fi=0.8, D2_8=0.2, D9_15=0.05)
+
+    Returns:
+    - distances: (M, k) scaled descriptor distances (inf where fewer than k particles)
+    - ids: (M, k) particle ids (-1 where missing)
+    """
+    columns = tuple(j for j, name in enumerate(INDEX_FEATURES) if name in targets)
+    if not columns:
+        raise ValueError("nearest needs at least one of {}".format(", ".join(INDEX_FEATURES)))
+    cols = list(columns)
+    query = [np.atleast_1d(np.asarray(targets[INDEX_FEATURES[j]], dtype=float)) for j in cols]
+    if INDEX_FEATURES[-1] in targets:
+        query[-1] = np.log(query[-1])
+    query = np.column_stack(np.broadcast_arrays(*query)) / index['scales'][cols]
+
+    distances = np.full((len(query), k), np.inf)
+    ids = np.full((len(query), k), -1, dtype=np.int64)
+    if len(index['features']):
+        d, i = _tree(index, columns).query(query, k=k)
+        d, i = d.reshape(len(query), k), i.reshape(len(query), k)
+        found = np.isfinite(d)
+        distances[found] = d[found]
+        ids[found] = index['ids'][i[found]]
+    if index['pending']:
+        pending = np.array(index['pending'])[:, cols] / index['scales'][cols]
+        d = np.sqrt(np.sum((query[:, None, :] - pending[None, :, :]) ** 2, axis=2))
+        # merge the tree and buffer candidates, keep the k closest
+        all_d = np.concatenate((distances, d), axis=1)
+        all_ids = np.concatenate((ids, np.broadcast_to(np.array(index['pending_ids']), d.shape)), axis=1)
+        order = np.argsort(all_d, axis=1)[:, :k]
+        distances = np.take_along_axis(all_d, order, axis=1)
+        ids = np.take_along_axis(all_ids, order, axis=1)
+    return distances, ids
+
+
+def is_duplicate(index, tol, **features):
+    """
+    Near-duplicate test of one particle against the index.
+
+    Returns:
+    - (duplicate, particle id of the nearest indexed particle or -1)
+    """
+    d, i = nearest(index, 1, **features)
+    return bool(d[0, 0] < tol), int(i[0, 0])
+
+
+def save_shape_index(path, index):
+    """Write a shape index to an .npz file"""
+    _flush(index)
+    np.savez(path, features=index['features'], ids=index['ids'], scales=index['scales'],
+             names=np.array(INDEX_FEATURES))
+
+
+def load_shape_index(path):
+    """Read a shape index written by save_shape_index"""
+    with np.load(path) as data:
+        index = build_shape_index(scales=dict(zip(INDEX_FEATURES, data['scales'])))
+        index['features'] = data['features']
+        index['ids'] = data['ids']
+    return index
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Base mesh and SH basis shared across worker processes
+
+The (V, L^2) complex basis of a fine mesh is by far the largest array a
+worker needs (level 5 at L = 50: about 400 MB). publish_basis copies the
+cached base mesh, spherical coordinates and basis of sh_basis.get_basis into
+multiprocessing.shared_memory blocks once; the returned handle is small and
+picklable. attach_basis (the pool initializer) maps the blocks as read-only
+NumPy views and installs them in the get_basis cache of the worker, so every
+get_basis call there returns zero-copy views and memory stays constant as the
+number of workers grows. release_basis frees the blocks in the publisher.
+
+Workers are expected to be children of the publishing process (e.g. a
+multiprocessing pool), which share its resource tracker; the publisher owns
+the blocks and unlinks them.
+"""
+
+import numpy as np
+
+import sh_basis
+
+SHARED_FIELDS = ('vertices', 'faces', 'sph_cor', 'Y')
+
+# shared memory blocks created (by handle key) / attached in this process
+_PUBLISHED = {}
+_ATTACHED = []
+
+
+def _handle_key(handle):
+    return tuple(handle['arrays'][name][0] for name in SHARED_FIELDS)
+
+
+def publish_basis(level=2, degree=16):
+    """
+    Copy the base mesh and basis of get_basis(level, degree) to shared memory.
+
+    Returns:
+    - handle dict (level, degree and per-array block name, shape, dtype)
+    """
+    from multiprocessing import shared_memory
+    base = sh_basis.get_basis(level, degree)
+    handle = {'level': level, 'degree': degree, 'arrays': {}}
+    blocks = []
+    for name in SHARED_FIELDS:
+        array = np.ascontiguousarray(base[name])
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        handle['arrays'][name] = (block.name, array.shape, array.dtype.str)
+        blocks.append(block)
+    _PUBLISHED[_handle_key(handle)] = blocks
+    return handle
+
+
+def attach_basis(handle):
+    """
+    Map a published basis as read-only views and install it in the get_basis cache.
+
+    Parameters:
+    - handle: handle returned by publish_basis
+
+    Returns:
+    - dict with 'vertices', 'faces', 'sph_cor' and 'Y' views
+    """
+    from multiprocessing import shared_memory
+    views = {}
+    for name in SHARED_FIELDS:
+        block_name, shape, dtype = handle['arrays'][name]
+        block = shared_memory.SharedMemory(name=block_name)
+        _ATTACHED.append(block)
+        view = np.ndarray(tuple(shape), np.dtype(dtype), buffer=block.buf)
+        view.flags.writeable = False
+        views[name] = view
+    sh_basis._BASIS_CACHE[(handle['level'], handle['degree'])] = dict(views)
+    return views
+
+
+def release_basis(handle):
+    """Free the shared memory blocks of a published basis"""
+    for block in _PUBLISHED.pop(_handle_key(handle), []):
+        block.close()
+        block.unlink()
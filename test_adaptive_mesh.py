@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the red-green adaptive subdivision against uniform subdivision"""
+
+import numpy as np
+
+from funcs import (icosahedron, subdivsurf, cleanmesh, nested_subdivsurf,
+                   adaptive_subdivsurf, car2sph)
+from sh_basis import sh_basis, sh_degree, sh_reconstruct
+from particle_core import generate_coeffs, particle_rng
+from particle_generator import generate_regular_particle_params
+
+
+def surface(coeff, v):
+    sph = car2sph(v)
+    return sh_reconstruct(coeff, sh_basis(sph[:, 4], sph[:, 5], sh_degree(coeff)))
+
+
+def max_deviation(coeff, v, f, xyz):
+    """Largest deviation of the SH surface from the mesh at the edge midpoints"""
+    edges = np.unique(np.sort(f[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1), axis=0)
+    mid = v[edges[:, 0]] + v[edges[:, 1]]
+    mid = mid / np.linalg.norm(mid, axis=1)[:, None] / 2
+    return np.linalg.norm(surface(coeff, mid) - (xyz[edges[:, 0]] + xyz[edges[:, 1]]) / 2, axis=1).max()
+
+
+print("Testing adaptive subdivision")
+print("=" * 80)
+
+vertices, faces = icosahedron()
+for level in range(2):
+    vertices, faces = subdivsurf(faces, vertices)
+    vertices, faces = cleanmesh(faces, vertices)
+
+tol = 2e-3
+print("\n{:<10} {:<10} {:<10} {:<10}".format('Particle', 'Adaptive', 'Uniform', 'Deviation'))
+for i in range(4):
+    rng = particle_rng(21, 0, i, 0)
+    params = generate_regular_particle_params(rng)
+    coeff = generate_coeffs(params['Ei'], params['Fi'], params['D2_8'], params['D9_15'],
+                            max_degree=params['max_degree'], rng=rng)
+    v, f, xyz = adaptive_subdivsurf(coeff, faces, vertices, tol=tol)
+
+    # conforming and consistently wound: every half edge has its opposite
+    half = np.concatenate((f[:, [0, 1]], f[:, [1, 2]], f[:, [2, 0]]))
+    key = half[:, 0] * len(v) + half[:, 1]
+    assert len(np.unique(key)) == len(key)
+    assert np.all(np.isin(half[:, 1] * len(v) + half[:, 0], key))
+    assert np.allclose(xyz, surface(coeff, v))
+
+    # the tolerance is met with fewer faces than the uniform level that meets it
+    deviation = max_deviation(coeff, v, f, xyz)
+    uv, uf = vertices, faces
+    while max_deviation(coeff, uv, uf, surface(coeff, uv)) > tol:
+        uv, uf = nested_subdivsurf(uf, uv)
+    print("{:<10d} {:<10d} {:<10d} {:<10.2e}".format(i, len(f), len(uf), deviation))
+    assert deviation <= tol
+    assert len(f) < len(uf)
+
+print("\n" + "=" * 80)
+print("Adaptive subdivision verified!")
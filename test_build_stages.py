@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the stage fingerprints: a change redoes exactly the downstream stages"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from build_stages import (STAGES, BUILD_DIR, stage_fingerprints, load_manifest, save_manifest,
+                          load_stage_arrays, save_stage_arrays)
+from param_sampler import REGULAR_RECIPE
+from particle_generator import batch_generate_particles
+
+
+def changed_stages(before, after):
+    """Stages whose fingerprint differs"""
+    return tuple(stage for stage in STAGES if before[stage] != after[stage])
+
+
+def stamp(output_dir):
+    """Set every file of a batch to an old modification time"""
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            os.utime(os.path.join(root, name), (1, 1))
+
+
+def rewritten(output_dir):
+    """Particle outputs written since the last stamp: 'stl', 'png' and 'arrays' (stage arrays)"""
+    written = set()
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            if name.startswith('particle_') and os.stat(os.path.join(root, name)).st_mtime != 1:
+                ext = os.path.splitext(name)[1]
+                written.add({'.stl': 'stl', '.png': 'png', '.npz': 'arrays'}.get(ext, ext))
+    return written
+
+
+print("Testing stage fingerprints")
+print("=" * 80)
+
+# every input invalidates its own stage and the stages downstream of it
+params = {'Ei': np.float64(0.6), 'Fi': 0.5, 'D2_8': 0.2, 'D9_15': 0.05, 'D_eq': 40.0}
+args = (params, (5, [0], 0), {'base_mesh': [642, 1280], 'refine_tol': None}, 'radius', None,
+        {'max_folded': None})
+base = stage_fingerprints(*args)
+assert stage_fingerprints(*args) == base
+assert stage_fingerprints(dict(params, Ei=0.6), *args[1:]) == base
+cases = [
+    ('params', (dict(params, Ei=0.61),) + args[1:], STAGES),
+    ('random stream', args[:1] + ((5, [0], 1),) + args[2:], STAGES),
+    ('refine_tol', args[:2] + ({'base_mesh': [642, 1280], 'refine_tol': 0.1},) + args[3:],
+     ('mesh', 'stl', 'png', 'metadata')),
+    ('D_eq', (dict(params, D_eq=50.0),) + args[1:], ('stl', 'png', 'metadata')),
+    ('scale_mode', args[:3] + ('volume',) + args[4:], ('stl', 'png', 'metadata')),
+    ('preview', args[:4] + ({'elev': 60},) + args[5:], ('png',)),
+    ('checks', args[:5] + ({'max_folded': 0.1},), ('metadata',))
+]
+print("\n{:<16} {}".format('Changed input', 'Invalidated stages'))
+for name, changed_args, expected in cases:
+    stages = changed_stages(base, stage_fingerprints(*changed_args))
+    print("{:<16} {}".format(name, ", ".join(stages)))
+    assert stages == expected, (name, stages)
+
+work_dir = tempfile.mkdtemp()
+try:
+    # manifests and stage arrays round-trip next to the particle
+    stl_path = os.path.join(work_dir, 'particle.stl')
+    assert load_manifest(stl_path) == {'stages': {}, 'details': None, 'rejected': {}}
+    assert load_stage_arrays(stl_path) == {}
+    manifest = {'stages': base, 'details': {'volume': np.float64(1.5)}, 'rejected': {}}
+    save_manifest(stl_path, manifest)
+    assert load_manifest(stl_path) == {'stages': base, 'details': {'volume': 1.5}, 'rejected': {}}
+    save_stage_arrays(stl_path, coeff=np.arange(6.0).reshape(2, 3))
+    assert np.array_equal(load_stage_arrays(stl_path)['coeff'], np.arange(6.0).reshape(2, 3))
+    assert os.path.isdir(os.path.join(work_dir, BUILD_DIR))
+
+    # incremental batches rewrite only the outputs of invalidated stages; the
+    # manifests, the batch metadata and the shape index are cheap and always rewritten
+    output_dir = os.path.join(work_dir, 'batch')
+
+    def run(D_eq=40.0, **options):
+        stamp(output_dir)
+        batch_generate_particles(2, output_dir, include_png=True, verbose=False, seed=5,
+                                 recipe=dict(REGULAR_RECIPE, D_eq=('constant', D_eq)),
+                                 incremental=True, **options)
+        return rewritten(output_dir) - {'.json'}
+
+    assert run() == {'stl', 'png', 'arrays'}
+    print("\n{:<16} {}".format('Rerun', 'Rewritten outputs'))
+    for name, options, expected in (('unchanged', {}, set()),
+                                    ('preview', {'preview': {'elev': 60}}, {'png'}),
+                                    ('scale_mode', {'preview': {'elev': 60}, 'scale_mode': 'volume'},
+                                     {'stl', 'png'}),
+                                    ('D_eq', {'preview': {'elev': 60}, 'scale_mode': 'volume',
+                                              'D_eq': 50.0}, {'stl', 'png'})):
+        written = run(**options)
+        print("{:<16} {}".format(name, ", ".join(sorted(written)) or "-"))
+        assert written == expected, (name, written)
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Stage fingerprints verified!")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the particle cache: hits restore identical outputs, preview changes miss"""
+
+import os
+import shutil
+import tempfile
+
+from particle_cache import open_particle_cache
+from particle_generator import batch_generate_particles
+
+
+def read_outputs(output_dir):
+    """Output files of a batch by name (STL bodies without the timestamped header)"""
+    files = {}
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith('.stl') or name.endswith('.png'):
+            with open(os.path.join(output_dir, name), 'rb') as f:
+                data = f.read()
+            files[name] = data[80:] if name.endswith('.stl') else data
+    return files
+
+
+print("Testing the particle cache")
+print("=" * 80)
+
+work_dir = tempfile.mkdtemp()
+try:
+    cache = open_particle_cache(os.path.join(work_dir, 'cache'))
+
+    def run(name, preview):
+        output_dir = os.path.join(work_dir, name)
+        batch_generate_particles(2, output_dir, include_png=True, verbose=False, seed=5,
+                                 cache=cache, preview=preview)
+        return read_outputs(output_dir)
+
+    first = run('first', None)
+    print("\nFirst run:          hits {} misses {}".format(cache['hits'], cache['misses']))
+    assert cache['hits'] == 0
+
+    again = run('again', None)
+    print("Same settings:      hits {} misses {}".format(cache['hits'], cache['misses']))
+    assert cache['hits'] == 2
+    assert again == first
+
+    # a PNG rendered with other preview settings must not be restored
+    hits = cache['hits']
+    changed = run('changed', {'elev': 60, 'azim': 10})
+    print("Changed preview:    hits {} misses {}".format(cache['hits'], cache['misses']))
+    assert cache['hits'] == hits
+    pngs = [name for name in first if name.endswith('.png')]
+    assert pngs and all(changed[name] != first[name] for name in pngs)
+    assert all(changed[name] == first[name] for name in first if name.endswith('.stl'))
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Particle cache verified!")
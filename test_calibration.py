@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the calibration of the mesh form: requested_for hits realized targets"""
+
+import shutil
+import tempfile
+import numpy as np
+
+from SHPSG import SHPSG_batch
+from calibration import (CALIBRATION_INPUTS, CALIBRATION_TARGETS, calibration_table,
+                         measure_realized, requested_for)
+from param_sampler import REGULAR_RECIPE, generate_params_batch
+
+print("Testing calibration")
+print("=" * 80)
+
+GRID = {
+    'Ei': np.linspace(0.5, 1.0, 6),
+    'Fi': np.linspace(0.5, 1.0, 6),
+    'D2_8': np.linspace(0.0, 0.6, 5),
+    'D9_15': np.linspace(0.0, 0.2, 3)
+}
+
+cache_dir = tempfile.mkdtemp()
+try:
+    table = calibration_table(GRID, samples=32, cache_dir=cache_dir)
+
+    # on the coefficients Ei, Fi are the request and D2_8, D9_15 fixed multiples of it;
+    # the mesh form varies between the particles of a node
+    outputs = table['outputs']
+    mean, std = table['mean'], table['std']
+    nodes = np.stack(np.meshgrid(*[GRID[name] for name in CALIBRATION_INPUTS], indexing='ij'), axis=-1)
+    assert np.allclose(mean[..., outputs.index('Ei')], nodes[..., 0])
+    assert np.allclose(mean[..., outputs.index('Fi')], nodes[..., 1])
+    rough = nodes[..., 2] > 0
+    ratio = mean[..., outputs.index('D2_8')][rough] / nodes[..., 2][rough]
+    print("\nRealized / requested D2_8: {:.4f} (spread {:.1e})".format(ratio.mean(), np.ptp(ratio)))
+    assert np.ptp(ratio) < 1e-9
+    assert np.all(std[..., [outputs.index(n) for n in ('Ei', 'Fi', 'D2_8', 'D9_15')]] < 1e-9)
+    assert std[..., outputs.index('Ei_inertia')][rough].min() > 0
+
+    # targets in the calibrated outputs: inertia form and realized roughness
+    targets = np.array([
+        [0.80, 0.70, 0.45, 0.05],
+        [0.60, 0.80, 0.60, 0.10],
+        [0.88, 0.85, 0.75, 0.15]
+    ])
+    requested, residual = requested_for(table, targets)
+    print("Table residuals:", " ".join("{:.1e}".format(r) for r in residual))
+    assert np.all(residual < 1e-4)
+
+    # recipes with 'calibrate' replace their samples by the same requested inputs
+    recipe = dict(REGULAR_RECIPE, Ei=('constant', 0.80), Fi=('constant', 0.70),
+                  D2_8=('constant', 0.45), D9_15=('constant', 0.05),
+                  calibrate={'grid': GRID, 'samples': 32, 'cache_dir': cache_dir})
+    params = generate_params_batch(2, recipe, rng=np.random.RandomState(0))
+    assert np.allclose(np.column_stack([params[name] for name in CALIBRATION_INPUTS]), requested[0])
+finally:
+    shutil.rmtree(cache_dir)
+
+# draw particles at the requested inputs and measure them; the table means carry
+# sampling and interpolation errors of about 0.02
+samples = 64
+print("\n{:<26} {:<26} {:<26}".format('Target', 'Requested', 'Realized'))
+for row, target in enumerate(targets):
+    draws = np.repeat(requested[row][None], samples, axis=0)
+    measured = measure_realized(SHPSG_batch(*draws.T, rng=np.random.RandomState(row)))
+    realized = np.array([measured[name].mean() for name in CALIBRATION_TARGETS])
+    print("{:<26} {:<26} {:<26}".format(str(np.round(target, 3)), str(np.round(requested[row], 3)),
+                                        str(np.round(realized, 3))))
+    assert np.allclose(realized, target, atol=0.025), (realized, target)
+
+print("\n" + "=" * 80)
+print("Calibration verified!")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the multi-sphere clump fit: sphere count, containment and coverage"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from SHPSG import SHPSG
+from sh_basis import get_basis, sh_degree, sh_reconstruct
+from radial import radial_fit, points_inside
+from sdf import closest_points_on_triangles
+from clump import fit_clump, write_clump_templates
+
+print("Testing clump fit")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+coeff = SHPSG(0.6, 0.5, 0.2, 0.05, rng=rng)
+scale = 10.0
+base = get_basis(3, sh_degree(coeff))
+xyz = sh_reconstruct(coeff, base['Y']) * scale
+triangles = xyz[base['faces']]
+a, center = radial_fit(coeff)
+
+# Monte Carlo samples of the particle volume
+lo, hi = xyz.min(axis=0), xyz.max(axis=0)
+samples = lo + (hi - lo) * rng.rand(40000, 3)
+samples = samples[points_inside(a, samples, center * scale, scale=scale)]
+
+print("\n{:<10} {:<10} {:<10} {:<10}".format('Spheres', 'Fitted', 'Coverage', 'Sampled'))
+previous = 0.0
+clumps = []
+for num_spheres in (1, 5, 10, 20):
+    clump = fit_clump(coeff, num_spheres=num_spheres, scale=scale)
+    c, r = clump['centers'], clump['radii']
+    assert len(r) == num_spheres and c.shape == (num_spheres, 3)
+
+    # every sphere is inscribed: its radius is the distance of its centre to the mesh
+    distance = np.full(len(c), np.inf)
+    for t in triangles:
+        q, _ = closest_points_on_triangles(c, *np.broadcast_to(t[:, None], (3,) + c.shape))
+        distance = np.minimum(distance, np.linalg.norm(c - q, axis=1))
+    assert np.allclose(r, distance) and np.all(points_inside(a, c, center * scale, scale=scale))
+
+    # the reported coverage is the volume fraction the spheres cover
+    d2 = np.sum((samples[:, None, :] - c[None]) ** 2, axis=2)
+    sampled = np.mean(np.any(d2 <= r ** 2, axis=1))
+    print("{:<10d} {:<10d} {:<10.3f} {:<10.3f}".format(num_spheres, len(r), clump['coverage'], sampled))
+    assert abs(sampled - clump['coverage']) < 0.04
+    assert clump['coverage'] > previous
+    previous = clump['coverage']
+    clumps.append(clump)
+assert previous > 0.6
+
+# templates hold one 'x y z r' line per sphere
+work_dir = tempfile.mkdtemp()
+try:
+    paths = write_clump_templates(clumps, work_dir)
+    for clump, path in zip(clumps, paths):
+        data = np.loadtxt(path, ndmin=2)
+        assert np.allclose(data, np.column_stack((clump['centers'], clump['radii'])), rtol=1e-5)
+    assert len(open(os.path.join(work_dir, 'clump_index.txt')).readlines()) == len(clumps) + 1
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Clump fit verified!")
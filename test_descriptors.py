@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the shape descriptors measured on SH coefficients against a known set"""
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from sh_basis import sh_basis, unit_directions
+from SHPSG import SHPSG
+from descriptors import degree_norms, form_matrix, shape_descriptors
+
+print("Testing shape descriptors")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+degree = 16
+
+# known degree-1 block: the ellipsoid x(u) = A u with semi-axes 3, 2, 1.2, rotated
+axes = np.array([3.0, 2.0, 1.2])
+R = Rotation.from_euler('xyz', [0.4, -0.9, 1.3]).as_matrix()
+A = R @ np.diag(axes) @ R.T
+phi = np.arccos(1 - 2 * rng.rand(400))
+theta = np.pi * (1 - 2 * rng.rand(400))
+coeff = np.zeros((degree ** 2, 3), dtype=complex)
+coeff[:4] = np.linalg.lstsq(sh_basis(phi, theta, 2),
+                            (unit_directions(phi, theta) @ A.T).astype(complex), rcond=None)[0]
+assert np.allclose(coeff[0], 0)
+assert np.allclose(form_matrix(coeff), A)
+
+# known higher blocks: random blocks scaled to chosen norms d_n
+d = np.zeros(degree)
+d[1] = np.sqrt(4 * np.pi / 3 * np.sum(A ** 2))
+d[2:] = 0.3 * d[1] / np.arange(2, degree) ** 1.5
+for n in range(2, degree):
+    block = rng.randn(2 * n + 1, 3) + 1j * rng.randn(2 * n + 1, 3)
+    coeff[n * n:(n + 1) ** 2] = block * d[n] / np.linalg.norm(block)
+assert np.allclose(degree_norms(coeff)[1:], d[1:])
+
+result = shape_descriptors(coeff)
+expected = {'Ei': axes[1] / axes[0], 'Fi': axes[2] / axes[1],
+            'D2_8': d[2:9].sum() / d[1], 'D9_15': d[9:16].sum() / d[1]}
+print("\n{:<8} {:<12} {:<12}".format('Name', 'Measured', 'Known'))
+for name, value in expected.items():
+    print("{:<8} {:<12.6f} {:<12.6f}".format(name, result[name], value))
+    assert np.isclose(result[name], value)
+assert np.allclose(result['axes'], axes)
+
+# batches give the per-particle values; lower degrees pad D9_15 with zeros
+batch = shape_descriptors(np.stack([coeff, 2 * coeff]))
+for name, value in expected.items():
+    assert np.allclose(batch[name], value)
+assert shape_descriptors(coeff[:81])['D9_15'] == 0
+
+# SHPSG realizes the requested form indices
+print("\n{:<24} {:<20}".format('Requested (Ei, Fi)', 'Realized (Ei, Fi)'))
+for Ei, Fi in ((0.9, 0.8), (0.6, 0.5), (0.4, 0.7)):
+    realized = shape_descriptors(SHPSG(Ei, Fi, 0.2, 0.05, rng=np.random.RandomState(1)))
+    print("{:<24} {:<20}".format("{:.3f}, {:.3f}".format(Ei, Fi),
+                                 "{:.3f}, {:.3f}".format(realized['Ei'], realized['Fi'])))
+    assert np.isclose(realized['Ei'], Ei) and np.isclose(realized['Fi'], Fi)
+
+print("\n" + "=" * 80)
+print("Shape descriptors verified!")
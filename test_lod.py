@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the nested levels of detail and the packed LOD file"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from funcs import icosahedron, nested_subdivsurf, car2sph
+from sh_basis import sh_basis, sh_degree, sh_reconstruct
+from SHPSG import SHPSG
+from mass_properties import mass_properties, mesh_triangles
+from lod import nested_icospheres, reconstruct_lods, write_lod, read_lod
+
+print("Testing levels of detail")
+print("=" * 80)
+
+max_level = 3
+vertices, faces, counts = nested_icospheres(max_level)
+
+# every level is a closed mesh on a vertex prefix of the next one
+v, f = icosahedron()
+print("\n{:<8} {:<10} {:<10}".format('Level', 'Vertices', 'Faces'))
+for level in range(max_level + 1):
+    if level:
+        coarse = v
+        v, f = nested_subdivsurf(f, v)
+        assert np.array_equal(v[:len(coarse)], coarse)
+    print("{:<8d} {:<10d} {:<10d}".format(level, counts[level], len(faces[level])))
+    assert counts[level] == len(v) and np.array_equal(faces[level], f)
+    assert np.allclose(vertices[:counts[level]], v)
+    assert len(faces[level]) == 20 * 4 ** level and faces[level].max() == counts[level] - 1
+    edges = np.unique(np.sort(faces[level][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1), axis=0)
+    assert counts[level] - len(edges) + len(faces[level]) == 2
+# a second call returns the cached arrays
+assert nested_icospheres(max_level)[0] is vertices
+
+# one reconstruction gives every level: the prefix equals a direct reconstruction
+coeff = SHPSG(0.6, 0.5, 0.2, 0.05, rng=np.random.RandomState(1))
+scale = 20.0
+xyz, lod_faces, lod_counts = reconstruct_lods(coeff, max_level, scale)
+for level in range(max_level + 1):
+    sph = car2sph(vertices[:counts[level]])
+    direct = sh_reconstruct(coeff, sh_basis(sph[:, 4], sph[:, 5], sh_degree(coeff))) * scale
+    assert np.allclose(xyz[:lod_counts[level]], direct)
+
+work_dir = tempfile.mkdtemp()
+try:
+    # every level reads back as the float32 prefix and its faces
+    path = os.path.join(work_dir, 'particle.lod')
+    write_lod(path, coeff, max_level, scale)
+    volumes = []
+    for level in range(max_level + 1):
+        v, f = read_lod(path, level)
+        assert v.dtype == np.float32 and f.dtype == np.int32
+        assert np.array_equal(v, xyz[:counts[level]].astype(np.float32))
+        assert np.array_equal(f, faces[level])
+        volumes.append(mass_properties(mesh_triangles(v.astype(float), f))['volume'])
+    v, f = read_lod(path)
+    assert len(v) == counts[-1] and np.array_equal(f, faces[-1])
+    print("\nVolumes by level: " + ", ".join("{:.1f}".format(x) for x in volumes))
+    assert all(a < b for a, b in zip(volumes, volumes[1:]))
+    assert os.path.getsize(path) == (6 + 8 + 16 * (max_level + 1) + 12 * counts[-1] +
+                                     sum(12 * len(f) for f in faces))
+
+    # other files are rejected
+    bad = os.path.join(work_dir, 'bad.lod')
+    with open(bad, 'wb') as fh:
+        fh.write(b'solid ' + bytes(80))
+    try:
+        read_lod(bad)
+    except ValueError as e:
+        print("Foreign file rejected:", e)
+    else:
+        raise AssertionError("a file without the LOD magic was read")
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Levels of detail verified!")
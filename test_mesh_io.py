@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the indexed PLY/OBJ mesh export against the STL output"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from stl import mesh as stl_mesh
+
+from funcs import sh2stl
+from sh_basis import get_basis
+from SHPSG import SHPSG
+from mesh_io import write_ply, read_ply, write_obj, write_mesh
+from mass_properties import mass_properties, mesh_triangles
+from particle_generator import batch_generate_mixed_particles
+
+
+def read_obj(path):
+    """Vertices and 0-based faces of an OBJ file written by write_obj"""
+    lines = open(path).read().split('\n')
+    vertices = np.array([l.split()[1:] for l in lines if l.startswith('v ')], dtype=float)
+    faces = np.array([l.split()[1:] for l in lines if l.startswith('f ')], dtype=int) - 1
+    return vertices, faces
+
+
+print("Testing PLY/OBJ mesh export")
+print("=" * 80)
+
+base = get_basis(2, 16)
+coeff = SHPSG(0.6, 0.5, 0.2, 0.05, rng=np.random.RandomState(3))
+
+work_dir = tempfile.mkdtemp()
+try:
+    stl_path = os.path.join(work_dir, 'particle.stl')
+    vertices, faces = sh2stl(coeff, base['sph_cor'], base['vertices'], base['faces'], stl_path,
+                             D_eq=40.0)
+    facets = stl_mesh.Mesh.from_file(stl_path).vectors
+
+    # PLY is exact to float32, OBJ to its 7 significant digits; both rebuild the STL facets
+    print("\n{:<8} {:<10} {:<12} {:<10}".format('Format', 'Size (B)', 'Max error', 'Volume'))
+    ply_path, obj_path = os.path.join(work_dir, 'particle.ply'), os.path.join(work_dir, 'particle.obj')
+    write_ply(ply_path, vertices, faces)
+    write_obj(obj_path, vertices, faces)
+    volume = mass_properties(mesh_triangles(vertices, faces))['volume']
+    for name, path, (v, f), tol in (('PLY', ply_path, read_ply(ply_path), 0.0),
+                                    ('OBJ', obj_path, read_obj(obj_path), 1e-5)):
+        error = np.abs(v - vertices.astype(np.float32)).max() / np.abs(vertices).max()
+        v_volume = mass_properties(mesh_triangles(v.astype(float), f))['volume']
+        print("{:<8} {:<10d} {:<12.2e} {:<10.3f}".format(name, os.path.getsize(path), error, v_volume))
+        assert np.array_equal(f, faces) and error <= tol
+        assert np.allclose(v[f], facets, atol=1e-5 * np.abs(vertices).max())
+        assert abs(v_volume / volume - 1) < 1e-5
+        assert os.path.getsize(path) < os.path.getsize(stl_path)
+    print("STL reference {:d} B".format(os.path.getsize(stl_path)))
+
+    # write_mesh picks the format from the extension
+    write_mesh(os.path.join(work_dir, 'copy.PLY'), vertices, faces)
+    assert np.array_equal(read_ply(os.path.join(work_dir, 'copy.PLY'))[1], faces)
+    try:
+        write_mesh(os.path.join(work_dir, 'particle.off'), vertices, faces)
+    except ValueError as e:
+        print("\nUnknown format rejected:", e)
+    else:
+        raise AssertionError("unknown mesh format was accepted")
+
+    # the OBJ files listed in the mixed batch metadata exist and match their STLs
+    particles = batch_generate_mixed_particles(os.path.join(work_dir, 'mixed'), regular_count=2,
+                                               weird_count=1, include_png=False, verbose=False,
+                                               seed=5)
+    for p in particles:
+        v, f = read_obj(p['obj_path'])
+        stl = stl_mesh.Mesh.from_file(p['stl_path']).vectors
+        assert np.allclose(v[f], stl, atol=1e-5 * np.abs(v).max())
+    print("Mixed batch: {} OBJ files match their STLs".format(len(particles)))
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Mesh export verified!")
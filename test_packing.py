@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the RSA packing narrow phase and the overlap tolerance of its packings"""
+
+import numpy as np
+
+from SHPSG import SHPSG_batch
+from radial import (radial_fit, radial_function, radial_weights, radial_function_rows,
+                    stack_radial, points_inside, direction_angles)
+from packing import (rsa_pack, shape_table, penetration_depths, random_quaternions,
+                     quaternion_matrix, _overlaps)
+
+print("Testing RSA packing")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+coeffs = SHPSG_batch(*np.tile([0.6, 0.6, 0.2, 0.05], (4, 1)).T, rng=rng)
+shapes = [radial_fit(c)[0] for c in coeffs]
+
+# one basis evaluation for many particles gives the per-particle radial functions
+points = rng.randn(500, 3)
+rows = rng.randint(0, len(shapes), len(points))
+phi, theta = direction_angles(points)
+r = radial_function_rows(radial_weights(stack_radial(shapes)), phi, theta, rows)
+for k, a in enumerate(shapes):
+    assert np.allclose(r[rows == k], radial_function(a, phi[rows == k], theta[rows == k]))
+print("\nradial_function_rows matches radial_function for {} shapes".format(len(shapes)))
+
+# the batched narrow phase agrees with testing the neighbours one by one
+table = shape_table(shapes, level=2)
+agree, hits = 0, 0
+for trial in range(40):
+    n = 4
+    index = rng.randint(0, len(shapes), n + 1)
+    scale = rng.uniform(10, 20, n + 1)
+    position = rng.uniform(-12, 12, (n + 1, 3))
+    R = quaternion_matrix(random_quaternions(n + 1, rng))
+    bound = table['r_max'][index] * scale
+    batched = _overlaps(table, index[0], position[0], R[0], scale[0], index[1:], position[1:],
+                        R[1:], scale[1:], bound[1:], bound[0])
+    world = position[0] + (table['points'][index[0]] * scale[0]) @ R[0].T
+    single = False
+    for j in range(1, n + 1):
+        other = position[j] + (table['points'][index[j]] * scale[j]) @ R[j].T
+        single |= bool(points_inside(shapes[index[j]], world, position[j], R[j], scale[j]).any() or
+                       points_inside(shapes[index[0]], other, position[0], R[0], scale[0]).any())
+    agree += batched == single
+    hits += single
+print("Batched overlap test agrees on {}/40 random poses ({} overlapping)".format(agree, hits))
+assert agree == 40 and 0 < hits < 40
+
+# a packing stays inside the container, and its overlaps stay within the tolerance
+diameter, height, level = 120.0, 120.0, 3
+scales = rng.uniform(15, 30, 120)
+result = rsa_pack(shapes, diameter, height, scales, shape_index=rng.randint(0, len(shapes), 120),
+                  rng=np.random.RandomState(1), level=level)
+dense = shape_table(shapes, level=4)
+R = quaternion_matrix(result['quaternion'])
+world = result['position'][:, None] + np.einsum(
+    'kij,kpj->kpi', R, dense['points'][result['shape_index']] * result['scale'][:, None, None])
+assert np.all(np.hypot(world[..., 0], world[..., 1]) <= diameter / 2)
+assert np.all((world[..., 2] >= 0) & (world[..., 2] <= height))
+
+pen = penetration_depths(shapes, result, level=4)
+size = 2 * result['scale'][pen['pairs']].min(axis=1)
+worst = (pen['depth'] / size).max()
+print("\nLevel {}: {} placed, packing fraction {:.3f}, {} close pairs, "
+      "largest penetration {:.2%} of the diameter".format(
+          level, len(result['particle']), result['packing_fraction'], len(size), worst))
+assert len(result['particle']) > 80 and len(size) > 100
+assert worst < 0.006
+
+print("\n" + "=" * 80)
+print("RSA packing verified!")
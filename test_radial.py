@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the radial fit and the point-in-particle queries"""
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from SHPSG import SHPSG
+from sh_basis import sh_basis, sh_degree, sh_reconstruct, get_basis, unit_directions
+from radial import (radial_fit, radial_function, direction_angles, signed_radial_distance,
+                    points_inside)
+
+print("Testing radial functions")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+phi = np.arccos(1 - 2 * rng.rand(2000))
+theta = np.pi * (1 - 2 * rng.rand(2000))
+u = unit_directions(phi, theta)
+
+
+def star_radius(u):
+    """Radius of a star-shaped test body, even in the direction so its centroid term is 0"""
+    return 1.0 + 0.2 * u[:, 0] * u[:, 1] + 0.15 * u[:, 2] ** 2 - 0.1 * u[:, 0] ** 2
+
+
+# SH surface x(u) = r(u) u of the test body: r has degree 2, so x has degree 3
+Y = sh_basis(phi, theta, 4)
+coeff = np.linalg.lstsq(Y, (star_radius(u)[:, None] * u).astype(complex), rcond=None)[0]
+assert np.allclose(sh_reconstruct(coeff, Y), star_radius(u)[:, None] * u)
+
+# the radial fit recovers r exactly without smoothing, closely with the default
+print("\n{:<12} {:<10}".format('Smoothing', 'Max error'))
+for smoothing, tol in ((0.0, 1e-8), (1e-6, 5e-4)):
+    a, center = radial_fit(coeff, smoothing=smoothing)
+    error = np.abs(radial_function(a, phi, theta) - star_radius(u)).max()
+    print("{:<12.0e} {:<10.2e}".format(smoothing, error))
+    assert error < tol
+assert np.allclose(center, 0)
+
+# the real contraction equals the real part of the complex basis expansion
+degree = sh_degree(a[:, None])
+assert np.allclose(radial_function(a, phi, theta), (sh_basis(phi, theta, degree) @ a).real)
+
+# an SHPSG particle without folds is reproduced to the sampling accuracy
+particle = SHPSG(0.8, 0.8, 0.05, 0.0, rng=np.random.RandomState(0))
+a, center = radial_fit(particle)
+xyz = sh_reconstruct(particle, get_basis(5, sh_degree(particle))['Y']) - center
+p_phi, p_theta = direction_angles(xyz)
+error = np.abs(radial_function(a, p_phi, p_theta) / np.linalg.norm(xyz, axis=1) - 1).max()
+print("\nSHPSG particle: max relative radius error {:.2e} at icosphere level 5".format(error))
+assert error < 2e-3
+
+# posed queries: points just inside / outside the surface along every direction
+position = np.array([3.0, -1.0, 2.0])
+rotation = Rotation.from_euler('zyx', [0.4, 1.2, -0.3]).as_matrix()
+scale = 7.5
+r = radial_function(a, phi, theta)
+world_in = position + (0.99 * r[:, None] * u * scale) @ rotation.T
+world_out = position + (1.01 * r[:, None] * u * scale) @ rotation.T
+assert np.all(points_inside(a, world_in, position, rotation, scale))
+assert not np.any(points_inside(a, world_out, position, rotation, scale))
+d = signed_radial_distance(a, world_in, position, rotation, scale, chunk=333)
+assert np.allclose(d, -0.01 * r * scale)
+assert np.allclose(d, signed_radial_distance(a, world_in, position, rotation, scale))
+# an unposed query of the body-frame points gives the same answer
+assert np.allclose(signed_radial_distance(a, 0.99 * r[:, None] * u), -0.01 * r)
+print("Posed inside/outside queries and signed radial distances verified")
+
+print("\n" + "=" * 80)
+print("Radial functions verified!")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test parameter recipes through the per-particle batch path"""
+
+import shutil
+import tempfile
+import numpy as np
+
+from param_sampler import (generate_params_batch, mean_particle_volume, design_points,
+                           PSD_RECIPE, GRADUAL_RECIPE)
+from particle_generator import batch_generate_particles, generate_random_particle_params
+
+print("Testing recipes through batch_generate_particles")
+print("=" * 80)
+
+# Transition schedule without an explicit cycle: one-particle calls must still
+# walk through every stage of the batch
+TRANSITION = {
+    'transition': {
+        'stages': 4,
+        'start': {'Ei': 0.9, 'Fi': 0.9, 'D2_8': 0.05, 'D9_15': 0.0},
+        'end': {'Ei': 0.45, 'Fi': 0.45, 'D2_8': 0.3, 'D9_15': 0.2}
+    },
+    'D_eq': ('uniform', 30, 90),
+    'category': 'gradual'
+}
+
+output_dir = tempfile.mkdtemp()
+try:
+    particles = batch_generate_particles(8, output_dir, include_png=False, verbose=False,
+                                         seed=1, recipe=TRANSITION)
+finally:
+    shutil.rmtree(output_dir)
+categories = [p['category'] for p in particles]
+print("\nTransition categories:", " ".join(categories))
+print("Transition Ei:        ", " ".join("{:.2f}".format(p['Ei']) for p in particles))
+assert categories == ['gradual_{}'.format(k // 2) for k in range(8)], categories
+assert np.all(np.diff([p['Ei'] for p in particles]) <= 0)
+
+# The hand-written gradual transition follows the same cycle and stages as GRADUAL_RECIPE
+for cycle in (None, 20):
+    recipe = GRADUAL_RECIPE if cycle is None else dict(
+        GRADUAL_RECIPE, transition=dict(GRADUAL_RECIPE['transition'], cycle=cycle))
+    expected = list(generate_params_batch(120, recipe, np.random.RandomState(0))['category'])
+    stages = [generate_random_particle_params(particle_index=i, cycle=cycle,
+                                              rng=np.random.RandomState(0))['category']
+              for i in range(120)]
+    print("Gradual stages, cycle {}: {}".format(cycle, " ".join(s[-1] for s in stages[:50:5])))
+    assert stages == expected
+
+# Latin hypercube design: one-particle calls must take their rows from one
+# design, so the batch is stratified (one point per stratum in every dimension)
+LHS = {
+    'Ei': ('uniform', 0.4, 0.9),
+    'Fi': ('uniform', 0.4, 0.9),
+    'D2_8': ('uniform', 0.0, 0.3),
+    'D9_15': ('uniform', 0.0, 0.2),
+    'D_eq': ('uniform', 30, 90),
+    'design': {'method': 'lhs', 'params': ('Ei', 'Fi', 'D2_8', 'D9_15'), 'seed': 3}
+}
+
+output_dir = tempfile.mkdtemp()
+try:
+    particles = batch_generate_particles(8, output_dir, include_png=False, verbose=False,
+                                         seed=1, recipe=LHS)
+finally:
+    shutil.rmtree(output_dir)
+for name in LHS['design']['params']:
+    lo, hi = LHS[name][1:]
+    strata = sorted(int((p[name] - lo) / (hi - lo) * 8) for p in particles)
+    print("LHS strata of {:<6}".format(name), strata)
+    assert strata == list(range(8)), strata
+
+# one-row calls (as made per particle) slice a single design that is built once
+full = design_points(4096, 4, 'lhs', seed=3)
+rows = np.vstack([design_points(1, 4, 'lhs', seed=3, start_index=i, total=4096)
+                  for i in range(4096)])
+assert np.array_equal(rows, full)
+
+# a shard without 'total' cannot be placed in the design
+try:
+    generate_params_batch(4, LHS, np.random.RandomState(0), start_index=4)
+except ValueError as e:
+    print("Shard without total rejected:", e)
+else:
+    raise AssertionError("lhs shard without total was accepted")
+
+# Truncated size distribution: no mass piled on the window bounds, and the
+# fill budget uses the mean volume of the same truncated distribution
+D_eq = generate_params_batch(20000, PSD_RECIPE, np.random.RandomState(0))['D_eq']
+expected = mean_particle_volume(PSD_RECIPE['D_eq'])
+sampled = np.pi / 6 * np.mean(D_eq ** 3)
+print("\nPSD D_eq range: {:.2f}-{:.2f}, mean volume {:.0f} (sampled {:.0f})".format(
+    D_eq.min(), D_eq.max(), expected, sampled))
+assert 30.0 < D_eq.min() and D_eq.max() < 90.0
+assert abs(sampled / expected - 1) < 0.01
+
+print("\n" + "=" * 80)
+print("Recipes verified!")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the volume-exact D_eq scaling of the written meshes"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from stl import mesh as stl_mesh
+
+from funcs import sh2stl
+from sh_basis import get_basis
+from SHPSG import SHPSG
+from mass_properties import mass_properties
+from particle_generator import batch_generate_particles
+
+print("Testing scale_mode='volume'")
+print("=" * 80)
+
+base = get_basis(2, 16)
+coeff = SHPSG(0.6, 0.5, 0.3, 0.1, rng=np.random.RandomState(2))
+D_eq = 55.0
+
+work_dir = tempfile.mkdtemp()
+try:
+    # the STL on disk encloses exactly the volume of the D_eq sphere, centred on the origin
+    print("\n{:<8} {:<12} {:<12} {:<12}".format('Mode', 'D_eq (STL)', 'Requested', 'Centroid'))
+    results = {}
+    for mode in ('radius', 'volume'):
+        path = os.path.join(work_dir, mode + '.stl')
+        sh2stl(coeff, base['sph_cor'], base['vertices'], base['faces'], path,
+               D_eq=D_eq, scale_mode=mode)
+        props = mass_properties(stl_mesh.Mesh.from_file(path).vectors.astype(float))
+        results[mode] = props
+        print("{:<8} {:<12.4f} {:<12.4f} {:<12.2e}".format(
+            mode, props['D_eq'], D_eq, np.abs(props['centroid']).max()))
+    assert abs(results['volume']['D_eq'] / D_eq - 1) < 1e-5
+    assert np.abs(results['volume']['centroid']).max() < 1e-3
+    # the radius mode keeps the original D_eq/2 multiplier, which misses the volume
+    assert abs(results['radius']['D_eq'] / D_eq - 1) > 1e-2
+
+    try:
+        sh2stl(coeff, base['sph_cor'], base['vertices'], base['faces'],
+               os.path.join(work_dir, 'bad.stl'), scale_mode='area')
+    except ValueError as e:
+        print("\nUnknown mode rejected:", e)
+    else:
+        raise AssertionError("unknown scale_mode was accepted")
+
+    # through the batch path the metadata volume diameter equals the requested D_eq
+    particles = batch_generate_particles(4, os.path.join(work_dir, 'batch'), include_png=False,
+                                         verbose=False, seed=4, scale_mode='volume')
+    for p in particles:
+        print("{}: D_eq {:.4f} mesh {:.4f}".format(p['filename'], p['D_eq'], p['D_eq_volume']))
+        assert abs(p['D_eq_volume'] / p['D_eq'] - 1) < 1e-9
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Volume scaling verified!")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the SH basis engine against scipy and the original per-term expansion"""
+
+import numpy as np
+from scipy import special
+
+from sh_basis import sh_basis, sh_orders, sh_reconstruct, get_basis
+from SHPSG import SHPSG
+
+print("Testing SH basis engine")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+phi = np.concatenate(([0.0, np.pi], np.arccos(1 - 2 * rng.rand(200))))
+theta = np.concatenate(([0.0, 0.0], np.pi * (1 - 2 * rng.rand(200))))
+degree = 16
+
+# scipy reference, column by column in the (n, m = -n..n) order of the basis
+n, m = sh_orders(degree)
+if hasattr(special, 'sph_harm_y'):
+    reference = special.sph_harm_y(n[None, :], m[None, :], phi[:, None], theta[:, None])
+else:
+    reference = special.sph_harm(m[None, :], n[None, :], theta[:, None], phi[:, None])
+Y = sh_basis(phi, theta, degree)
+error = np.abs(Y - reference).max()
+print("\nBasis vs scipy ({} points, L = {}): max error {:.2e}".format(len(phi), degree, error))
+assert error < 1e-10
+
+# reconstruction on the cached base mesh equals the per-term sum
+base = get_basis(2, degree)
+coeff = SHPSG(0.7, 0.6, 0.2, 0.05, rng=np.random.RandomState(1))
+xyz = sh_reconstruct(coeff, base['Y'])
+phi_b, theta_b = base['sph_cor'][:, 4], base['sph_cor'][:, 5]
+direct = np.zeros((len(phi_b), 3), dtype=complex)
+for k in range(degree * degree):
+    if hasattr(special, 'sph_harm_y'):
+        y = special.sph_harm_y(n[k], m[k], phi_b, theta_b)
+    else:
+        y = special.sph_harm(m[k], n[k], theta_b, phi_b)
+    direct += y[:, None] * coeff[k]
+error = np.abs(xyz - direct.real).max()
+print("Reconstruction vs per-term sum: max error {:.2e}".format(error))
+assert error < 1e-10
+
+# a basis built for a higher degree reconstructs lower-degree coefficients
+error = np.abs(sh_reconstruct(coeff, get_basis(2, 20)['Y']) - xyz).max()
+print("Higher-degree basis reuse:      max error {:.2e}".format(error))
+assert error < 1e-12
+
+print("\n" + "=" * 80)
+print("SH basis verified!")
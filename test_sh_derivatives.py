@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the SH derivative bases and the analytic surface curvature"""
+
+import numpy as np
+
+from sh_basis import (sh_basis, sh_basis_derivatives, surface_geometry, unit_directions,
+                      POLE_EPS)
+from SHPSG import SHPSG
+
+print("Testing SH derivative bases and curvature")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+phi = np.arccos(np.clip(1 - 2 * rng.rand(300), -0.99, 0.99))
+theta = np.pi * (1 - 2 * rng.rand(300))
+degree = 12
+
+# analytic derivative bases against central differences of sh_basis
+basis = sh_basis_derivatives(phi, theta, degree, second=True)
+h = 1e-5
+Y_phi = (sh_basis(phi + h, theta, degree) - sh_basis(phi - h, theta, degree)) / (2 * h)
+Y_theta = (sh_basis(phi, theta + h, degree) - sh_basis(phi, theta - h, degree)) / (2 * h)
+Y_phiphi = (sh_basis_derivatives(phi + h, theta, degree)['Y_phi'] -
+            sh_basis_derivatives(phi - h, theta, degree)['Y_phi']) / (2 * h)
+print("\n{:<14} {:<10}".format('Basis', 'Max error'))
+for name, reference, tol in (('Y_phi', Y_phi, 1e-6), ('Y_theta', Y_theta, 1e-6),
+                             ('Y_phiphi', Y_phiphi, 1e-6)):
+    error = np.abs(basis[name] - reference).max() / np.abs(reference).max()
+    print("{:<14} {:<10.2e}".format(name, error))
+    assert error < tol
+
+
+def fit_surface(points, phi, theta, degree):
+    """Least-squares SH coefficients of a star-shaped surface given at (phi, theta)"""
+    Y = sh_basis(phi, theta, degree)
+    return np.linalg.lstsq(Y, points.astype(complex), rcond=None)[0]
+
+
+# Sphere and ellipsoid: degree-2 expansions are exact, so the curvatures are known
+grid_phi = np.arccos(1 - 2 * rng.rand(400))
+grid_theta = np.pi * (1 - 2 * rng.rand(400))
+directions = unit_directions(grid_phi, grid_theta)
+eval_phi = np.clip(phi, POLE_EPS, np.pi - POLE_EPS)
+basis = sh_basis_derivatives(eval_phi, theta, 3, second=True)
+
+radius = 2.5
+sphere = surface_geometry(fit_surface(radius * directions, grid_phi, grid_theta, 3), basis)
+print("\nSphere r = {}: k1 {:.6f} k2 {:.6f} (1/r = {:.6f})".format(
+    radius, sphere['k1'].mean(), sphere['k2'].mean(), 1 / radius))
+assert np.allclose(sphere['k1'], 1 / radius) and np.allclose(sphere['k2'], 1 / radius)
+assert np.allclose(sphere['normals'], unit_directions(eval_phi, theta))
+
+axes = np.array([3.0, 2.0, 1.0])
+ellipsoid = surface_geometry(fit_surface(axes * directions, grid_phi, grid_theta, 3), basis)
+x = ellipsoid['xyz']
+gauss = 1.0 / (np.prod(axes) ** 2 * np.sum(x ** 2 / axes ** 4, axis=1) ** 2)
+normals = x / axes ** 2
+normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+error = np.abs(ellipsoid['gauss'] / gauss - 1).max()
+print("Ellipsoid {}: Gaussian curvature max relative error {:.2e}".format(axes, error))
+assert error < 1e-8
+assert np.allclose(ellipsoid['normals'], normals)
+assert np.all(ellipsoid['k1'] >= ellipsoid['k2']) and np.all(ellipsoid['k2'] > 0)
+
+# a batch of particles gives the same geometry as one particle at a time
+coeffs = np.stack([SHPSG(0.7, 0.6, 0.2, 0.05, rng=np.random.RandomState(s)) for s in range(3)])
+basis = sh_basis_derivatives(eval_phi, theta, 16, second=True)
+batch = surface_geometry(coeffs, basis)
+for k in range(len(coeffs)):
+    single = surface_geometry(coeffs[k], basis)
+    assert all(np.allclose(batch[name][k], single[name]) for name in single)
+print("Batched geometry matches per-particle geometry ({} particles)".format(len(coeffs)))
+
+print("\n" + "=" * 80)
+print("SH derivatives verified!")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the Wigner-D rotations of SH fields and particles"""
+
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+from sh_basis import sh_basis, sh_reconstruct, unit_directions
+from SHPSG import SHPSG
+from radial import direction_angles
+from sh_rotation import euler_zyz, wigner_D, rotate_sh, rotate_particle
+
+
+def rz(angle):
+    return Rotation.from_euler('z', angle).as_matrix()
+
+
+def ry(angle):
+    return Rotation.from_euler('y', angle).as_matrix()
+
+
+print("Testing SH rotations")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+# random rotations plus the gimbal-lock cases beta = 0 and beta = pi (also exact)
+R = np.concatenate((Rotation.random(5, random_state=1).as_matrix(),
+                    [np.eye(3), rz(0.7), rz(0.3) @ ry(np.pi) @ rz(-1.1),
+                     np.diag([-1.0, 1.0, -1.0]) @ rz(0.4)]))
+
+# Euler angles rebuild the matrices
+alpha, beta, gamma = euler_zyz(R)
+rebuilt = np.array([rz(a) @ ry(b) @ rz(g) for a, b, g in zip(alpha, beta, gamma)])
+assert np.allclose(rebuilt, R)
+
+# D blocks are unitary and compose like the rotations
+degree = 8
+blocks, pair = wigner_D(degree, R), wigner_D(degree, R[:4] @ R[4:8])
+for n in range(degree):
+    D = blocks[n]
+    assert np.allclose(D @ np.conj(np.swapaxes(D, 1, 2)), np.eye(2 * n + 1))
+    assert np.allclose(pair[n], D[:4] @ D[4:8])
+
+# a rotated scalar field f'(u) = f(R^-1 u), evaluated pointwise
+phi = np.arccos(1 - 2 * rng.rand(500))
+theta = np.pi * (1 - 2 * rng.rand(500))
+u = unit_directions(phi, theta)
+Y = sh_basis(phi, theta, degree)
+a = rng.randn(degree ** 2) + 1j * rng.randn(degree ** 2)
+rotated = rotate_sh(a, R)
+print("\n{:<10} {:<12}".format('Rotation', 'Max error'))
+for k in range(len(R)):
+    back_phi, back_theta = direction_angles(u @ R[k])
+    reference = sh_basis(back_phi, back_theta, degree) @ a
+    error = np.abs(Y @ rotated[k] - reference).max()
+    print("{:<10d} {:<12.2e}".format(k, error))
+    assert error < 1e-10
+assert np.allclose(rotate_sh(a, R[0]), rotated[0])
+
+# a rotated particle x'(u) = R x(R^-1 u)
+coeff = SHPSG(0.6, 0.5, 0.2, 0.05, rng=np.random.RandomState(2))
+degree = int(np.sqrt(len(coeff)))
+Y = sh_basis(phi, theta, degree)
+particles = rotate_particle(coeff, R)
+for k in range(len(R)):
+    back_phi, back_theta = direction_angles(u @ R[k])
+    reference = sh_reconstruct(coeff, sh_basis(back_phi, back_theta, degree)) @ R[k].T
+    assert np.allclose(sh_reconstruct(particles[k], Y), reference, atol=1e-9)
+assert np.allclose(rotate_particle(coeff, R[3]), particles[3])
+print("\nRotated particles match R x(R^-1 u) for {} rotations (degree {})".format(len(R), degree))
+
+print("\n" + "=" * 80)
+print("SH rotations verified!")
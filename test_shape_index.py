@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the descriptor-space shape index against brute-force search"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from shape_index import (INDEX_FEATURES, DEFAULT_SCALES, build_shape_index, add_to_index,
+                         nearest, is_duplicate, save_shape_index, load_shape_index)
+
+
+def random_features(rng, count):
+    """Descriptor dict of count random particles"""
+    return {'Ei': rng.uniform(0.3, 1.0, count), 'Fi': rng.uniform(0.3, 1.0, count),
+            'D2_8': rng.uniform(0.0, 0.6, count), 'D9_15': rng.uniform(0.0, 0.2, count),
+            'D_eq': rng.uniform(30, 90, count)}
+
+
+def brute_force(features, ids, targets, k, names):
+    """k nearest ids and scaled distances by exhaustive search"""
+    def scaled(values):
+        return np.column_stack([(np.log(values[n]) if n == 'D_eq' else values[n]) / DEFAULT_SCALES[n]
+                                for n in names])
+    d = np.sqrt(np.sum((scaled(targets)[:, None] - scaled(features)[None]) ** 2, axis=2))
+    order = np.argsort(d, axis=1)[:, :k]
+    return np.take_along_axis(d, order, axis=1), ids[order]
+
+
+print("Testing shape index")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+features = random_features(rng, 600)
+ids = np.arange(1000, 1600)
+targets = random_features(rng, 50)
+
+# tree, pending buffer and both: every state matches the exhaustive search
+index = build_shape_index({n: v[:400] for n, v in features.items()}, ids[:400])
+print("\n{:<28} {:<10} {:<10} {:<10}".format('State', 'Tree', 'Pending', 'Max error'))
+for added in (0, 100, 200):
+    for j in range(len(index['features']) + len(index['pending']), 400 + added):
+        add_to_index(index, int(ids[j]), **{n: v[j] for n, v in features.items()})
+    count = 400 + added
+    subset = {n: v[:count] for n, v in features.items()}
+    for names in (INDEX_FEATURES, ('Ei', 'Fi'), ('D2_8', 'D_eq')):
+        d, i = nearest(index, 3, **{n: targets[n] for n in names})
+        d_ref, i_ref = brute_force(subset, ids[:count], targets, 3, names)
+        assert np.array_equal(i, i_ref) and np.allclose(d, d_ref)
+    print("{:<28} {:<10d} {:<10d} {:<10.1e}".format(
+        "{} particles".format(count), len(index['features']), len(index['pending']),
+        np.abs(d - d_ref).max()))
+# the buffer is flushed into the trees once it outgrows max(256, N / 4)
+extra = random_features(rng, 57)
+for j in range(57):
+    add_to_index(index, 2000 + j, **{n: v[j] for n, v in extra.items()})
+assert len(index['pending']) == 0 and len(index['features']) == 657
+
+# duplicates: an indexed particle is found at distance 0
+duplicate, other = is_duplicate(index, 1e-9, **{n: v[17] for n, v in features.items()})
+assert duplicate and other == ids[17]
+duplicate, other = is_duplicate(index, 1e-9, Ei=0.123, Fi=0.987, D2_8=0.9, D9_15=0.5, D_eq=5.0)
+assert not duplicate and other >= 0
+
+# empty index and fewer particles than k
+d, i = nearest(build_shape_index(), 2, Ei=0.5)
+assert np.all(np.isinf(d)) and np.all(i == -1)
+small = build_shape_index({n: v[:2] for n, v in features.items()})
+d, i = nearest(small, 4, Ei=[0.5, 0.7], Fi=0.6)
+assert d.shape == (2, 4) and np.all(i[:, 2:] == -1) and np.all(np.isinf(d[:, 2:]))
+assert set(i[0, :2]) == {0, 1}
+try:
+    nearest(index, 1, sphericity=0.9)
+except ValueError as e:
+    print("\nQuery without index features rejected:", e)
+else:
+    raise AssertionError("a query without index features was accepted")
+
+# save / load: pending particles are written, queries and scales are preserved
+work_dir = tempfile.mkdtemp()
+try:
+    scales = dict(DEFAULT_SCALES, D_eq=0.5)
+    index = build_shape_index({n: v[:300] for n, v in features.items()}, ids[:300], scales)
+    for j in range(300, 320):
+        add_to_index(index, int(ids[j]), **{n: v[j] for n, v in features.items()})
+    before = nearest(index, 5, **targets)
+    path = os.path.join(work_dir, 'shape_index.npz')
+    save_shape_index(path, index)
+    loaded = load_shape_index(path)
+    assert len(loaded['features']) == 320 and not loaded['pending']
+    assert np.array_equal(loaded['ids'], ids[:320])
+    assert np.array_equal(loaded['scales'], [scales[n] for n in INDEX_FEATURES])
+    after = nearest(loaded, 5, **targets)
+    assert np.array_equal(before[1], after[1]) and np.allclose(before[0], after[0])
+    print("Saved index of {} particles reloads with identical queries".format(len(loaded['ids'])))
+finally:
+    shutil.rmtree(work_dir)
+
+print("\n" + "=" * 80)
+print("Shape index verified!")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the particle size distribution samplers and mean_particle_volume"""
+
+import numpy as np
+from scipy import integrate, special
+
+from param_sampler import (sample_distribution, distribution_cdf, distribution_ppf,
+                           mean_particle_volume)
+
+print("Testing size distributions")
+print("=" * 80)
+
+rng = np.random.RandomState(0)
+size = 200000
+probe = np.linspace(0.02, 0.98, 25)
+
+RR = ('rosin_rammler', 60.0, 3.0)
+SIEVE = ('sieve', [20.0, 40.0, 60.0, 90.0], [0.0, 0.3, 0.8, 1.0])
+TRUNCATED = ('truncated', ('lognormal', np.log(55.0), 0.3), 30.0, 90.0)
+LOGNORMAL = TRUNCATED[1]
+
+
+def truncated_cdf(x):
+    lo, hi = TRUNCATED[2:]
+    f_lo, f_hi = distribution_cdf(LOGNORMAL, lo), distribution_cdf(LOGNORMAL, hi)
+    return np.clip((distribution_cdf(LOGNORMAL, x) - f_lo) / (f_hi - f_lo), 0.0, 1.0)
+
+
+CDFS = {
+    'rosin_rammler': lambda x: 1 - np.exp(-(x / RR[1]) ** RR[2]),
+    'sieve': lambda x: np.interp(np.log(x), np.log(SIEVE[1]), SIEVE[2]),
+    'truncated': truncated_cdf
+}
+
+# Samples follow the closed-form CDFs (Kolmogorov-Smirnov distance at the probes)
+print("\n{:<16} {:<12} {:<12}".format('Distribution', 'KS distance', 'CDF(PPF(u))'))
+for spec in (RR, SIEVE, TRUNCATED):
+    samples = np.sort(sample_distribution(spec, size, rng))
+    x = distribution_ppf(spec, probe)
+    empirical = np.searchsorted(samples, x) / float(size)
+    ks = np.abs(empirical - CDFS[spec[0]](x)).max()
+    roundtrip = np.abs(CDFS[spec[0]](x) - probe).max()
+    print("{:<16} {:<12.2e} {:<12.2e}".format(spec[0], ks, roundtrip))
+    assert ks < 0.005 and roundtrip < 1e-9
+    if spec[0] != 'truncated':
+        assert np.allclose(distribution_cdf(spec, x), probe)
+
+# The truncated window holds all samples without piling mass on its bounds
+samples = sample_distribution(TRUNCATED, size, rng)
+assert samples.min() > 30.0 and samples.max() < 90.0
+assert np.mean(samples < 30.5) < 0.01 and np.mean(samples > 89.5) < 0.01
+
+# Mean volumes against closed forms and numerical integration
+mean_volume = {
+    'uniform': np.pi / 6 * (90.0 ** 4 - 30.0 ** 4) / (4 * 60.0),
+    'rosin_rammler': np.pi / 6 * RR[1] ** 3 * special.gamma(1 + 3.0 / RR[2]),
+    'truncated': np.pi / 6 * integrate.quad(
+        lambda d: d ** 3 * np.exp(-(np.log(d) - LOGNORMAL[1]) ** 2 / (2 * LOGNORMAL[2] ** 2)) /
+        (d * LOGNORMAL[2] * np.sqrt(2 * np.pi)), 30.0, 90.0)[0] /
+        (distribution_cdf(LOGNORMAL, 90.0) - distribution_cdf(LOGNORMAL, 30.0))
+}
+print("\n{:<16} {:<14} {:<14} {:<10}".format('Distribution', 'Mean volume', 'Reference', 'Rel. err'))
+for spec in (('uniform', 30.0, 90.0), RR, TRUNCATED):
+    value = mean_particle_volume(spec)
+    error = value / mean_volume[spec[0]] - 1
+    print("{:<16} {:<14.1f} {:<14.1f} {:<10.1e}".format(spec[0], value, mean_volume[spec[0]], error))
+    assert abs(error) < 2e-3
+
+print("\n" + "=" * 80)
+print("Size distributions verified!")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the mesh validity checks and the redraw of invalid particles"""
+
+import shutil
+import tempfile
+import numpy as np
+
+from funcs import icosahedron, subdivsurf, cleanmesh
+from validity import check_validity
+from particle_generator import batch_generate_mixed_particles, generate_particle
+
+print("Testing mesh validity")
+print("=" * 80)
+
+# By default validity is only recorded: wrinkled angular/rough output is kept and
+# reported invalid, nothing is redrawn
+output_dir = tempfile.mkdtemp()
+try:
+    particles = batch_generate_mixed_particles(output_dir, regular_count=8, weird_count=4,
+                                               include_png=False, verbose=False, seed=3)
+finally:
+    shutil.rmtree(output_dir)
+print("\nDefault (validity recorded only)")
+print("{:<8} {:<6} {:<10} {:<10} {:<8} {:<6}".format(
+    'Cat', 'Valid', 'Inverted', 'Crossing', 'Folded', 'Retry'))
+for p in particles:
+    print("{:<8} {:<6} {:<10d} {:<10d} {:<8.1%} {:<6d}".format(
+        p['category'], 'yes' if p['valid'] else 'NO', p['inverted_faces'],
+        p['self_intersections'], p['folded_volume'], p['retries']))
+assert all(p['retries'] == 0 for p in particles)
+assert all(p['valid'] == (p['intersection_free'] and p['folded_volume'] == 0) for p in particles)
+assert not all(p['valid'] for p in particles)
+
+# The opt-in folded volume tolerance accepts the generator's wrinkles without redraws
+output_dir = tempfile.mkdtemp()
+try:
+    particles = batch_generate_mixed_particles(output_dir, regular_count=8, weird_count=4,
+                                               include_png=False, verbose=False, seed=3,
+                                               require_valid=True, max_folded=0.15)
+finally:
+    shutil.rmtree(output_dir)
+print("\nrequire_valid with max_folded=0.15")
+print("{:<8} {:<6} {:<10} {:<10} {:<8} {:<6}".format(
+    'Cat', 'Valid', 'Inverted', 'Crossing', 'Folded', 'Retry'))
+for p in particles:
+    print("{:<8} {:<6} {:<10d} {:<10d} {:<8.1%} {:<6d}".format(
+        p['category'], 'yes' if p['valid'] else 'NO', p['inverted_faces'],
+        p['self_intersections'], p['folded_volume'], p['retries']))
+assert all(p['valid'] and p['retries'] == 0 for p in particles)
+assert all(p['intersection_free'] == (p['self_intersections'] == 0) for p in particles)
+
+# Strict require_valid redraws until the mesh does not intersect itself (which
+# takes many more redraws than the default allows)
+output_dir = tempfile.mkdtemp()
+try:
+    particles = batch_generate_mixed_particles(output_dir, regular_count=8, weird_count=0,
+                                               include_png=False, verbose=False, seed=3,
+                                               require_valid=True, max_retries=30)
+finally:
+    shutil.rmtree(output_dir)
+print("\nStrict require_valid: retries", [p['retries'] for p in particles])
+assert all(p['valid'] and p['self_intersections'] == 0 for p in particles)
+assert any(p['retries'] > 0 for p in particles)
+
+# Gross failures are still caught
+vertices, faces = icosahedron()
+for level in range(2):
+    vertices, faces = subdivsurf(faces, vertices)
+    vertices, faces = cleanmesh(faces, vertices)
+sphere = check_validity(vertices, faces)
+inside_out = check_validity(vertices, faces[:, ::-1])
+# two spheres a quarter radius apart in one surface: a sheet through the body
+pair = np.vstack((vertices, vertices + [0.25, 0.0, 0.0]))
+overlap = check_validity(pair, np.vstack((faces, faces + len(vertices))), center=[0.125, 0.0, 0.0])
+print("\nSphere:          ", sphere)
+print("Inside out:      ", inside_out)
+print("Overlapping pair:", overlap)
+assert sphere['valid'] and sphere['inverted_faces'] == 0 and sphere['self_intersections'] == 0
+assert not inside_out['valid'] and inside_out['folded_volume'] == 1.0
+assert not overlap['valid'] and not overlap['intersection_free']
+# the folded volume tolerance is opt-in and ignores the intersections
+assert check_validity(pair, np.vstack((faces, faces + len(vertices))), center=[0.125, 0.0, 0.0],
+                      max_folded=0.5)['valid']
+
+# Only numerical failures are redrawn; programming errors propagate
+def broken_params(rng):
+    raise TypeError("broken parameter generator")
+
+try:
+    generate_particle(broken_params, 'unused.stl', None, None, vertices, faces, 0, (0,))
+except TypeError as e:
+    print("\nProgramming error propagated:", e)
+else:
+    raise AssertionError("TypeError was swallowed by the redraw loop")
+
+print("\n" + "=" * 80)
+print("Mesh validity verified!")
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Mesh validity checks for reconstructed SH particles
+
+Amplified coefficients (coeff_multiplier 5-10x for weird particles) can fold
+the SH surface over itself. Two cheap tests catch this before the STL goes
+to a DEM mesher:
+
+- inverted faces: a face whose normal points against the radial direction
+  from the particle centre has been turned inside out (SHPSG particles are
+  star-shaped unless folded)
+- self-intersections: triangles are binned into a uniform spatial hash grid
+  and only triangles sharing a cell are tested against each other
+
+A mesh is valid when it has no self-intersections and no folded volume:
+the fraction of the enclosed volume whose winding number is not 1 (covered
+twice by a fold, or inside out). The folded volume is 0 for a proper
+surface, 1 for an inside-out one and large where sheets pass through the
+body. The inverted face count is diagnostic only: angular and rough
+particles are not star-shaped, so the radial test also flags proper faces.
+
+Normal generator output is not always valid in this sense. The x, y, z
+expansions of angular and rough SHPSG particles fold slightly where the
+roughness terms overlap (level-2 meshes: about half of the regular and
+nearly all weird particles intersect themselves, with a folded volume up to
+about 2% for regular and 13% for weird particles). Such wrinkles are
+tolerated only when a caller asks for it with max_folded, which judges the
+mesh on its folded volume alone.
+"""
+
+import numpy as np
+
+
+def inverted_faces(xyz, faces, center=None):
+    """
+    Faces whose outward normal points towards the particle centre.
+
+    Parameters:
+    - xyz: (V, 3) surface points
+    - faces: (F, 3) face indices (outward wound, as produced by icosahedron)
+    - center: reference point for the radial direction, defaults to the vertex mean
+
+    Returns:
+    - boolean array (F,), True for inverted/folded faces
+    """
+    if center is None:
+        center = xyz.mean(axis=0)
+    tri = xyz[faces]
+    normals = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    radial = tri.mean(axis=1) - center
+    return np.sum(normals * radial, axis=1) <= 0
+
+
+def candidate_pairs(tri, cell_size=None):
+    """
+    Triangle pairs sharing a cell of a uniform spatial hash grid.
+
+    Parameters:
+    - tri: (F, 3, 3) triangle array
+    - cell_size: grid spacing, defaults to the mean triangle bounding-box extent
+
+    Returns:
+    - (P, 2) array of unique index pairs i < j
+    """
+    lo = tri.min(axis=1)
+    hi = tri.max(axis=1)
+    if cell_size is None:
+        cell_size = np.mean(hi - lo) + 1e-12
+    ilo = np.floor(lo / cell_size).astype(np.int64)
+    span = np.floor(hi / cell_size).astype(np.int64) - ilo + 1
+    count = span.prod(axis=1)
+    # expand every triangle into the cells its bounding box covers
+    tri_id = np.repeat(np.arange(len(tri)), count)
+    local = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    sp = span[tri_id]
+    cells = ilo[tri_id] + np.column_stack((local % sp[:, 0],
+                                           (local // sp[:, 0]) % sp[:, 1],
+                                           local // (sp[:, 0] * sp[:, 1])))
+    # hash the integer cell coordinates into one int64 key
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    key = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(key, kind='stable')
+    key, tri_id = key[order], tri_id[order]
+    # members of a cell are contiguous after sorting: pair entries k apart
+    _, group = np.unique(key, return_counts=True)
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    for k in range(1, group.max()):
+        same = key[:-k] == key[k:]
+        pairs.append(np.column_stack((tri_id[:-k][same], tri_id[k:][same])))
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    # the same pair can share several cells
+    pair_key = np.unique(pairs[:, 0] * len(tri) + pairs[:, 1])
+    return np.column_stack((pair_key // len(tri), pair_key % len(tri)))
+
+
+def _segments_hit_triangles(p0, p1, tri, eps=1e-12):
+    """Moller-Trumbore test of segments p0->p1 against triangles, all (P, ...)"""
+    d = p1 - p0
+    e1 = tri[:, 1] - tri[:, 0]
+    e2 = tri[:, 2] - tri[:, 0]
+    h = np.cross(d, e2)
+    a = np.sum(e1 * h, axis=1)
+    ok = np.abs(a) > eps
+    f = np.where(ok, 1.0 / np.where(ok, a, 1.0), 0.0)
+    s = p0 - tri[:, 0]
+    u = f * np.sum(s * h, axis=1)
+    q = np.cross(s, e1)
+    v = f * np.sum(d * q, axis=1)
+    t = f * np.sum(e2 * q, axis=1)
+    return ok & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= 1)
+
+
+def self_intersections(xyz, faces, cell_size=None):
+    """
+    Pairs of non-adjacent triangles that intersect each other.
+
+    Parameters:
+    - xyz: (V, 3) surface points
+    - faces: (F, 3) face indices
+    - cell_size: spatial hash grid spacing (see candidate_pairs)
+
+    Returns:
+    - (P, 2) array of intersecting face index pairs
+    """
+    tri = xyz[faces]
+    pairs = candidate_pairs(tri, cell_size)
+    if len(pairs) == 0:
+        return pairs
+    # neighbours sharing a vertex always touch: skip them
+    fi, fj = faces[pairs[:, 0]], faces[pairs[:, 1]]
+    pairs = pairs[~(fi[:, :, None] == fj[:, None, :]).any(axis=(1, 2))]
+    # bounding-box overlap
+    lo, hi = tri.min(axis=1), tri.max(axis=1)
+    i, j = pairs[:, 0], pairs[:, 1]
+    pairs = pairs[np.all((lo[i] <= hi[j]) & (lo[j] <= hi[i]), axis=1)]
+    # two triangles cross when an edge of one pierces the other
+    i, j = pairs[:, 0], pairs[:, 1]
+    hit = np.zeros(len(pairs), dtype=bool)
+    for a, b in ((i, j), (j, i)):
+        for k in range(3):
+            hit |= _segments_hit_triangles(tri[a, k], tri[a, (k + 1) % 3], tri[b])
+    return pairs[hit]
+
+
+def _cross2(a, b):
+    """z component of the cross product of 2D vectors (..., 2)"""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def grid_winding_numbers(xyz, faces, resolution=16, chunk=2 ** 22):
+    """
+    Winding numbers of a closed mesh on a regular grid over its bounding box.
+
+    Every grid column casts one ray along +z; a point's winding number is the
+    signed count of faces crossed above it (+1 where the outward normal points
+    up), so the whole grid costs one 2D point-in-triangle test per column and face.
+
+    Parameters:
+    - xyz: (V, 3) surface points
+    - faces: (F, 3) face indices
+    - resolution: grid points per axis (cell centres)
+    - chunk: size of the intermediate (columns, faces, resolution) blocks
+
+    Returns:
+    - (resolution, resolution, resolution) integer winding numbers, axes x, y, z
+    """
+    lo, hi = xyz.min(axis=0), xyz.max(axis=0)
+    grid = [lo[k] + (np.arange(resolution) + 0.5) / resolution * (hi[k] - lo[k]) for k in range(3)]
+    columns = np.stack(np.meshgrid(grid[0], grid[1], indexing='ij'), axis=-1).reshape(-1, 2)
+    tri = xyz[faces]
+    # doubled signed area of the projected faces, its sign is that of the normal's z
+    area = _cross2(tri[:, 1, :2] - tri[:, 0, :2], tri[:, 2, :2] - tri[:, 0, :2])
+    sign = np.sign(area)
+    winding = np.zeros((len(columns), resolution))
+    step = max(1, chunk // (len(faces) * resolution))
+    for start in range(0, len(columns), step):
+        q = columns[start:start + step, None, :]
+        # edge functions: barycentric coordinates times the projected area
+        e = [_cross2(tri[None, :, (k + 2) % 3, :2] - tri[None, :, (k + 1) % 3, :2],
+                     q - tri[None, :, (k + 1) % 3, :2]) for k in range(3)]
+        hit = (e[0] * sign > 0) & (e[1] * sign > 0) & (e[2] * sign > 0)
+        z = sum(e[k] * tri[None, :, k, 2] for k in range(3)) / np.where(area == 0, 1.0, area)
+        crossings = np.where(hit, sign, 0.0)
+        winding[start:start + step] = np.einsum('cf,cfz->cz', crossings,
+                                                (z[:, :, None] > grid[2]).astype(float))
+    return np.rint(winding).astype(np.int64).reshape(resolution, resolution, resolution)
+
+
+def folded_volume_fraction(xyz, faces, resolution=16):
+    """
+    Fraction of the enclosed volume whose winding number is not 1.
+
+    Parameters:
+    - xyz: (V, 3) surface points
+    - faces: (F, 3) face indices
+    - resolution: grid points per axis (see grid_winding_numbers)
+
+    Returns:
+    - folded fraction, 0 for a proper closed surface and 1 for an inside-out one
+    """
+    winding = grid_winding_numbers(xyz, faces, resolution)
+    enclosed = winding != 0
+    return float(np.sum(enclosed & (winding != 1)) / max(np.sum(enclosed), 1))
+
+
+def check_validity(xyz, faces, center=None, cell_size=None, max_folded=None, resolution=16):
+    """
+    Combined validity check of a reconstructed particle mesh.
+
+    Parameters:
+    - xyz: (V, 3) surface points
+    - faces: (F, 3) face indices
+    - center: reference point for the radial test, defaults to the vertex mean
+    - cell_size: spatial hash grid spacing (see candidate_pairs)
+    - max_folded: None (default) requires a mesh without self-intersections or folded
+      volume; a fraction tolerates self-intersecting wrinkles and judges the mesh on
+      its folded volume alone (valid while it is at most max_folded)
+    - resolution: grid points per axis of the folded volume estimate
+
+    Returns:
+    - dict with 'valid', 'intersection_free' (no self-intersections, whatever
+      max_folded), 'inverted_faces' (count, diagnostic), 'self_intersections' (count
+      of intersecting face pairs) and 'folded_volume' (see folded_volume_fraction)
+    """
+    folded = folded_volume_fraction(xyz, faces, resolution)
+    crossing = len(self_intersections(xyz, faces, cell_size))
+    if max_folded is None:
+        valid = crossing == 0 and folded == 0.0
+    else:
+        valid = folded <= max_folded
+    return {
+        'valid': bool(valid),
+        'intersection_free': crossing == 0,
+        'inverted_faces': int(np.sum(inverted_faces(xyz, faces, center))),
+        'self_intersections': crossing,
+        'folded_volume': folded
+    }
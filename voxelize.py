@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Voxelization of SH particles and packed assemblies
+
+Grids are built straight from the radial functions (radial.points_inside),
+without STLs. The grid is processed in slabs of `chunk` x-layers: only
+particles whose bounding sphere reaches the slab are evaluated, and only on
+the voxels of their bounding box. The (nx, ny, nz) grid is stored in C order,
+so every slab is one contiguous block; with output='file.npy' it is written to
+a memory-mapped .npy file (numpy.lib.format.open_memmap) in a single
+sequential write, so grids larger than RAM can be produced and later opened
+with np.load(mmap_mode='r').
+
+Modes:
+- 'occupancy': uint8, 1 where the voxel centre lies inside a particle
+- 'label':     int32, index + 1 of the particle at the voxel centre (0 = void)
+- 'fraction':  float32 solid volume fraction from supersample^3 points per voxel
+"""
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from radial import points_inside, radial_bounds
+from packing import quaternion_matrix
+
+
+def voxelize(shapes, placements, voxel_size, origin=None, shape=None, mode='occupancy',
+             supersample=2, chunk=16, output=None):
+    """
+    Voxelize particles placed in space.
+
+    Parameters:
+    - shapes: list of radial coefficient arrays (radial.radial_fit)
+    - placements: dict with 'shape_index' (N,), 'position' (N, 3), 'quaternion' (N, 4)
+      and 'scale' (N,), e.g. the result of packing.rsa_pack
+    - voxel_size: edge length of a voxel (world units)
+    - origin: world coordinates of the grid corner (default: lower corner of all
+      bounding spheres)
+    - shape: grid size (nx, ny, nz) (default: enough to hold all bounding spheres)
+    - mode: 'occupancy', 'label' or 'fraction' (see module docstring)
+    - supersample: points per voxel edge for mode='fraction'
+    - chunk: number of x-layers processed at once
+    - output: path of a .npy file to stream the grid into (default: in memory)
+
+    Returns:
+    - grid: (nx, ny, nz) array (a numpy memmap if output is given)
+    """
+    if mode not in ('occupancy', 'label', 'fraction'):
+        raise ValueError("mode must be 'occupancy', 'label' or 'fraction'")
+    index = np.asarray(placements['shape_index'])
+    positions = np.asarray(placements['position'], dtype=float).reshape(-1, 3)
+    rotations = quaternion_matrix(np.asarray(placements['quaternion'], dtype=float).reshape(-1, 4))
+    scales = np.asarray(placements['scale'], dtype=float).reshape(-1)
+    # bounding radii of the shapes in use only
+    r_max = np.zeros(len(shapes))
+    for s in np.unique(index):
+        r_max[s] = radial_bounds(shapes[s])[1]
+    bound = r_max[index] * scales
+
+    if origin is None:
+        origin = (positions - bound[:, None]).min(axis=0)
+    origin = np.asarray(origin, dtype=float)
+    if shape is None:
+        shape = np.ceil(((positions + bound[:, None]).max(axis=0) - origin) / voxel_size).astype(int)
+    shape = tuple(int(n) for n in shape)
+
+    dtype = {'occupancy': np.uint8, 'label': np.int32, 'fraction': np.float32}[mode]
+    if output is not None:
+        grid = open_memmap(output, mode='w+', dtype=dtype, shape=shape)
+    else:
+        grid = np.zeros(shape, dtype=dtype)
+
+    # sample offsets inside a voxel (in voxels)
+    if mode == 'fraction':
+        t = (np.arange(supersample) + 0.5) / supersample
+    else:
+        t = np.array([0.5])
+    offsets = np.stack(np.meshgrid(t, t, t, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    lo = np.floor((positions - bound[:, None] - origin) / voxel_size).astype(int)
+    hi = np.ceil((positions + bound[:, None] - origin) / voxel_size).astype(int)
+    for x0 in range(0, shape[0], chunk):
+        x1 = min(x0 + chunk, shape[0])
+        slab = np.zeros((x1 - x0,) + shape[1:], dtype=np.float32 if mode == 'fraction' else dtype)
+        for i in np.nonzero((hi[:, 0] > x0) & (lo[:, 0] < x1))[0]:
+            a = np.maximum(lo[i], (x0, 0, 0))
+            b = np.minimum(hi[i], (x1,) + shape[1:])
+            if np.any(b <= a):
+                continue
+            ijk = np.stack(np.meshgrid(*[np.arange(a[k], b[k]) for k in range(3)],
+                                       indexing='ij'), axis=-1).reshape(-1, 1, 3)
+            points = origin + (ijk + offsets) * voxel_size
+            inside = points_inside(shapes[index[i]], points.reshape(-1, 3), positions[i],
+                                   rotations[i], scales[i]).reshape(len(ijk), len(offsets))
+            box = (slice(a[0] - x0, b[0] - x0), slice(a[1], b[1]), slice(a[2], b[2]))
+            sub = slab[box]
+            if mode == 'fraction':
+                sub += inside.mean(axis=1).reshape(sub.shape)
+            elif mode == 'label':
+                sub[inside[:, 0].reshape(sub.shape)] = i + 1
+            else:
+                sub |= inside[:, 0].reshape(sub.shape)
+        if mode == 'fraction':
+            np.minimum(slab, 1.0, out=slab)
+        grid[x0:x1] = slab
+    if output is not None:
+        grid.flush()
+    return grid
+
+
+def voxelize_particle(a, voxel_size, scale=1.0, mode='occupancy', supersample=2,
+                      chunk=16, output=None):
+    """
+    Voxelize a single particle centred in its own grid.
+
+    Parameters:
+    - a: radial coefficients of the particle (radial.radial_fit)
+    - voxel_size, mode, supersample, chunk, output: see voxelize
+    - scale: scale factor from unit-shape to world lengths (e.g. D_eq/2)
+
+    Returns:
+    - grid: (n, n, n) array
+    """
+    placements = {'shape_index': [0], 'position': [[0.0, 0.0, 0.0]],
+                  'quaternion': [[1.0, 0.0, 0.0, 0.0]], 'scale': [scale]}
+    return voxelize([a], placements, voxel_size, mode=mode, supersample=supersample,
+                    chunk=chunk, output=output)